@@ -26,30 +26,16 @@ def get_plugin_name():
             "expected by the aiida-common-workflows project"
         ) from exc
 
-PLUGIN_NAME = get_plugin_name()
-
-if __name__ == "__main__":
-
-    try:
-        SET_NAME = sys.argv[1]
-    except IndexError:
-        print("Pass as parameter the set name, e.g. oxides-verification-PBE-v1 or unaries-verification-PBE-v1")
-        sys.exit(1)
-
-    STRUCTURES_FULL_GROUP_LABEL = f'acwf-verification/{SET_NAME}/structures'
-    STRUCTURES_GROUP_LABEL = f'acwf-verification/{SET_NAME}/structures/{PLUGIN_NAME}'
-
-    group = orm.Group.objects.get(label=STRUCTURES_FULL_GROUP_LABEL)
-    subgroup, _ = orm.Group.objects.get_or_create(label=STRUCTURES_GROUP_LABEL)
-
+def get_valid_elements(plugin_name):
+    """Return the list of the elements that the plugin can run (the plugin-specific part of this script)."""
     #####################################################################################
     ## PLUGIN-SPECIFIC PART: ADD THE ELIF FOR YOUR CODE
-    if PLUGIN_NAME == 'quantum_espresso':
+    if plugin_name == 'quantum_espresso':
         query = orm.QueryBuilder()
         query.append(orm.Node, project="attributes.element", tag='pseudo')
         query.append(orm.Group, filters={'label': 'SSSP/1.1/PBE/precision'}, with_node='pseudo')
         valid_elements = query.all(flat=True)
-    elif PLUGIN_NAME == 'cp2k':
+    elif plugin_name == 'cp2k':
         valid_elements = [
                 'H', 'He',
                 'Li', 'Be', 'B', 'C', 'N', 'O', 'F', 'Ne',
@@ -59,9 +45,9 @@ if __name__ == "__main__":
                 'Cs', 'Ba', 'La', 'Ce', 'Pr', 'Nd', 'Pm', 'Sm', 'Eu', 'Gd', 'Tb', 'Dy', 'Ho', 'Er', 'Tm', 'Yb', 'Lu', 'Hf', 'Ta', 'W', 'Re', 'Os', 'Ir', 'Pt', 'Au', 'Hg', 'Tl', 'Pb', 'Bi', 'Po', 'At', 'Rn',
     #            'Fr',  'Ra', 'Lr', 'Rf', 'Db', 'Sg', 'Bh', 'Hs', 'Mt', 'Ds', 'Rg', 'Cn', 'Nh', 'Fl', 'Mc', 'Lv', 'Ts', 'Og', 'Eu',
                 ]
-    #elif PLUGIN_NAME == 'xxx':
+    #elif plugin_name == 'xxx':
     #    yyy
-    elif PLUGIN_NAME == 'gpaw':
+    elif plugin_name == 'gpaw':
         from ase.data import atomic_numbers
         query = orm.QueryBuilder()
         query.append(orm.Node, project="attributes.element", tag='pseudo')
@@ -70,10 +56,21 @@ if __name__ == "__main__":
         for elements in ['Dy', 'Ce', 'Er', 'Eu', 'Gd', 'Ho', 'La', 'Lu', 'Nd', 'Pm', 'Pr', 'Sm', 'Tb', 'Tc', 'Tm', 'Yb' ]:
             valid_elements.remove(elements)
     else:
-        raise ValueError(f"Unknown plugin name `{PLUGIN_NAME}`!")
+        raise ValueError(f"Unknown plugin name `{plugin_name}`!")
     #####################################################################################
+    return valid_elements
 
-    print(f"Number of valid elements: {len(valid_elements)}")
+
+def create_starting_subgroup(set_name, plugin_name, valid_elements):
+    """
+    Add the structures of the valid elements from the full group of structures of the set
+    to the subgroup of the plugin (created if it does not exist).
+    """
+    STRUCTURES_FULL_GROUP_LABEL = f'acwf-verification/{set_name}/structures'
+    STRUCTURES_GROUP_LABEL = f'acwf-verification/{set_name}/structures/{plugin_name}'
+
+    group = orm.Group.objects.get(label=STRUCTURES_FULL_GROUP_LABEL)
+    subgroup, _ = orm.Group.objects.get_or_create(label=STRUCTURES_GROUP_LABEL)
 
     query = orm.QueryBuilder()
     query.append(orm.Node, tag='structure', project=['*'], filters={
@@ -86,3 +83,17 @@ if __name__ == "__main__":
     print(f"Structures from full group added to group '{STRUCTURES_GROUP_LABEL}'")
     print(f"Current group size: {len(subgroup.nodes)}")
 
+
+if __name__ == "__main__":
+
+    try:
+        SET_NAME = sys.argv[1]
+    except IndexError:
+        print("Pass as parameter the set name, e.g. oxides-verification-PBE-v1 or unaries-verification-PBE-v1")
+        sys.exit(1)
+
+    PLUGIN_NAME = get_plugin_name()
+    valid_elements = get_valid_elements(PLUGIN_NAME)
+    print(f"Number of valid elements: {len(valid_elements)}")
+
+    create_starting_subgroup(SET_NAME, PLUGIN_NAME, valid_elements)
@@ -0,0 +1,212 @@
+# Extraction of the EOS data of the workflows of a set directly from an exported AiiDA archive
+# (e.g. created with `4-export/export_results.sh`), without importing it in a profile.
+#
+# Only the archive format of aiida-core 1.x (export version 0.x, i.e. a zip or tar file with
+# `metadata.json`, `data.json` and the repository folders of the nodes) is supported.
+
+import io
+import json
+import tarfile
+import zipfile
+from collections import defaultdict
+
+import numpy as np
+
+from .raw_data import assemble_raw_data, is_failed_state, is_running_state, is_successful_state
+
+
+class ArchiveReader:
+    """
+    Read-only access to the metadata, links and repository files of an exported AiiDA archive.
+
+    :param path: path of the archive (zip or tar file).
+    """
+
+    def __init__(self, path):
+        self.path = path
+        if zipfile.is_zipfile(path):
+            self._zip = zipfile.ZipFile(path)
+            # Position of each file in the archive, to read them in the order in which they are stored
+            self._offsets = {info.filename: info.header_offset for info in self._zip.infolist()}
+            self._tar = None
+        elif tarfile.is_tarfile(path):
+            self._tar = tarfile.open(path)
+            self._members = {
+                member.name[2:] if member.name.startswith('./') else member.name: member
+                for member in self._tar.getmembers()
+            }
+            self._offsets = {name: member.offset for name, member in self._members.items()}
+            self._zip = None
+        else:
+            raise ValueError(f"'{path}' is not an AiiDA archive (zip or tar file)")
+
+        metadata = json.loads(self.read('metadata.json'))
+        export_version = str(metadata.get('export_version', ''))
+        if not export_version.startswith('0.'):
+            raise ValueError(
+                f"Unsupported export version '{export_version}' of '{path}': only archives created with "
+                "aiida-core 1.x can be read")
+
+        data = json.loads(self.read('data.json'))
+        # Node PK -> node fields (uuid, node_type, mtime, ...), attributes and extras
+        self.nodes = {int(pk): fields for pk, fields in data['export_data'].get('Node', {}).items()}
+        self.attributes = {int(pk): attributes for pk, attributes in data['node_attributes'].items()}
+        self.extras = {int(pk): extras for pk, extras in data['node_extras'].items()}
+        self.pk_of_uuid = {fields['uuid']: pk for pk, fields in self.nodes.items()}
+        self.groups = {
+            group['label']: [self.pk_of_uuid[uuid] for uuid in data['groups_uuid'].get(group['uuid'], [])]
+            for group in data['export_data'].get('Group', {}).values()
+        }
+        # Node PK -> list of (link type, link label, PK of the other node)
+        self.outgoing = defaultdict(list)
+        self.incoming = defaultdict(list)
+        for link in data['links_uuid']:
+            input_pk = self.pk_of_uuid[link['input']]
+            output_pk = self.pk_of_uuid[link['output']]
+            self.outgoing[input_pk].append((link['type'], link['label'], output_pk))
+            self.incoming[output_pk].append((link['type'], link['label'], input_pk))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the archive file."""
+        if self._zip is not None:
+            self._zip.close()
+        else:
+            self._tar.close()
+
+    def read(self, name):
+        """Return the content (as bytes) of the file `name` in the archive."""
+        if self._zip is not None:
+            return self._zip.read(name)
+        return self._tar.extractfile(self._members[name]).read()
+
+    def get_repository_path(self, pk, filename):
+        """Return the path in the archive of the file `filename` in the repository of the node `pk`."""
+        uuid = self.nodes[pk]['uuid']
+        return f'nodes/{uuid[:2]}/{uuid[2:4]}/{uuid[4:]}/path/{filename}'
+
+    def get_returned(self, pk, name, node_type_prefix):
+        """
+        Return a list of (link label, PK) of the nodes returned by the workflow `pk` as output `name`
+        (or in the output namespace `name`, i.e. with link labels `<name>__<key>`), with a node type
+        starting with `node_type_prefix` (e.g. `data.structure.`).
+        """
+        return [
+            (label, output_pk) for link_type, label, output_pk in self.outgoing[pk]
+            if link_type == 'return' and (label == name or label.startswith(f'{name}__'))
+            and self.nodes[output_pk]['node_type'].startswith(node_type_prefix)
+        ]
+
+    def read_stress_arrays(self, array_pks):
+        """
+        Read the `stress` arrays of the given `ArrayData` nodes, in the order in which they are stored in the archive.
+
+        :return: a dictionary PK -> stress array.
+        """
+        paths = {pk: self.get_repository_path(pk, 'stress.npy') for pk in array_pks}
+        return {
+            pk: np.load(io.BytesIO(self.read(path)))
+            for pk, path in sorted(paths.items(), key=lambda item: self._offsets[item[1]])
+        }
+
+
+def get_workflow_records(archive, group_label):
+    """
+    Same as `extraction.get_workflow_records`, for the workflows in a group of an exported archive.
+
+    :param archive: an `ArchiveReader`.
+    """
+    records = []
+    for pk in sorted(archive.groups.get(group_label, [])):
+        if not archive.nodes[pk]['node_type'].startswith('process.workflow.'):
+            continue
+        structure_pks = [
+            input_pk for _, label, input_pk in archive.incoming[pk]
+            if label == 'structure' and archive.nodes[input_pk]['node_type'].startswith('data.structure.')
+        ]
+        for structure_pk in structure_pks:
+            records.append({
+                'pk': pk,
+                'uuid': archive.nodes[pk]['uuid'],
+                'process_state': archive.attributes[pk].get('process_state'),
+                'exit_status': archive.attributes[pk].get('exit_status'),
+                'mtime': archive.nodes[pk]['mtime'],
+                'structure_uuid': archive.nodes[structure_pk]['uuid'],
+                'element': archive.extras[structure_pk].get('element'),
+                'configuration': archive.extras[structure_pk].get('configuration'),
+            })
+    return records
+
+
+def extract_raw_data(archive, records, include_running=False):
+    """
+    Same as `extraction.extract_raw_data`, reading the outputs of the workflows from an exported archive.
+
+    :param archive: an `ArchiveReader`.
+    """
+    successful_pks = [
+        record['pk'] for record in records if is_successful_state(record['process_state'], record['exit_status'])
+    ]
+    failed_pks = [
+        record['pk'] for record in records if is_failed_state(record['process_state'], record['exit_status'])
+    ]
+    running_pks = [
+        record['pk'] for record in records if include_running and is_running_state(record['process_state'])
+    ]
+
+    def get_structure(pk):
+        return {'cell': archive.attributes[pk]['cell'], 'sites': archive.attributes[pk]['sites']}
+
+    def get_energy(pk):
+        return {'uuid': archive.nodes[pk]['uuid'], 'value': archive.attributes[pk]['value']}
+
+    outputs = {
+        'relax_children': {},
+        'structures': {},
+        'energies': {},
+        'relax_energies': {},
+        'relax_stresses': {},
+        'relaxed_structures': {},
+    }
+    for pk in successful_pks + failed_pks + running_pks:
+        outputs['relax_children'][pk] = [
+            (relax_pk, is_successful_state(
+                archive.attributes[relax_pk].get('process_state'), archive.attributes[relax_pk].get('exit_status')))
+            for link_type, _, relax_pk in archive.outgoing[pk] if link_type == 'call_work'
+        ]
+        for relax_pk, _ in outputs['relax_children'][pk]:
+            for _, energy_pk in archive.get_returned(relax_pk, 'total_energy', 'data.float.'):
+                outputs['relax_energies'][relax_pk] = get_energy(energy_pk)
+            for _, stress_pk in archive.get_returned(relax_pk, 'stress', 'data.array.'):
+                outputs['relax_stresses'][relax_pk] = stress_pk
+            for _, structure_pk in archive.get_returned(relax_pk, 'relaxed_structure', 'data.structure.'):
+                outputs['relaxed_structures'][relax_pk] = get_structure(structure_pk)
+    for pk in successful_pks:
+        outputs['structures'][pk] = {
+            label[len('structures__'):]: get_structure(structure_pk)
+            for label, structure_pk in archive.get_returned(pk, 'structures', 'data.structure.')
+        }
+        outputs['energies'][pk] = {
+            label[len('total_energies__'):]: get_energy(energy_pk)
+            for label, energy_pk in archive.get_returned(pk, 'total_energies', 'data.float.')
+        }
+
+    return assemble_raw_data(
+        successful_pks, failed_pks, outputs, archive.read_stress_arrays, running_pks=running_pks)
+
+
+def read_archive(path, group_label, include_running=False):
+    """
+    Read the EOS data of all workflows in the group `group_label` of the archive at `path`.
+
+    :return: a tuple `(records, raw_data)`, in the same format as `extraction.get_workflow_records`
+        and `extraction.extract_raw_data`.
+    """
+    with ArchiveReader(path) as archive:
+        records = get_workflow_records(archive, group_label)
+        return records, extract_raw_data(archive, records, include_running=include_running)
@@ -0,0 +1,319 @@
+# Registry of equation-of-state forms, each with a batched fitter.
+#
+# All fitters have the same interface as `BM_batch` in `eosfit_31_adapted`:
+# they take arrays `volumes` and `energies` of shape (N, k) and an optional
+# boolean `mask` (False for padding entries), and return the arrays
+# (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0, failed), each of shape (N,),
+# with NaN in all quantities where `failed` is True.
+#
+# Forms that are linear in their coefficients (Birch-Murnaghan of 3rd and 4th
+# order, Poirier-Tarantola) are solved with one stacked pseudo-inverse of the
+# design matrices; the other ones (Vinet, Murnaghan) with a batched
+# Levenberg-Marquardt (damped Gauss-Newton) iteration started from the
+# Birch-Murnaghan fit.
+
+import numpy as np
+
+from .eosfit_31_adapted import BM_batch
+
+# Maximum number of Levenberg-Marquardt iterations for the non-linear forms
+MAX_ITERATIONS = 100
+# Relative change of the sum of squared residuals (or of all parameters) below which
+# a non-linear fit is considered converged
+CONVERGENCE_THRESHOLD = 1.e-9
+
+
+def _prepare(volumes, energies, mask):
+    """
+    Convert the inputs to arrays and compute the per-row quantities common to all fitters:
+    the mask as float weights, the number of points and the mean of the energies.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    if mask is None:
+        mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+    weights = mask.astype(float)
+    num_points = mask.sum(axis=1)
+    e_mean = (energies * weights).sum(axis=1) / np.maximum(num_points, 1)
+    # Padding volumes are replaced by 1 to avoid e.g. 0**(-2/3)
+    volumes = np.where(mask, volumes, 1.)
+    return volumes, energies, mask, weights, num_points, e_mean
+
+
+def _fit_polynomial(volumes, energies, mask, transform, degree):
+    """
+    Fit E as a polynomial of degree `degree` in the variable x = transform['x'](V).
+
+    As in `BM_batch`, each row is fitted in the rescaled variable t = (x - x_c) / x_s, and
+    the energies are shifted by their average. The minimum is the real root of the derivative
+    (computed from the eigenvalues of the stacked companion matrices) with positive curvature,
+    closest to the centre of the data.
+
+    `transform` is a dictionary with the functions `x(V)`, its inverse `V(x)` and the first
+    and second derivatives `dx(V)`, `d2x(V)`, needed to get B0 and B1 at the minimum, where dE/dx = 0:
+    B0 = V E_xx x'**2 and B1 = -1 - V (E_xxx x' / E_xx + 3 x'' / x').
+    """
+    volumes, energies, mask, weights, num_points, e_mean = _prepare(volumes, energies, mask)
+
+    x = transform['x'](volumes)
+    x_center = (x * weights).sum(axis=1) / np.maximum(num_points, 1)
+    x_scale = np.where(mask, np.abs(x - x_center[:, None]), 0.).max(axis=1)
+    degenerate = (num_points < degree + 1) | (x_scale == 0.)
+    x_scale = np.where(degenerate, 1., x_scale)
+    t = (x - x_center[:, None]) / x_scale[:, None]
+    shifted_energies = (energies - e_mean[:, None]) * weights
+
+    powers = np.arange(degree + 1)
+    design = t[:, :, None] ** powers * weights[:, :, None]
+    coeffs = np.einsum('nik,nk->ni', np.linalg.pinv(design), shifted_energies)
+
+    fitted = (design * coeffs[:, None, :]).sum(axis=2)
+    ssr = ((shifted_energies - fitted)**2).sum(axis=1)
+    sst = (shifted_energies**2).sum(axis=1)
+
+    # Coefficients of the derivatives (in t), from the constant term upwards
+    deriv1 = coeffs[:, 1:] * powers[1:]
+    deriv2 = deriv1[:, 1:] * powers[1:-1]
+    deriv3 = deriv2[:, 1:] * powers[1:-2]
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Companion matrices of the (monic) first derivative: its eigenvalues are the stationary points
+        num_roots = degree - 1
+        monic = deriv1[:, :-1] / deriv1[:, -1:]
+        companion = np.zeros((len(coeffs), num_roots, num_roots))
+        companion[:, 1:, :-1] = np.eye(num_roots - 1)
+        companion[:, :, -1] = -monic
+        companion = np.where(np.isfinite(companion), companion, 0.)
+        roots = np.linalg.eigvals(companion)
+
+        root_t = roots.real
+        curvature = (deriv2[:, None, :] * root_t[:, :, None] ** powers[:-2]).sum(axis=2)
+        acceptable = (np.abs(roots.imag) < 1.e-8) & (curvature > 0.)
+        # Among the acceptable minima, pick the one closest to the centre of the data
+        distance = np.where(acceptable, np.abs(root_t), np.inf)
+        best = distance.argmin(axis=1)
+        t0 = root_t[np.arange(len(coeffs)), best]
+        found = acceptable.any(axis=1)
+
+        x0 = x_center + x_scale * t0
+        volume0 = transform['V'](x0)
+        E0 = e_mean + (coeffs * t0[:, None] ** powers).sum(axis=1)
+
+        # Derivatives with respect to x (not t) at the minimum
+        E_xx = (deriv2 * t0[:, None] ** powers[:-2]).sum(axis=1) / x_scale**2
+        E_xxx = (deriv3 * t0[:, None] ** powers[:-3]).sum(axis=1) / x_scale**3
+        dx = transform['dx'](volume0)
+        d2x = transform['d2x'](volume0)
+
+        bulk_modulus0 = volume0 * E_xx * dx**2
+        bulk_deriv0 = -1 - volume0 * (E_xxx * dx / E_xx + 3. * d2x / dx)
+        residuals0 = ssr / sst
+
+        failed = degenerate | ~found
+        for quantity in (volume0, bulk_modulus0, bulk_deriv0):
+            failed |= ~np.isfinite(quantity)
+        failed |= ~(volume0 > 0.) | ~(bulk_modulus0 > 0.)
+
+    results = []
+    for quantity in (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0):
+        results.append(np.where(failed, np.nan, quantity))
+
+    return (*results, failed)
+
+
+# Birch-Murnaghan: polynomial in V**(-2/3)
+BIRCH_TRANSFORM = {
+    'x': lambda V: V**(-2. / 3.),
+    'V': lambda x: x**(-3. / 2.),
+    'dx': lambda V: -2. / 3. * V**(-5. / 3.),
+    'd2x': lambda V: 10. / 9. * V**(-8. / 3.),
+}
+
+# Poirier-Tarantola: polynomial in ln(V)
+LOG_TRANSFORM = {
+    'x': np.log,
+    'V': np.exp,
+    'dx': lambda V: 1. / V,
+    'd2x': lambda V: -1. / V**2,
+}
+
+
+def BM4_batch(volumes, energies, mask=None):
+    """
+    Fit a 4th-order Birch-Murnaghan EOS (quartic polynomial in V**(-2/3)).
+    At least 5 points are needed.
+    """
+    return _fit_polynomial(volumes, energies, mask, BIRCH_TRANSFORM, degree=4)
+
+
+def PT_batch(volumes, energies, mask=None):
+    """
+    Fit a 3rd-order Poirier-Tarantola EOS (cubic polynomial in ln(V)).
+    """
+    return _fit_polynomial(volumes, energies, mask, LOG_TRANSFORM, degree=3)
+
+
+def vinet_shape(V, V0, B0, B01):
+    """
+    Vinet energy as a function of the volume, without the E0 constant.
+    """
+    eta = (V / V0)**(1. / 3.)
+    return (2. * B0 * V0 / (B01 - 1.)**2 *
+        (2. - (5. + 3. * B01 * (eta - 1.) - 3. * eta) * np.exp(-3. * (B01 - 1.) * (eta - 1.) / 2.)))
+
+
+def murnaghan_shape(V, V0, B0, B01):
+    """
+    Murnaghan energy as a function of the volume, without the E0 constant.
+    """
+    return B0 * V / B01 * ((V0 / V)**B01 / (B01 - 1.) + 1.) - B0 * V0 / (B01 - 1.)
+
+
+def _fit_nonlinear(volumes, energies, mask, shape_function, initial=None):
+    """
+    Fit E(V) = E0 + shape_function(V, V0, B0, B01) with a batched Levenberg-Marquardt iteration.
+
+    E0 enters linearly (its Jacobian column is 1), the Jacobian with respect to the other
+    parameters is computed with central finite differences. All rows are updated at once
+    by solving the stacked (4, 4) damped normal equations; the iteration stops when all rows
+    converged, or after `MAX_ITERATIONS` iterations.
+
+    :param initial: optional output of `BM_batch` on the same data, used as starting point
+        (it is computed if not given).
+    """
+    if initial is None:
+        initial = BM_batch(volumes, energies, mask)
+    volumes, energies, mask, weights, num_points, e_mean = _prepare(volumes, energies, mask)
+    shifted_energies = (energies - e_mean[:, None]) * weights
+    sst = (shifted_energies**2).sum(axis=1)
+
+    init_V0, init_E0, init_B0, init_B01, _, init_failed = initial
+    # Parameters: E0 (shifted by the mean energy), V0, B0, B01
+    params = np.stack([init_E0 - e_mean, init_V0, init_B0, init_B01], axis=1)
+    failed = np.array(init_failed, dtype=bool) | (num_points < 4)
+    # Any valid starting point for the rows where the BM fit failed; they are discarded at the end
+    params[failed] = [0., 1., 1., 4.]
+
+    def get_residuals(params, rows):
+        with np.errstate(all='ignore'):
+            model = params[:, 0:1] + shape_function(
+                volumes[rows], params[:, 1:2], params[:, 2:3], params[:, 3:4])
+        return (model - shifted_energies[rows]) * weights[rows]
+
+    all_rows = np.arange(len(params))
+    residuals = get_residuals(params, all_rows)
+    with np.errstate(all='ignore'):
+        cost = (residuals**2).sum(axis=1)
+    damping = np.full(len(params), 1.e-3)
+    converged = failed.copy()
+
+    for _ in range(MAX_ITERATIONS):
+        # Only the rows that did not converge yet are updated
+        rows = np.flatnonzero(~converged)
+        if not len(rows):
+            break
+        row_params = params[rows]
+        row_residuals = residuals[rows]
+
+        jacobian = np.empty(row_residuals.shape + (4,))
+        jacobian[:, :, 0] = weights[rows]
+        for idx in range(1, 4):
+            step = 1.e-6 * np.abs(row_params[:, idx]) + 1.e-12
+            plus = row_params.copy()
+            plus[:, idx] += step
+            minus = row_params.copy()
+            minus[:, idx] -= step
+            jacobian[:, :, idx] = (get_residuals(plus, rows) - get_residuals(minus, rows)) / (2. * step[:, None])
+        jacobian = np.where(np.isfinite(jacobian), jacobian, 0.)
+
+        normal_matrix = np.einsum('nki,nkj->nij', jacobian, jacobian)
+        gradient = np.einsum('nki,nk->ni', jacobian, row_residuals)
+        diagonal = np.einsum('nii->ni', normal_matrix)
+        damped = normal_matrix + damping[rows, None, None] * np.einsum('ni,ij->nij', diagonal, np.eye(4))
+        delta = -np.einsum('nij,nj->ni', np.linalg.pinv(damped), gradient)
+
+        new_params = row_params + delta
+        new_residuals = get_residuals(new_params, rows)
+        with np.errstate(all='ignore'):
+            new_cost = (new_residuals**2).sum(axis=1)
+        accept = (new_cost <= cost[rows]) & np.isfinite(new_cost)
+
+        # Converged if neither the cost nor the parameters change any more
+        small_change = (
+            (cost[rows] - new_cost <= CONVERGENCE_THRESHOLD * cost[rows]) |
+            (np.abs(delta) <= CONVERGENCE_THRESHOLD * np.abs(row_params)).all(axis=1)
+        )
+        converged[rows] = accept & small_change
+        # Rows whose damping exploded cannot improve any more
+        converged[rows] |= damping[rows] > 1.e12
+
+        params[rows] = np.where(accept[:, None], new_params, row_params)
+        residuals[rows] = np.where(accept[:, None], new_residuals, row_residuals)
+        cost[rows] = np.where(accept, new_cost, cost[rows])
+        damping[rows] = np.where(accept, damping[rows] / 10., damping[rows] * 10.)
+
+    E0 = params[:, 0] + e_mean
+    volume0, bulk_modulus0, bulk_deriv0 = params[:, 1], params[:, 2], params[:, 3]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals0 = cost / sst
+    failed |= ~(volume0 > 0.) | ~(bulk_modulus0 > 0.) | ~np.isfinite(params).all(axis=1)
+
+    results = []
+    for quantity in (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0):
+        results.append(np.where(failed, np.nan, quantity))
+
+    return (*results, failed)
+
+
+def vinet_batch(volumes, energies, mask=None, initial=None):
+    """
+    Fit a Vinet EOS. See `_fit_nonlinear` for the meaning of `initial`.
+    """
+    return _fit_nonlinear(volumes, energies, mask, vinet_shape, initial=initial)
+
+
+def murnaghan_batch(volumes, energies, mask=None, initial=None):
+    """
+    Fit a Murnaghan EOS. See `_fit_nonlinear` for the meaning of `initial`.
+    """
+    return _fit_nonlinear(volumes, energies, mask, murnaghan_shape, initial=initial)
+
+
+# Registry of the available EOS forms. The keys are used as prefixes of the
+# `<form>_fit_data` entries in the results JSON files ('BM' gives the usual `BM_fit_data`).
+EOS_FORMS = {
+    'BM': BM_batch,
+    'BM4': BM4_batch,
+    'PT': PT_batch,
+    'vinet': vinet_batch,
+    'murnaghan': murnaghan_batch,
+}
+# Forms whose batched fitter accepts the Birch-Murnaghan fit as starting point
+NONLINEAR_EOS_FORMS = ['vinet', 'murnaghan']
+
+
+def fit_eos_forms(volumes, energies, mask=None, forms=('BM',)):
+    """
+    Fit the same (stacked) E(V) data with all the requested EOS forms.
+
+    The Birch-Murnaghan fit is computed only once, and reused as starting point of
+    the non-linear forms.
+
+    :return: a dictionary form -> output of the corresponding fitter.
+    """
+    for form in forms:
+        if form not in EOS_FORMS:
+            raise ValueError(f"Unknown EOS form '{form}', valid ones are: {', '.join(EOS_FORMS)}")
+
+    bm_results = BM_batch(volumes, energies, mask)
+    results = {}
+    for form in forms:
+        if form == 'BM':
+            results[form] = bm_results
+        elif form in NONLINEAR_EOS_FORMS:
+            results[form] = EOS_FORMS[form](volumes, energies, mask, initial=bm_results)
+        else:
+            results[form] = EOS_FORMS[form](volumes, energies, mask)
+    return results
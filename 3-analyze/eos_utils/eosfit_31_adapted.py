@@ -59,31 +59,405 @@ def BM(energies):
 
     return volume0, E0, bulk_modulus0, bulk_deriv0, residuals0
 
-if __name__ == "__main__":
-    from sys import argv
-
-    usage = '''\
-    Use: python eosfit.py filename
-        calculates the Birch-Murnaghan equation of state from a given file, 
-        containing in its columns the volumes in A^3/atom and energies in eV/atom,
-        respectively
-        output is printed in filename.eosout
-    --help gives an overview of all options
-    '''
-
-    if len(argv) != 2:
-        print('Error: Wrong number of arguments')
-        exit()
+def BM_batch(volumes, energies, mask=None):
+    """
+    Vectorized version of `BM` that fits N E(V) curves at once.
+
+    `volumes` and `energies` are arrays of shape (N, k); `mask` is an optional
+    boolean array of the same shape, False for the padding entries of curves
+    with fewer than k points.
+
+    All N cubic least-squares problems in x = V**(-2/3) are solved with a single
+    stacked pseudo-inverse of the (masked) Vandermonde matrices. To keep them well
+    conditioned, each row is fitted in the shifted and rescaled variable
+    t = (x - x_c) / x_s, with t in [-1, 1]. The minimum of the fitted cubic is then
+    the root of its (quadratic) derivative with a positive second derivative,
+    computed in closed form for all rows.
+
+    Returns arrays (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0, failed),
+    each of shape (N,). Instead of raising a ValueError, rows where no minimum
+    could be found (or with less than 4 points) have `failed` set to True and NaN
+    in all other arrays.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    if mask is None:
+        mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+    num_points = mask.sum(axis=1)
+    weights = mask.astype(float)
+
+    # Padding volumes are replaced by 1 to avoid e.g. 0**(-2/3)
+    x = np.where(mask, volumes, 1.) ** (-2. / 3.)
+    x_center = (x * weights).sum(axis=1) / np.maximum(num_points, 1)
+    x_scale = np.where(mask, np.abs(x - x_center[:, None]), 0.).max(axis=1)
+    degenerate = (num_points < 4) | (x_scale == 0.)
+    x_scale = np.where(degenerate, 1., x_scale)
+    t = (x - x_center[:, None]) / x_scale[:, None]
+
+    # Energies are shifted by their average (typically large compared to their variation)
+    e_mean = (energies * weights).sum(axis=1) / np.maximum(num_points, 1)
+    shifted_energies = (energies - e_mean[:, None]) * weights
+
+    # Stacked Vandermonde matrices (N, k, 4), columns t**0..t**3, padding rows zeroed
+    vander = t[:, :, None] ** np.arange(4) * weights[:, :, None]
+    coeffs = np.einsum('nik,nk->ni', np.linalg.pinv(vander), shifted_energies)
+
+    fitted = (vander * coeffs[:, None, :]).sum(axis=2)
+    ssr = ((shifted_energies - fitted)**2).sum(axis=1)
+    sst = (shifted_energies**2).sum(axis=1)
+
+    failed = degenerate | ~np.isfinite(coeffs).all(axis=1)
+    volume0, E0, bulk_modulus0, bulk_deriv0, failed = _BM_minimum(coeffs, x_center, x_scale, e_mean, failed)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals0 = ssr / sst
+
+    results = []
+    for quantity in (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0):
+        results.append(np.where(failed, np.nan, quantity))
+
+    return (*results, failed)
+
+def _BM_minimum(coeffs, x_center, x_scale, e_mean, failed):
+    """
+    Find the minimum of the cubics e_mean + sum_j coeffs[:, j] * t**j, with t = (x - x_center) / x_scale
+    and x = V**(-2/3), and compute volume0, E0, bulk_modulus0 and bulk_deriv0 there.
+
+    Returns these four arrays and the updated `failed` array (True also where no minimum was found).
+    """
+    c0, c1, c2, c3 = coeffs.T
+
+    # Roots of a t**2 + b t + c (derivative of the cubic), choosing the one where the
+    # second derivative 2 a t + b = +sqrt(discr) is positive. Use the numerically
+    # stable formula, that also covers the a == 0 case
+    a = 3. * c3
+    b = 2. * c2
+    c = c1
+    discr = b**2 - 4. * a * c
+    sqrt_discr = np.sqrt(np.where(discr > 0., discr, 0.))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t0 = np.where(b >= 0., 2. * c / (-b - sqrt_discr), (-b + sqrt_discr) / (2. * a))
+        x0 = x_center + x_scale * t0
+
+        # Derivatives with respect to x (not t) at the minimum
+        deriv2 = (6. * c3 * t0 + 2. * c2) / x_scale**2
+        deriv3 = 6. * c3 / x_scale**3
+
+        failed = failed | ~(discr > 0.) | ~(x0 > 0.) | ~np.isfinite(t0)
+
+        volume0 = x0**(-3./2.)
+        E0 = e_mean + c0 + c1 * t0 + c2 * t0**2 + c3 * t0**3
+
+        derivV2 = 4./9. * x0**5. * deriv2
+        derivV3 = (-20./9. * x0**(13./2.) * deriv2 -
+            8./27. * x0**(15./2.) * deriv3)
+        bulk_modulus0 = derivV2 / x0**(3./2.)
+        bulk_deriv0 = -1 - x0**(-3./2.) * derivV3 / derivV2
+
+    return volume0, E0, bulk_modulus0, bulk_deriv0, failed
+
+def stack_eos_data(all_eos_data):
+    """
+    Pad a list of E(V) datasets (each a list of [volume, energy] pairs, possibly
+    of different lengths) into the (volumes, energies, mask) arrays expected by `BM_batch`.
+    """
+    max_points = max((len(eos_data) for eos_data in all_eos_data), default=0)
+    volumes = np.ones((len(all_eos_data), max_points))
+    energies = np.zeros((len(all_eos_data), max_points))
+    mask = np.zeros((len(all_eos_data), max_points), dtype=bool)
+    for row, eos_data in enumerate(all_eos_data):
+        if len(eos_data):
+            eos_data = np.asarray(eos_data, dtype=float)
+            volumes[row, :len(eos_data)] = eos_data[:, 0]
+            energies[row, :len(eos_data)] = eos_data[:, 1]
+            mask[row, :len(eos_data)] = True
+    return volumes, energies, mask
+
+def BM_uncertainty(volumes, energies, mask=None, num_bootstrap=200, seed=None):
+    """
+    Estimate the standard errors of V0, B0 and B1 of the Birch-Murnaghan fit, both
+    with all leave-one-out refits (jackknife) and with `num_bootstrap` bootstrap
+    resamples (drawn with replacement) of the E(V) points of each curve.
+
+    Inputs are as for `BM_batch`. All resampled curves of all systems are fitted
+    with a single `BM_batch` call, the resamples being encoded in the mask (leave-one-out)
+    or gathered from the original points (bootstrap).
+
+    Returns arrays (loo_errors, bootstrap_errors, bootstrap_failed): the first two have
+    shape (N, 3), with the standard errors of (volume0, bulk_modulus0, bulk_deriv0), NaN if
+    less than two refits succeeded; the last one, of shape (N,), counts the bootstrap
+    resamples where the fit failed (e.g. with less than 4 distinct volumes).
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    if mask is None:
+        mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+    num_curves, max_points = volumes.shape
+    num_points = mask.sum(axis=1)
+
+    # Leave-one-out: curve n with point i removed is row n * max_points + i
+    loo_mask = (mask[:, None, :] & ~np.eye(max_points, dtype=bool)).reshape(-1, max_points)
+    loo_results = BM_batch(
+        np.repeat(volumes, max_points, axis=0), np.repeat(energies, max_points, axis=0), loo_mask)
+    # Removing a padding entry does not give a leave-one-out refit
+    loo_valid = ~loo_results[5].reshape(num_curves, max_points) & mask
+    loo_params = np.stack([loo_results[idx] for idx in (0, 2, 3)], axis=-1).reshape(num_curves, max_points, 3)
+
+    # Bootstrap: draw point indices among the valid points of each curve (moved first by the argsort)
+    rng = np.random.default_rng(seed)
+    valid_first = np.argsort(~mask, axis=1, kind='stable')
+    draws = (rng.random((num_curves, num_bootstrap, max_points)) * num_points[:, None, None]).astype(int)
+    indices = np.take_along_axis(valid_first[:, None, :], draws, axis=2)
+    # Resampled curves keep the number of points of the original one
+    boot_mask = np.broadcast_to(num_points[:, None, None] > np.arange(max_points), indices.shape)
+    boot_volumes = np.take_along_axis(volumes[:, None, :], indices, axis=2)
+    boot_energies = np.take_along_axis(energies[:, None, :], indices, axis=2)
+    # The cubic is undetermined with less than 4 distinct volumes
+    sorted_indices = np.sort(np.where(boot_mask, indices, -1), axis=2)
+    num_distinct = (np.diff(sorted_indices, axis=2) != 0).sum(axis=2) + 1 - (~boot_mask).any(axis=2)
+    boot_results = BM_batch(
+        boot_volumes.reshape(-1, max_points), boot_energies.reshape(-1, max_points),
+        boot_mask.reshape(-1, max_points))
+    boot_valid = ~boot_results[5].reshape(num_curves, num_bootstrap) & (num_distinct >= 4)
+    boot_params = np.stack([boot_results[idx] for idx in (0, 2, 3)], axis=-1).reshape(num_curves, num_bootstrap, 3)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Jackknife standard error: sqrt((n - 1) / n * sum_i (theta_i - mean(theta))**2)
+        num_loo = loo_valid.sum(axis=1)
+        loo_mean = np.where(loo_valid[:, :, None], loo_params, 0.).sum(axis=1) / num_loo[:, None]
+        loo_sq_dev = np.where(loo_valid[:, :, None], (loo_params - loo_mean[:, None, :])**2, 0.).sum(axis=1)
+        loo_errors = np.sqrt((num_loo[:, None] - 1) / num_loo[:, None] * loo_sq_dev)
+        loo_errors[num_loo < 2] = np.nan
+
+        # Bootstrap standard error: standard deviation of the successful refits
+        num_boot = boot_valid.sum(axis=1)
+        boot_mean = np.where(boot_valid[:, :, None], boot_params, 0.).sum(axis=1) / num_boot[:, None]
+        boot_sq_dev = np.where(boot_valid[:, :, None], (boot_params - boot_mean[:, None, :])**2, 0.).sum(axis=1)
+        bootstrap_errors = np.sqrt(boot_sq_dev / (num_boot[:, None] - 1))
+        bootstrap_errors[num_boot < 2] = np.nan
+
+    return loo_errors, bootstrap_errors, num_bootstrap - num_boot
+
+def stack_stress_data(all_stress_data, max_points=None):
+    """
+    Convert a list of `stress_data` entries of the results files (each a list of
+    [volume, stress tensor or None] pairs, in the same order as the `eos_data`) into
+    padded (pressures, pressure_mask) arrays, aligned with the output of `stack_eos_data`.
+
+    The returned value is the hydrostatic component of the stress, tr(stress) / 3, in the
+    same units as the stress (eV/ang^3). The codes do not all use the same sign convention
+    for the stresses (e.g. it is positive under compression for Quantum ESPRESSO and VASP,
+    negative for ABINIT, CASTEP and SIESTA), nor the same units, so this is P = -dE/dV only up
+    to a factor: use `stress_factor_batch` to convert it. The mask is False where the stress is missing.
+    """
+    if max_points is None:
+        max_points = max((len(stress_data) for stress_data in all_stress_data), default=0)
+    pressures = np.zeros((len(all_stress_data), max_points))
+    pressure_mask = np.zeros((len(all_stress_data), max_points), dtype=bool)
+    for row, stress_data in enumerate(all_stress_data):
+        for idx, (_, stress) in enumerate(stress_data or []):
+            if stress is not None:
+                pressures[row, idx] = np.trace(np.asarray(stress, dtype=float)) / 3.
+                pressure_mask[row, idx] = True
+    return pressures, pressure_mask
+
+def stress_factor_batch(volumes, pressures, volume0, bulk_modulus0, bulk_deriv0, pressure_mask=None,
+                        min_agreement=0.5):
+    """
+    Find, for each of N curves, the factor that turns the output of `stack_stress_data` into
+    P = -dE/dV in eV/ang^3: the codes do not all store the stresses with the same sign convention,
+    nor in the same units (e.g. ABINIT stores them in GPa).
+
+    The pressures are compared with those of the Birch-Murnaghan fit of the energies (`volume0`,
+    `bulk_modulus0` and `bulk_deriv0` as returned by `BM_batch`, in eV and ang^3):
+
+    - the sign is that of their agreement a = sum(p P_E) / sqrt(sum(p**2) sum(P_E**2)), computed over
+      the points with a pressure, that is close to +1 (or -1) when the stresses follow the same (or
+      the opposite) convention as P = -dE/dV;
+    - the unit (eV/ang^3 or GPa) is the one closest, on a logarithmic scale, to the least-squares
+      ratio sum(p P_E) / sum(P_E**2) (the two units differ by a factor ~160, so they cannot be mixed up).
+
+    Returns a float array of shape (N,) with the factors (+-1 or +-1/160.2...), and 0 where the
+    conversion is ambiguous: |a| < `min_agreement` (e.g. stresses that are not converged), fewer
+    than 2 pressures, or a failed energy fit. With the default 0.5, all the unaries of the Quantum
+    ESPRESSO, VASP, ABINIT, CASTEP and SIESTA results files get a factor, and mostly the
+    under-converged stresses of recPOTs-defaultENCUTs are flagged.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    pressures = np.asarray(pressures, dtype=float)
+    if pressure_mask is None:
+        pressure_mask = np.ones(volumes.shape, dtype=bool)
     else:
-        if argv[1] == '--help':
-            print(usage)
-            exit()
-    infile = argv[1]
+        pressure_mask = np.asarray(pressure_mask, dtype=bool)
+    # eV/ang^3 and GPa
+    units = np.array([1., 1.0e9 / (echarge * 1.0e30)])
 
-    data = np.loadtxt(infile)
-    volume, bulk_modulus, bulk_deriv, residuals = BM(data)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Birch-Murnaghan P(V) = 3/2 B0 (eta**(7/2) - eta**(5/2)) (1 + 3/4 (B1 - 4) (eta - 1)), eta = (V0/V)**(2/3)
+        eta = (volume0[:, None] / np.where(pressure_mask, volumes, 1.)) ** (2. / 3.)
+        energy_pressures = 1.5 * bulk_modulus0[:, None] * (eta**3.5 - eta**2.5) * (
+            1. + 0.75 * (bulk_deriv0[:, None] - 4.) * (eta - 1.))
+        energy_pressures = np.where(pressure_mask, energy_pressures, 0.)
+        pressures = np.where(pressure_mask, pressures, 0.)
+        overlap = (pressures * energy_pressures).sum(axis=1)
+        agreement = overlap / np.sqrt((pressures**2).sum(axis=1) * (energy_pressures**2).sum(axis=1))
+        ratio = np.abs(overlap / (energy_pressures**2).sum(axis=1))
+        # 1 / (value of 1 eV/ang^3 in the unit of the stresses)
+        unit_factor = units[np.argmin(np.abs(np.log(ratio[:, None] * units)), axis=1)]
 
-    outstr = '''\
+    ambiguous = ~(np.abs(agreement) >= min_agreement) | (pressure_mask.sum(axis=1) < 2) | ~np.isfinite(ratio)
+    return np.where(ambiguous, 0., np.sign(np.nan_to_num(agreement)) * unit_factor)
+
+def BM_joint_batch(volumes, energies, pressures, mask=None, pressure_mask=None,
+                   energy_sigma=1.e-4, pressure_sigma=1.e-4):
+    """
+    Fit N Birch-Murnaghan curves at once to both the energies and the pressures P = -dE/dV.
+
+    Since E is a cubic in x = V**(-2/3), also P = -dE/dx dx/dV is linear in the coefficients
+    of the cubic: each row is solved as a single weighted linear least-squares problem with
+    the energy equations (weighted by 1 / `energy_sigma`, in eV) stacked on top of the
+    pressure equations (weighted by 1 / `pressure_sigma`, in eV/ang^3), with one stacked
+    pseudo-inverse as in `BM_batch`. The default sigmas are an estimate of the numerical noise of
+    the data, not derived from it: 0.1 meV for the total energies, and 1e-4 eV/ang^3 (~0.016 GPa)
+    for the pressures; only their ratio changes the fit.
+
+    `volumes`, `energies` and `pressures` are arrays of shape (N, k); `mask` and
+    `pressure_mask` are False where the energy or the pressure (respectively) is missing
+    (e.g. as returned by `stack_eos_data` and `stack_stress_data`, the latter multiplied
+    by the factors of `stress_factor_batch`).
+
+    Returns arrays (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0, failed) as `BM_batch`,
+    where residuals0 is 1-R^2 of the energies only. At least one energy and four equations
+    in total are needed.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    pressures = np.asarray(pressures, dtype=float)
+    if mask is None:
+        mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+    if pressure_mask is None:
+        pressure_mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        pressure_mask = np.asarray(pressure_mask, dtype=bool)
+    any_mask = mask | pressure_mask
+    num_points = mask.sum(axis=1)
+    num_equations = num_points + pressure_mask.sum(axis=1)
+    energy_weights = mask.astype(float) / energy_sigma
+    pressure_weights = pressure_mask.astype(float) / pressure_sigma
+
+    volumes = np.where(any_mask, volumes, 1.)
+    x = volumes ** (-2. / 3.)
+    x_center = (x * any_mask).sum(axis=1) / np.maximum(any_mask.sum(axis=1), 1)
+    x_scale = np.where(any_mask, np.abs(x - x_center[:, None]), 0.).max(axis=1)
+    degenerate = (num_points < 1) | (num_equations < 4) | (x_scale == 0.)
+    x_scale = np.where(degenerate, 1., x_scale)
+    t = (x - x_center[:, None]) / x_scale[:, None]
+
+    e_mean = (energies * mask).sum(axis=1) / np.maximum(num_points, 1)
+    shifted_energies = (energies - e_mean[:, None]) * mask
+
+    powers = np.arange(4)
+    vander = t[:, :, None] ** powers
+    # P = -dE/dx dx/dV = sum_j j c_j t**(j-1) / x_s * 2/3 V**(-5/3)
+    dvander = (powers * t[:, :, None] ** np.maximum(powers - 1, 0) / x_scale[:, None, None] *
+        (2. / 3. * volumes**(-5. / 3.))[:, :, None])
+
+    design = np.concatenate([vander * energy_weights[:, :, None], dvander * pressure_weights[:, :, None]], axis=1)
+    rhs = np.concatenate([shifted_energies * energy_weights, pressures * pressure_weights], axis=1)
+    coeffs = np.einsum('nik,nk->ni', np.linalg.pinv(design), rhs)
+
+    fitted = (vander * coeffs[:, None, :]).sum(axis=2) * mask
+    ssr = ((shifted_energies - fitted)**2).sum(axis=1)
+    sst = (shifted_energies**2).sum(axis=1)
+
+    failed = degenerate | ~np.isfinite(coeffs).all(axis=1)
+    volume0, E0, bulk_modulus0, bulk_deriv0, failed = _BM_minimum(coeffs, x_center, x_scale, e_mean, failed)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        residuals0 = ssr / sst
+
+    results = []
+    for quantity in (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0):
+        results.append(np.where(failed, np.nan, quantity))
+
+    return (*results, failed)
+
+def BM_joint_point_reduction(volumes, energies, pressures, mask=None, pressure_mask=None,
+                             volume_tolerance=1.e-4, bulk_modulus_tolerance=1.e-3, **kwargs):
+    """
+    For each curve, find the minimum number of volume points such that a fit on a subset of
+    the points still gives V0 and B0 within the given relative tolerances of the same fit with
+    all points; this is done both for the joint energy and pressure fit (`BM_joint_batch`, extra
+    `kwargs` are passed to it), compared with the joint fit of all points, and, as a baseline,
+    for the fit of the energies only, compared with the energy-only fit of all points.
+
+    For each number of points m, m points evenly spread over the whole volume range are kept
+    (always including the smallest and largest volume); all curves are fitted at once for each m.
+
+    The default tolerances (0.01% on V0, 0.1% on B0) are about half of the median difference
+    between the FLEUR and WIEN2k fits of the results files (0.02% on V0, 0.08-0.2% on B0), i.e. a
+    subset is accepted only if it changes the fit less than the spread of the reference codes.
+
+    Returns two integer arrays (joint_min_points, energy_min_points) of shape (N,) with the
+    minimum number of points (such that all larger subsets are also within tolerance); they are 0
+    where the corresponding fit with all points failed. The number of points that could be dropped is
+    then `mask.sum(axis=1)` minus these values.
+    """
+    volumes = np.asarray(volumes, dtype=float)
+    energies = np.asarray(energies, dtype=float)
+    pressures = np.asarray(pressures, dtype=float)
+    if mask is None:
+        mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        mask = np.asarray(mask, dtype=bool)
+    if pressure_mask is None:
+        pressure_mask = np.ones(volumes.shape, dtype=bool)
+    else:
+        pressure_mask = np.asarray(pressure_mask, dtype=bool)
+    max_points = volumes.shape[1]
+    num_points = mask.sum(axis=1)
+
+    valid_first = np.argsort(~mask, axis=1, kind='stable')
+
+    all_min_points = []
+    # Without pressures, BM_joint_batch fits the energies only
+    for fit_pressure_mask in (pressure_mask, np.zeros_like(pressure_mask)):
+        # Each subset is compared with the same kind of fit of all the points
+        ref_volume0, _, ref_bulk_modulus0, _, _, ref_failed = BM_joint_batch(
+            volumes, energies, pressures, mask, fit_pressure_mask, **kwargs)
+        min_points = np.where(ref_failed, 0, num_points)
+        # Still True for the curves where all subsets with more points were within tolerance
+        still_ok = ~ref_failed
+        for num_subset_points in range(max_points - 1, 1, -1):
+            # Evenly spread positions among the valid points of each curve (that must have more points);
+            # curves with fewer points do not take part, their `min_points` is already set
+            rows = np.flatnonzero(still_ok & (num_points > num_subset_points))
+            if not len(rows):
+                break
+            positions = np.rint(
+                np.linspace(0., 1., num_subset_points) * (num_points[rows, None] - 1)).astype(int)
+            subset = np.zeros((len(rows), max_points), dtype=bool)
+            np.put_along_axis(subset, np.take_along_axis(valid_first[rows], positions, axis=1), True, axis=1)
+            volume0, _, bulk_modulus0, _, _, failed = BM_joint_batch(
+                volumes[rows], energies[rows], pressures[rows],
+                subset & mask[rows], subset & fit_pressure_mask[rows], **kwargs)
+            with np.errstate(invalid='ignore'):
+                within = (~failed &
+                    (np.abs(volume0 / ref_volume0[rows] - 1.) <= volume_tolerance) &
+                    (np.abs(bulk_modulus0 / ref_bulk_modulus0[rows] - 1.) <= bulk_modulus_tolerance))
+            min_points[rows[within]] = num_subset_points
+            still_ok[rows[~within]] = False
+        all_min_points.append(min_points)
+
+    return tuple(all_min_points)
+
+def _eosout_string(volume, bulk_modulus_GPa, bulk_deriv, residuals):
+    """Text of the `.eosout` file of a single fit."""
+    return '''\
     Equation Of State parameters - least squares fit of a Birch Murnaghan curve
 
     %.5f \t %.5f \t %.3f
@@ -93,9 +467,118 @@ if __name__ == "__main__":
 
     1-R^2: %f
 
-    ''' % (volume, (bulk_modulus * echarge * 1.0e21), bulk_deriv, residuals[0])
+    ''' % (volume, bulk_modulus_GPa, bulk_deriv, residuals)
+
+def _collect_files(paths, exclude):
+    """
+    Expand the given paths (files, directories or glob patterns) into a sorted list
+    of files, skipping `.eosout` files and the paths in `exclude`.
+    """
+    import glob
+    import os
+
+    files = set()
+    for path in paths:
+        if os.path.isdir(path):
+            candidates = [os.path.join(path, fname) for fname in os.listdir(path)]
+        else:
+            candidates = glob.glob(path) or [path]
+        for candidate in candidates:
+            if os.path.isfile(candidate) and not candidate.endswith('.eosout'):
+                files.add(os.path.normpath(candidate))
+    exclude = {os.path.abspath(fname) for fname in exclude}
+    return sorted(fname for fname in files if os.path.abspath(fname) not in exclude)
+
+def main(argv=None):
+    """
+    Command-line bulk fitter: fit all given two-column E(V) files (volumes in A^3/atom and
+    energies in eV/atom) with `BM_batch` in a single batched fit, and write a summary
+    `<output>.json` and `<output>.tsv` with V0, B0 (GPa), B1 and 1-R^2 for each file.
+    As the original `eosfit.py`, the fit of each file is also written to `<file>.eosout`
+    (unless `--no-eosout` is given).
 
-    outfile = open(infile+'.eosout', 'w')
-    outfile.write(outstr)
+    Files whose content (SHA-256 hash) did not change since the last run (as stored in the
+    existing JSON summary) are not refitted, unless `--force` is given.
+    """
+    import argparse
+    import hashlib
+    import json
+    import os
 
-    outfile.close()
+    parser = argparse.ArgumentParser(
+        description="Fit Birch-Murnaghan equations of state to files containing in their columns "
+                    "the volumes in A^3/atom and energies in eV/atom, respectively.")
+    parser.add_argument("paths", nargs="+", help="E(V) files, directories (all files inside) or glob patterns")
+    parser.add_argument(
+        "-o", "--output", default="eosfit-summary",
+        help="Prefix of the summary files, `.json` and `.tsv` are appended (default: %(default)s)")
+    parser.add_argument("--force", action="store_true", help="Refit also the files that did not change")
+    parser.add_argument(
+        "--no-eosout", dest="eosout", action="store_false",
+        help="Do not write the fit of each file to `<file>.eosout` (written by default, as in eosfit.py)")
+    args = parser.parse_args(argv)
+
+    json_fname = f'{args.output}.json'
+    tsv_fname = f'{args.output}.tsv'
+
+    previous = {}
+    if os.path.exists(json_fname) and not args.force:
+        with open(json_fname) as fhandle:
+            previous = json.load(fhandle)
+
+    summary = {}
+    to_fit = []
+    num_unchanged = 0
+    for fname in _collect_files(args.paths, exclude=[json_fname, tsv_fname]):
+        with open(fname, 'rb') as fhandle:
+            content_hash = hashlib.sha256(fhandle.read()).hexdigest()
+        if previous.get(fname, {}).get('sha256') == content_hash:
+            summary[fname] = previous[fname]
+            num_unchanged += 1
+            continue
+        try:
+            data = np.loadtxt(fname, ndmin=2)
+            if data.shape[1] != 2:
+                raise ValueError(f'expected 2 columns, found {data.shape[1]}')
+        except ValueError as exc:
+            summary[fname] = {'sha256': content_hash, 'error': f'Unable to read the file: {exc}'}
+            continue
+        to_fit.append((fname, content_hash, data))
+
+    if to_fit:
+        volumes, energies, mask = stack_eos_data([data for _, _, data in to_fit])
+        fit_results = BM_batch(volumes, energies, mask)
+        for (fname, content_hash, _), volume, _, bulk_modulus, bulk_deriv, residuals, failed in zip(to_fit, *fit_results):
+            if failed:
+                summary[fname] = {'sha256': content_hash, 'error': 'No minimum could be found'}
+                continue
+            bulk_modulus_GPa = bulk_modulus * echarge * 1.0e21
+            summary[fname] = {
+                'sha256': content_hash,
+                'V0': float(volume),
+                'B0_GPa': float(bulk_modulus_GPa),
+                'B1': float(bulk_deriv),
+                'one_minus_R2': float(residuals),
+            }
+            if args.eosout:
+                with open(fname + '.eosout', 'w') as outfile:
+                    outfile.write(_eosout_string(volume, bulk_modulus_GPa, bulk_deriv, residuals))
+
+    with open(json_fname, 'w') as fhandle:
+        json.dump(summary, fhandle, indent=2, sort_keys=True)
+    with open(tsv_fname, 'w') as fhandle:
+        fhandle.write('file\tV0[A^3/at]\tB0[GPa]\tB1\t1-R^2\terror\n')
+        for fname, result in sorted(summary.items()):
+            if 'error' in result:
+                fhandle.write(f"{fname}\t\t\t\t\t{result['error']}\n")
+            else:
+                fhandle.write(
+                    f"{fname}\t{result['V0']:.5f}\t{result['B0_GPa']:.5f}\t{result['B1']:.3f}\t"
+                    f"{result['one_minus_R2']:.6g}\t\n")
+
+    num_errors = sum('error' in result for result in summary.values())
+    print(f"{len(summary)} files: {len(to_fit)} fitted, {num_unchanged} unchanged, {num_errors} with errors. "
+          f"Summary written to: '{json_fname}', '{tsv_fname}'.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,305 @@
+# Extraction of the EOS data of the workflows of a set from the AiiDA database.
+#
+# The data of all workflows is fetched with a few bulk projected queries (see `extract_raw_data`).
+# The functions only return plain Python objects, so that the extraction can be split in chunks
+# and run in a pool of worker processes (see `init_worker` and `extract_chunk`).
+
+import io
+import time
+from collections import defaultdict
+
+import numpy as np
+
+from aiida import load_profile, orm
+from aiida.common import LinkType, NotExistentAttributeError
+from aiida_common_workflows.workflows.relax.workchain import CommonRelaxWorkChain
+
+from .raw_data import assemble_raw_data, is_failed_state, is_running_state, is_successful_state
+
+try:
+    # aiida-core 1.x: file repository, with one folder per node
+    from aiida.common.folders import RepositoryFolder
+except ImportError:
+    # aiida-core 2.x: disk object store
+    RepositoryFolder = None
+
+
+def extract_from_failed(node):
+    """
+    For EoS workchain with exit status different than zero (or still running), try to extract info on the completed volumes.
+
+    This can be done only if the calculated volumes have a "relaxed_structure" output.
+    In fact the EoS workchain calles <Code>CommonRelaxWorkChains and they have a common
+    output interface, not an input one!
+    """
+    ens=[]
+    vols=[]
+    stresses=[]
+    num_atoms = None
+    num_attempt_vols = 0
+    for i in node.get_outgoing(link_type=LinkType.CALL_WORK).all():
+        num_attempt_vols = num_attempt_vols + 1
+        if i.node.is_finished_ok:
+            if num_atoms is None:
+                try:
+                    num_atoms = len(i.node.outputs.relaxed_structure.sites)
+                except NotExistentAttributeError:
+                    # there is no output structure, can not retrieve the volume!
+                    break
+            ens.append(i.node.outputs.total_energy.value)
+            vol = i.node.outputs.relaxed_structure.get_cell_volume()
+            vols.append(vol)
+            try:
+                stress = i.node.outputs.stress.get_array('stress').tolist()
+            except AttributeError:
+                stress = None
+            stresses.append(stress)
+
+    return vols,ens,stresses,num_atoms,num_attempt_vols
+
+
+# Maximum number of node PKs in the `in` filter of a single query
+QUERY_CHUNK_SIZE = 500
+
+
+def _chunks(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def get_workflow_records(group_label):
+    """
+    Return, with a single query, a list with one dictionary per EOS workflow in the group (sorted by PK),
+    with the PK, UUID, process state, exit status and modification time (ISO format) of the workflow,
+    and the UUID, element and configuration of its input structure.
+    """
+    return get_workflow_records_by_group([group_label])[group_label]
+
+
+def get_workflow_records_by_group(group_labels):
+    """
+    Same as `get_workflow_records`, for several groups at once (e.g. the workflows groups of several sets
+    and plugins), still with a single query.
+
+    :return: a dictionary group label -> list of records of the workflows in the group (sorted by PK).
+    """
+    query = orm.QueryBuilder()
+    query.append(orm.Group, filters={'label': {'in': list(group_labels)}}, tag='group', project=['label'])
+    query.append(
+        orm.WorkflowNode, with_group='group', tag='workflow',
+        project=['id', 'uuid', 'attributes.process_state', 'attributes.exit_status', 'mtime'])
+    query.append(
+        orm.StructureData, with_outgoing='workflow', edge_filters={'label': 'structure'}, tag='structure',
+        project=['uuid', 'extras.element', 'extras.configuration'])
+    query.order_by({'workflow': {'id': 'asc'}})
+    query.distinct()
+
+    records = {group_label: [] for group_label in group_labels}
+    for group_label, pk, uuid, process_state, exit_status, mtime, structure_uuid, element, configuration in query.iterall():
+        records[group_label].append({
+            'pk': pk,
+            'uuid': uuid,
+            'process_state': process_state,
+            'exit_status': exit_status,
+            'mtime': mtime.isoformat(),
+            'structure_uuid': structure_uuid,
+            'element': element,
+            'configuration': configuration,
+        })
+    return records
+
+
+def _query_returned_outputs(workflow_pks, node_class, label_filter, project):
+    """
+    Yield `(workflow_pk, link_label, projections)` for all the outputs of class `node_class` returned
+    by the given workflows with a link label matching `label_filter`, where `projections` is a
+    dictionary with the projected properties `project` of the output node.
+    """
+    for chunk in _chunks(workflow_pks):
+        query = orm.QueryBuilder()
+        query.append(orm.WorkflowNode, filters={'id': {'in': chunk}}, tag='workflow', project=['id'])
+        query.append(
+            node_class, with_incoming='workflow', tag='output', project=project,
+            edge_filters={'type': LinkType.RETURN.value, 'label': label_filter},
+            edge_tag='link', edge_project=['label'])
+        for row in query.iterdict():
+            yield row['workflow']['id'], row['link']['label'], row['output']
+
+
+def read_stress_arrays(array_pks):
+    """
+    Read the `stress` arrays of the given `ArrayData` nodes in bulk, directly from the repository and in
+    sorted repository order, instead of loading the nodes and opening their files one by one.
+
+    With the file repository of aiida-core 1.x, the `.npy` files are memory-mapped in sorted path order;
+    with the object store of aiida-core 2.x, they are streamed in the order in which they are stored in the packs.
+
+    :return: a dictionary PK -> stress array.
+    """
+    arrays = {}
+    if RepositoryFolder is not None:
+        paths = {}
+        for chunk in _chunks(array_pks):
+            query = orm.QueryBuilder().append(orm.ArrayData, filters={'id': {'in': chunk}}, project=['id', 'uuid'])
+            for pk, uuid in query.iterall():
+                paths[pk] = RepositoryFolder(section='node', uuid=uuid).get_subfolder('path').get_abs_path('stress.npy')
+        for pk, path in sorted(paths.items(), key=lambda item: item[1]):
+            arrays[pk] = np.load(path, mmap_mode='r')
+        return arrays
+
+    from aiida.manage import get_manager
+    pks_of_key = defaultdict(list)
+    for chunk in _chunks(array_pks):
+        query = orm.QueryBuilder().append(
+            orm.ArrayData, filters={'id': {'in': chunk}}, project=['id', 'repository_metadata'])
+        for pk, repository_metadata in query.iterall():
+            pks_of_key[repository_metadata['o']['stress.npy']['k']].append(pk)
+    repository = get_manager().get_profile_storage().get_repository()
+    for key, stream in repository.iter_object_streams(sorted(pks_of_key)):
+        array = np.load(io.BytesIO(stream.read()))
+        for pk in pks_of_key[key]:
+            arrays[pk] = array
+    return arrays
+
+
+def extract_raw_data(records, include_running=False):
+    """
+    Extract volumes, energies and stresses of all the given EOS workflows (as returned by
+    `get_workflow_records`) with a handful of projected queries, instead of loading the outputs node by node.
+
+    :param include_running: also collect the completed volumes of the workflows that are still running.
+    :return: a dictionary workflow PK -> raw data, see `raw_data.assemble_raw_data`.
+        Workflows that are neither finished nor excepted (nor running, with `include_running`) are not included.
+    """
+    successful_pks = [
+        record['pk'] for record in records if is_successful_state(record['process_state'], record['exit_status'])
+    ]
+    failed_pks = [
+        record['pk'] for record in records if is_failed_state(record['process_state'], record['exit_status'])
+    ]
+    running_pks = [
+        record['pk'] for record in records if include_running and is_running_state(record['process_state'])
+    ]
+    outputs = {
+        'relax_children': {pk: [] for pk in successful_pks + failed_pks + running_pks},
+        'structures': {pk: {} for pk in successful_pks},
+        'energies': {pk: {} for pk in successful_pks},
+    }
+
+    # Relax sub-workflows called by all the EOS workflows
+    for chunk in _chunks(successful_pks + failed_pks + running_pks):
+        query = orm.QueryBuilder()
+        query.append(orm.WorkflowNode, filters={'id': {'in': chunk}}, tag='eos', project=['id'])
+        query.append(
+            orm.WorkflowNode, with_incoming='eos', edge_filters={'type': LinkType.CALL_WORK.value},
+            project=['id', 'attributes.process_state', 'attributes.exit_status'])
+        for eos_pk, relax_pk, process_state, exit_status in query.iterall():
+            outputs['relax_children'][eos_pk].append((relax_pk, is_successful_state(process_state, exit_status)))
+    relax_pks = [relax_pk for children in outputs['relax_children'].values() for relax_pk, _ in children]
+
+    # Outputs of the relax sub-workflows
+    outputs['relax_energies'] = {
+        relax_pk: {'uuid': output['uuid'], 'value': output['attributes.value']}
+        for relax_pk, _, output in _query_returned_outputs(
+            relax_pks, orm.Float, 'total_energy', ['uuid', 'attributes.value'])
+    }
+    outputs['relax_stresses'] = {
+        relax_pk: output['id']
+        for relax_pk, _, output in _query_returned_outputs(relax_pks, orm.ArrayData, 'stress', ['id'])
+    }
+    outputs['relaxed_structures'] = {
+        relax_pk: {'cell': output['attributes.cell'], 'sites': output['attributes.sites']}
+        for relax_pk, _, output in _query_returned_outputs(
+            [relax_pk for pk in failed_pks + running_pks for relax_pk, _ in outputs['relax_children'][pk]],
+            orm.StructureData, 'relaxed_structure', ['attributes.cell', 'attributes.sites'])
+    }
+
+    # Structures and energies returned by the successful EOS workflows
+    for pk, label, output in _query_returned_outputs(
+            successful_pks, orm.StructureData, {'like': 'structures__%'}, ['attributes.cell', 'attributes.sites']):
+        outputs['structures'][pk][label[len('structures__'):]] = {
+            'cell': output['attributes.cell'], 'sites': output['attributes.sites']}
+    for pk, label, output in _query_returned_outputs(
+            successful_pks, orm.Float, {'like': 'total_energies__%'}, ['uuid', 'attributes.value']):
+        outputs['energies'][pk][label[len('total_energies__'):]] = {
+            'uuid': output['uuid'], 'value': output['attributes.value']}
+
+    return assemble_raw_data(successful_pks, failed_pks, outputs, read_stress_arrays, running_pks=running_pks)
+
+
+def extract_raw_data_from_node(node, include_running=False):
+    """
+    Same as `extract_raw_data`, for a single EOS workflow node, but loading its outputs one by one
+    (this is much slower, but does not rely on the layout of the projected attributes).
+
+    :return: the dictionary with the raw data of the workflow, or None if it is neither finished nor excepted
+        (nor running, with `include_running`).
+    """
+    if is_successful_state(node.process_state.value, node.exit_status):
+        volumes = []
+        energies = []
+        stresses = []
+        num_atoms = None
+        outputs = node.get_outgoing(link_type=LinkType.RETURN).nested()
+        for index, sub_structure in sorted(outputs['structures'].items()):
+            if num_atoms is None:
+                num_atoms = len(sub_structure.sites)
+            else:
+                assert num_atoms == len(sub_structure.sites), (
+                    f"Number of atoms changes between structures for the EOS workflow {node.pk}!"
+                )
+            volumes.append(sub_structure.get_cell_volume())
+            energy_node = outputs['total_energies'][index]
+            energies.append(energy_node.value)
+            parent_workflows_links = energy_node.get_incoming(link_type=LinkType.RETURN).all()
+            parent_workflows = [
+                triple.node for triple in parent_workflows_links
+                if issubclass(triple.node.process_class, CommonRelaxWorkChain)]
+            assert len(parent_workflows) == 1, "Error retrieving the parent Relax workflow!"
+            parent_workflow = parent_workflows[0]
+            try:
+                stress = parent_workflow.outputs.stress.get_array('stress').tolist()
+            except AttributeError:
+                stress = None
+            stresses.append(stress)
+        num_attempt_vols = None
+    elif is_failed_state(node.process_state.value, node.exit_status) or (
+            include_running and is_running_state(node.process_state.value)):
+        volumes, energies, stresses, num_atoms, num_attempt_vols = extract_from_failed(node)
+    else:
+        return None
+    raw_data = {
+        'volumes': volumes,
+        'energies': energies,
+        'stresses': stresses,
+        'num_atoms': num_atoms,
+        'num_attempt_vols': num_attempt_vols,
+    }
+    if is_running_state(node.process_state.value):
+        raw_data['provisional'] = True
+    return raw_data
+
+
+def init_worker(profile_name):
+    """Initializer of the worker processes: load the AiiDA profile once per process."""
+    load_profile(profile_name)
+
+
+def extract_chunk(records, per_node=False, include_running=False):
+    """
+    Extract the raw data of a chunk of workflows (as returned by `get_workflow_records`), e.g. in a worker process.
+
+    :param per_node: use `extract_raw_data_from_node` instead of the bulk queries of `extract_raw_data`.
+    :param include_running: also collect the completed volumes of the workflows that are still running.
+    :return: a tuple with the dictionary workflow PK -> raw data (see `extract_raw_data`) and the elapsed time in seconds.
+    """
+    start_time = time.time()
+    if per_node:
+        raw_data = {
+            record['pk']: extract_raw_data_from_node(orm.load_node(record['pk']), include_running=include_running)
+            for record in records
+        }
+    else:
+        raw_data = extract_raw_data(records, include_running=include_running)
+    return raw_data, time.time() - start_time
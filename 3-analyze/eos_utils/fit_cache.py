@@ -0,0 +1,177 @@
+# Content-addressed on-disk cache of EOS fits.
+#
+# Each fitted curve is stored in a SQLite database, keyed by a hash of the EOS form,
+# of the version of the fitting code and of the (rounded) volumes and energies.
+# The cache is bounded to a maximum number of entries; the least recently used
+# ones are evicted first.
+
+import hashlib
+import sqlite3
+import time
+
+import numpy as np
+
+from . import eos_forms, eosfit_31_adapted
+from .eos_forms import EOS_FORMS
+
+# Default maximum number of cached fits
+DEFAULT_MAX_ENTRIES = 200_000
+# Volumes and energies are rounded to this number of decimals before hashing
+DEFAULT_DECIMALS = 8
+# Maximum number of parameters in a single SQLite query
+_QUERY_CHUNK_SIZE = 500
+
+
+def get_code_version():
+    """
+    Return a hash of the source of the fitting code (`eosfit_31_adapted` and `eos_forms`), to use as `version`
+    of an `EOSFitCache` when there is no script version that changes with the fits.
+    """
+    digest = hashlib.sha256()
+    for module in (eosfit_31_adapted, eos_forms):
+        with open(module.__file__, 'rb') as fhandle:
+            digest.update(fhandle.read())
+    return digest.hexdigest()
+
+
+class EOSFitCache:
+    """
+    Cache of the batched EOS fits of `eos_forms.EOS_FORMS`, stored in a SQLite database.
+
+    Use `fit` instead of calling the batched fitters: only the curves that are not in the
+    cache are fitted (all together), and the results are the same arrays returned by the fitters.
+    The number of cache hits and misses is counted in the `hits` and `misses` attributes.
+
+    :param path: path of the SQLite database (created if it does not exist).
+    :param version: version of the fitting code (e.g. `__version__` of `get_results.py`, or `get_code_version()`);
+        fits done with a different version are never reused.
+    :param max_entries: maximum number of cached fits.
+    :param decimals: volumes and energies are rounded to this number of decimals to compute the keys.
+    """
+
+    def __init__(self, path, version, max_entries=DEFAULT_MAX_ENTRIES, decimals=DEFAULT_DECIMALS):
+        self.path = path
+        self.version = str(version)
+        self.max_entries = max_entries
+        self.decimals = decimals
+        self.hits = 0
+        self.misses = 0
+        self._connection = sqlite3.connect(path)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS fits ("
+            "key TEXT PRIMARY KEY, volume0 REAL, E0 REAL, bulk_modulus0 REAL, bulk_deriv0 REAL, "
+            "residuals0 REAL, failed INTEGER, last_access REAL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS fits_last_access ON fits (last_access)")
+        self._connection.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the connection to the database."""
+        self._connection.close()
+
+    def get_keys(self, volumes, energies, mask=None, form='BM'):
+        """
+        Return the list of cache keys of the N curves in the (N, k) arrays `volumes` and `energies`
+        (only the points where `mask` is True are considered).
+        """
+        volumes = np.asarray(volumes, dtype=float)
+        energies = np.asarray(energies, dtype=float)
+        if mask is None:
+            mask = np.ones(volumes.shape, dtype=bool)
+        # Rounding avoids cache misses because of e.g. a different float formatting in the JSON files;
+        # adding 0. turns -0. into 0.
+        rounded_volumes = np.round(volumes, self.decimals) + 0.
+        rounded_energies = np.round(energies, self.decimals) + 0.
+        prefix = f'{form}:{self.version}:'.encode()
+        keys = []
+        for row_volumes, row_energies, row_mask in zip(rounded_volumes, rounded_energies, mask):
+            digest = hashlib.sha256(prefix)
+            digest.update(row_volumes[row_mask].tobytes())
+            digest.update(row_energies[row_mask].tobytes())
+            keys.append(digest.hexdigest())
+        return keys
+
+    def fit(self, volumes, energies, mask=None, form='BM'):
+        """
+        Same as calling `EOS_FORMS[form](volumes, energies, mask)`, but only fitting the curves
+        that are not already in the cache, and storing the new fits.
+
+        :return: arrays (volume0, E0, bulk_modulus0, bulk_deriv0, residuals0, failed), each of shape (N,).
+        """
+        volumes = np.asarray(volumes, dtype=float)
+        energies = np.asarray(energies, dtype=float)
+        if mask is None:
+            mask = np.ones(volumes.shape, dtype=bool)
+        else:
+            mask = np.asarray(mask, dtype=bool)
+        keys = self.get_keys(volumes, energies, mask, form)
+
+        cached = {}
+        for start in range(0, len(keys), _QUERY_CHUNK_SIZE):
+            chunk = keys[start:start + _QUERY_CHUNK_SIZE]
+            cached.update(
+                (row[0], row[1:]) for row in self._connection.execute(
+                    "SELECT key, volume0, E0, bulk_modulus0, bulk_deriv0, residuals0, failed FROM fits "
+                    f"WHERE key IN ({', '.join('?' * len(chunk))})", chunk)
+            )
+
+        results = np.full((len(keys), 6), np.nan)
+        missing = []
+        for row, key in enumerate(keys):
+            if key in cached:
+                # NULL (i.e. NaN) values for failed fits are returned as None
+                results[row] = [np.nan if value is None else value for value in cached[key]]
+            else:
+                missing.append(row)
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+
+        now = time.time()
+        if missing:
+            fit_results = EOS_FORMS[form](volumes[missing], energies[missing], mask[missing])
+            results[missing] = np.stack(fit_results, axis=1)
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO fits VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (keys[row], *(None if np.isnan(value) else float(value) for value in results[row, :5]),
+                     int(results[row, 5]), now)
+                    for row in missing
+                ]
+            )
+        # Update the access time of the hits, for the LRU eviction
+        hit_keys = [key for key in keys if key in cached]
+        self._connection.executemany("UPDATE fits SET last_access = ? WHERE key = ?", [(now, key) for key in hit_keys])
+        self._evict()
+        self._connection.commit()
+
+        return (*results[:, :5].T, results[:, 5].astype(bool))
+
+    def fit_forms(self, volumes, energies, mask=None, forms=('BM',)):
+        """
+        Cached version of `eos_forms.fit_eos_forms`: return a dictionary form -> output of `fit`.
+        """
+        for form in forms:
+            if form not in EOS_FORMS:
+                raise ValueError(f"Unknown EOS form '{form}', valid ones are: {', '.join(EOS_FORMS)}")
+        return {form: self.fit(volumes, energies, mask, form) for form in forms}
+
+    def _evict(self):
+        """Delete the least recently used entries beyond `max_entries`."""
+        num_entries = self._connection.execute("SELECT COUNT(*) FROM fits").fetchone()[0]
+        if num_entries > self.max_entries:
+            self._connection.execute(
+                "DELETE FROM fits WHERE key IN (SELECT key FROM fits ORDER BY last_access ASC LIMIT ?)",
+                (num_entries - self.max_entries,)
+            )
+
+    def get_statistics_string(self):
+        """Return a string with the number of hits and misses, e.g. to print at the end of a script."""
+        total = self.hits + self.misses
+        hit_rate = 100. * self.hits / total if total else 0.
+        return f"EOS fit cache '{self.path}': {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)"
@@ -0,0 +1,142 @@
+# Assembly of the raw EOS data (volumes, energies, stresses) of the workflows of a set.
+#
+# This module does not depend on AiiDA: the outputs of the workflows are passed as plain
+# dictionaries, collected either from the database (see `extraction.py`) or directly from
+# an exported archive (see `archive.py`).
+
+import numpy as np
+
+
+def is_successful_state(process_state, exit_status):
+    """Whether a workflow with this state finished successfully."""
+    return process_state == 'finished' and exit_status == 0
+
+
+def is_failed_state(process_state, exit_status):
+    """Whether the partial results of a workflow with this state should be extracted (see `extract_from_failed`)."""
+    return (process_state == 'finished' and exit_status != 0) or process_state == 'excepted'
+
+
+def is_running_state(process_state):
+    """Whether a workflow with this process state did not terminate yet."""
+    return process_state in ('created', 'waiting', 'running')
+
+
+def stack_system_stresses(stress_arrays, stress_pks):
+    """
+    Return the stresses of all volumes of a system as an array of shape [n_volumes, 3, 3].
+
+    :param stress_arrays: dictionary PK -> stress array.
+    :param stress_pks: list with the PK of the stress node of each volume (None if there is no stress,
+        in which case the stress is NaN).
+    """
+    stresses = np.full((len(stress_pks), 3, 3), np.nan)
+    for idx, pk in enumerate(stress_pks):
+        if pk is not None:
+            stresses[idx] = stress_arrays[pk]
+    return stresses
+
+
+def assemble_raw_data(successful_pks, failed_pks, outputs, read_stress_arrays, running_pks=()):
+    """
+    Assemble the raw data of the given EOS workflows from their outputs and from those of their
+    relax sub-workflows.
+
+    Volumes are computed all at once from the cells. For failed (and running) workflows, the same logic
+    of `extract_from_failed` is applied to the relax sub-workflows.
+
+    :param successful_pks: PKs of the EOS workflows that finished successfully.
+    :param failed_pks: PKs of the EOS workflows that failed (see `is_failed_state`).
+    :param outputs: dictionary with:
+        - `relax_children`: EOS workflow PK -> list of (relax workflow PK, whether it finished successfully);
+        - `structures`, `energies`: EOS workflow PK -> dictionary index -> returned structure (a dictionary
+          with the `cell` and `sites` attributes) or energy (a dictionary with the `uuid` and `value` of the node);
+        - `relax_energies`: relax workflow PK -> returned total energy (same format as above);
+        - `relaxed_structures`: relax workflow PK -> returned relaxed structure (same format as above);
+        - `relax_stresses`: relax workflow PK -> PK of the returned stress `ArrayData`.
+    :param read_stress_arrays: function returning a dictionary PK -> stress array for a list of `ArrayData` PKs.
+    :param running_pks: PKs of EOS workflows still running, whose completed relax sub-workflows are collected
+        in the same way as for failed workflows.
+    :return: a dictionary workflow PK -> dictionary with the (unsorted) `volumes`, `energies`, `stresses`,
+        the `num_atoms` and, for failed and running workflows only, `num_attempt_vols` (None for successful
+        workflows). For running workflows, `provisional` is also set to True.
+    """
+    running_pks = list(running_pks)
+    provisional_pks = set(running_pks)
+    relax_of_energy = {}
+    for relax_pk, energy in outputs['relax_energies'].items():
+        assert energy['uuid'] not in relax_of_energy, "Error retrieving the parent Relax workflow!"
+        relax_of_energy[energy['uuid']] = relax_pk
+    relax_stresses = outputs['relax_stresses']
+
+    raw_data = {}
+    all_cells = []
+    # PK of the stress node (or None) for each volume of each system, read all together at the end
+    all_stress_pks = []
+
+    # Successful workflows: structures and energies returned with the same index
+    for pk in successful_pks:
+        num_atoms = None
+        system_data = {'energies': [], 'num_attempt_vols': None}
+        system_cells = []
+        system_stress_pks = []
+        for index, sub_structure in sorted(outputs['structures'].get(pk, {}).items()):
+            if num_atoms is None:
+                num_atoms = len(sub_structure['sites'])
+            else:
+                assert num_atoms == len(sub_structure['sites']), (
+                    f"Number of atoms changes between structures for the EOS workflow {pk}!"
+                )
+            system_cells.append(sub_structure['cell'])
+            energy = outputs['energies'][pk][index]
+            system_data['energies'].append(energy['value'])
+            system_stress_pks.append(relax_stresses.get(relax_of_energy[energy['uuid']]))
+        system_data['num_atoms'] = num_atoms
+        raw_data[pk] = system_data
+        all_cells.append(system_cells)
+        all_stress_pks.append(system_stress_pks)
+
+    # Failed and running workflows: the relaxed structures of the finished relax sub-workflows
+    for pk in failed_pks + running_pks:
+        relax_children = outputs['relax_children'].get(pk, [])
+        num_atoms = None
+        system_data = {'energies': [], 'num_attempt_vols': len(relax_children)}
+        system_cells = []
+        system_stress_pks = []
+        for relax_pk, is_finished_ok in sorted(relax_children):
+            if not is_finished_ok:
+                continue
+            if relax_pk not in outputs['relaxed_structures']:
+                # there is no output structure, can not retrieve the volume!
+                break
+            relaxed_structure = outputs['relaxed_structures'][relax_pk]
+            if num_atoms is None:
+                num_atoms = len(relaxed_structure['sites'])
+            system_cells.append(relaxed_structure['cell'])
+            system_data['energies'].append(outputs['relax_energies'][relax_pk]['value'])
+            system_stress_pks.append(relax_stresses.get(relax_pk))
+        system_data['num_atoms'] = num_atoms
+        if pk in provisional_pks:
+            system_data['provisional'] = True
+        raw_data[pk] = system_data
+        all_cells.append(system_cells)
+        all_stress_pks.append(system_stress_pks)
+
+    # Volumes of all structures of all systems in one go
+    num_cells = [len(system_cells) for system_cells in all_cells]
+    flat_cells = [cell for system_cells in all_cells for cell in system_cells]
+    all_volumes = np.abs(np.linalg.det(np.array(flat_cells, dtype=float))) if flat_cells else np.zeros(0)
+    split_volumes = np.split(all_volumes, np.cumsum(num_cells)[:-1]) if num_cells else []
+    for pk, volumes in zip(successful_pks + failed_pks + running_pks, split_volumes):
+        raw_data[pk]['volumes'] = volumes.tolist()
+
+    # Stresses of all systems, reading all the arrays in bulk
+    stress_arrays = read_stress_arrays(sorted(
+        stress_pk for system_stress_pks in all_stress_pks for stress_pk in system_stress_pks if stress_pk is not None))
+    for pk, system_stress_pks in zip(successful_pks + failed_pks + running_pks, all_stress_pks):
+        raw_data[pk]['stresses'] = [
+            None if stress_pk is None else stress.tolist()
+            for stress_pk, stress in zip(system_stress_pks, stack_system_stresses(stress_arrays, system_stress_pks))
+        ]
+
+    return raw_data
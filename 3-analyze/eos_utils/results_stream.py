@@ -0,0 +1,174 @@
+# Streaming (NDJSON) version of the results files written by `get_results.py --stream`.
+#
+# The stream starts with a header line, followed by one line per system, written (and flushed) as soon as
+# the system is extracted and fitted, and ends with an end line once all systems are written. Each line
+# is a JSON object with a `type` (`header`, `system` or `end`). The stream can be read while it is still
+# being written (see `iter_stream`), and compacted into the format of the `results-*.json` files
+# (see `compact_stream`), also if the run that was writing it did not complete.
+
+import json
+import os
+import time
+
+# Sections of the results files with one entry per system (keyed by `<element>-<configuration>`)
+PER_SYSTEM_SECTIONS = ('uuid_mapping', 'eos_data', 'stress_data', 'BM_fit_data', 'num_atoms_in_sim_cell')
+
+
+class ResultsStreamWriter:
+    """
+    Write the results of a set, one system at a time, to an NDJSON stream.
+
+    :param path: path of the stream (replaced if it exists).
+    :param script_version: version of `get_results.py`.
+    :param set_name: name of the set.
+    :param extra_eos_forms: EOS forms fitted on top of Birch-Murnaghan (their `<form>_fit_data` sections are streamed).
+    :param include_running: whether the `provisional` section is streamed.
+    """
+
+    def __init__(self, path, script_version, set_name, extra_eos_forms=(), include_running=False):
+        self.path = path
+        self._fhandle = open(path, 'w')
+        self._write({
+            'type': 'header',
+            'script_version': script_version,
+            'set_name': set_name,
+            'extra_eos_forms': list(extra_eos_forms),
+            'include_running': include_running,
+        })
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # The end line is only written if all systems were written
+        self.close(complete=exc_type is None)
+
+    def _write(self, line):
+        self._fhandle.write(json.dumps(line) + '\n')
+        self._fhandle.flush()
+
+    def write_system(self, record):
+        """Write the record of one system (see `split_results`)."""
+        self._write({'type': 'system', **record})
+
+    def close(self, complete=True):
+        """Close the stream, writing the end line if `complete` is True."""
+        if complete:
+            self._write({'type': 'end'})
+        self._fhandle.close()
+
+
+def split_results(data):
+    """
+    Split the results of (some systems of) a set, in the format of the `results-*.json` files (see
+    `get_results.process_results`), into one record per system, with the same sections.
+
+    :return: a list of dictionaries with the `system` (`<element>-<configuration>`), its entry in each section
+        with one entry per system (None if it is not there) and its entries of the `failed_wfs`
+        and `completely_off` lists (None if it is not there).
+    """
+    extra_sections = [key for key in data if key.endswith('_fit_data') and key not in PER_SYSTEM_SECTIONS]
+    for key in ('missing_outputs', 'provisional'):
+        if key in data:
+            extra_sections.append(key)
+    failed_wfs = {f"{item['element']}-{item['configuration']}": item for item in data['failed_wfs']}
+    completely_off = {f"{item['element']}-{item['configuration']}": item for item in data['completely_off']}
+
+    records = []
+    for system in data['uuid_mapping']:
+        record = {'system': system}
+        for section in PER_SYSTEM_SECTIONS + tuple(extra_sections):
+            record[section] = data[section].get(system)
+        record['failed_wf'] = failed_wfs.get(system)
+        record['completely_off'] = completely_off.get(system)
+        records.append(record)
+    return records
+
+
+def new_results_data(header):
+    """Return the (empty) results of a set, in the format of the `results-*.json` files, for the header of a stream."""
+    data = {
+        'script_version': header['script_version'],
+        'set_name': header['set_name'],
+        'failed_wfs': [],
+        'missing_outputs': {},
+        'completely_off': [],
+    }
+    for section in PER_SYSTEM_SECTIONS:
+        data[section] = {}
+    for form in header['extra_eos_forms']:
+        data[f'{form}_fit_data'] = {}
+    if header['include_running']:
+        data['provisional'] = {}
+    return data
+
+
+def add_system_record(data, record):
+    """Add the record of a system (see `split_results`) to the results `data` (see `new_results_data`)."""
+    system = record['system']
+    for section, value in data.items():
+        if not isinstance(value, dict):
+            continue
+        if section in ('missing_outputs', 'provisional'):
+            # Only the systems with missing outputs (or provisional data) are listed
+            if record.get(section) is not None:
+                value[system] = record[section]
+        else:
+            value[system] = record.get(section)
+    if record['failed_wf'] is not None:
+        data['failed_wfs'].append(record['failed_wf'])
+    if record['completely_off'] is not None:
+        data['completely_off'].append(record['completely_off'])
+
+
+def iter_stream(path, follow=False, poll_interval=1.):
+    """
+    Yield the lines of a stream (as dictionaries), until the end line.
+
+    :param follow: keep waiting for new lines (and for the file to be created) until the end line is written,
+        e.g. while `get_results.py --stream` is still running; otherwise stop at the end of the file.
+    :param poll_interval: time in seconds between two checks for new lines, with `follow`.
+    """
+    while follow and not os.path.exists(path):
+        time.sleep(poll_interval)
+    with open(path) as fhandle:
+        partial_line = ''
+        while True:
+            line = fhandle.readline()
+            if not line:
+                if not follow:
+                    # A truncated last line (e.g. if the writer was killed) is ignored
+                    return
+                time.sleep(poll_interval)
+                continue
+            partial_line += line
+            if not partial_line.endswith('\n'):
+                # The writer did not finish writing this line yet
+                continue
+            content = json.loads(partial_line)
+            partial_line = ''
+            yield content
+            if content['type'] == 'end':
+                return
+
+
+def compact_stream(path):
+    """
+    Read a stream and return the results in the format of the `results-*.json` files; the systems
+    are in the same order as in the stream.
+
+    :return: a tuple with the results and a boolean, False if the stream was not complete (e.g. if the run
+        that was writing it crashed: only the systems written so far are included).
+    """
+    data = None
+    complete = False
+    for line in iter_stream(path):
+        if line['type'] == 'header':
+            data = new_results_data(line)
+        elif line['type'] == 'system':
+            add_system_record(data, line)
+        elif line['type'] == 'end':
+            complete = True
+    if data is None:
+        raise ValueError(f"'{path}' is not a results stream (no header found)")
+    return data, complete
@@ -0,0 +1,189 @@
+#!/usr/bin/env runaiida
+
+# Extract and fit the results of several sets and plugins in a single process: the AiiDA profile is loaded once,
+# the workflows of all (set, plugin) combinations are listed with a single query and extracted together, and all
+# fits go through the same EOS fit cache. The output files are the same as those of `get_results.py` (and
+# `get_errors.py`), plus a manifest listing all of them.
+import argparse
+import glob
+import importlib.util
+import json
+import os
+import time
+from datetime import datetime
+
+from eos_utils.eos_forms import EOS_FORMS
+from eos_utils.fit_cache import EOSFitCache
+from get_results import (
+    __version__, extract_records, get_plugin_name, load_extraction_index, process_results, save_extraction_index,
+    write_atomically, write_results
+)
+
+PRELIMINARY_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), os.pardir, '1-preliminary')
+
+
+def get_all_set_names():
+    """Return the names of all the sets whose structures are in the `1-preliminary` folder (e.g. `oxides-verification-PBE-v1`)."""
+    suffix = '_structures_uuids.csv'
+    return sorted(
+        os.path.basename(fname)[:-len(suffix)]
+        for fname in glob.glob(os.path.join(PRELIMINARY_FOLDER, f'*{suffix}'))
+    )
+
+
+def create_starting_subgroups(set_names, plugin_names):
+    """Run `1-preliminary/create_starting_subgroup.py` for all sets and plugins (the valid elements are computed once per plugin)."""
+    spec = importlib.util.spec_from_file_location(
+        'create_starting_subgroup', os.path.join(PRELIMINARY_FOLDER, 'create_starting_subgroup.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    for plugin_name in plugin_names:
+        valid_elements = module.get_valid_elements(plugin_name)
+        print(f"Number of valid elements for {plugin_name}: {len(valid_elements)}")
+        for set_name in set_names:
+            module.create_starting_subgroup(set_name, plugin_name, valid_elements)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and fit the EOS results of several sets and plugins at once.")
+    parser.add_argument(
+        "set_names", nargs="*", metavar="SET_NAME",
+        help="The set names, e.g. oxides-verification-PBE-v1 unaries-verification-PBE-v1")
+    parser.add_argument(
+        "--all-sets", action="store_true",
+        help="Process all the sets in the `1-preliminary` folder (PBE, PBEsol, LDA, ... for unaries and oxides)")
+    parser.add_argument(
+        "--plugin-names", nargs="+", metavar="PLUGIN_NAME",
+        help="The plugin names (default: read from `../plugin_name.txt`)")
+    parser.add_argument(
+        "--eos-forms", nargs="+", default=[], metavar="EOS_FORM",
+        help="Additional EOS forms to fit on top of Birch-Murnaghan, see `get_results.py`. "
+             f"Choose among: {', '.join(form for form in EOS_FORMS if form != 'BM')}")
+    parser.add_argument(
+        "--uncertainty", action="store_true", help="Same as in `get_results.py`")
+    parser.add_argument(
+        "--bootstrap-samples", type=int, default=200, help="Same as in `get_results.py` (default: %(default)s)")
+    parser.add_argument(
+        "--joint-stress", action="store_true", help="Same as in `get_results.py`")
+    parser.add_argument(
+        "--include-running", action="store_true", help="Same as in `get_results.py`")
+    parser.add_argument(
+        "--fit-cache", nargs="?", const="outputs/eos-fit-cache.sqlite", default=None, metavar="PATH",
+        help="Store the EOS fits in an on-disk cache, see `get_results.py` (without it, the fits are still "
+             "cached in memory across all sets; default path if no PATH is given: %(const)s)")
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Same as in `get_results.py` (default: %(default)s)")
+    parser.add_argument(
+        "--chunk-size", type=int, default=100, help="Same as in `get_results.py` (default: %(default)s)")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Same as in `get_results.py`, with one extraction index per set and plugin")
+    parser.add_argument(
+        "--per-node", action="store_true", help="Same as in `get_results.py`")
+    parser.add_argument(
+        "--errors", action="store_true",
+        help="Also write the reports and error catalogues of the failed workflows, as `get_errors.py`")
+    parser.add_argument(
+        "--create-subgroups", action="store_true",
+        help="First create the subgroups of structures of all sets and plugins, as `1-preliminary/create_starting_subgroup.py`")
+    parser.add_argument(
+        "--manifest", default="outputs/manifest-all-results.json", metavar="PATH",
+        help="File where the list of the files written and a summary of each set and plugin are stored "
+             "(default: %(default)s)")
+    args = parser.parse_args()
+    for form in args.eos_forms:
+        if form not in EOS_FORMS:
+            parser.error(f"invalid EOS form '{form}'")
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers and --chunk-size must be positive")
+    set_names = list(args.set_names)
+    if args.all_sets:
+        set_names += [set_name for set_name in get_all_set_names() if set_name not in set_names]
+    if not set_names:
+        parser.error("pass at least one set name, or --all-sets")
+    plugin_names = args.plugin_names or [get_plugin_name()]
+
+    options = {
+        # Birch-Murnaghan is always fitted
+        'extra_eos_forms': [form for form in args.eos_forms if form != 'BM'],
+        'uncertainty': args.uncertainty,
+        'bootstrap_samples': args.bootstrap_samples,
+        'joint_stress': args.joint_stress,
+        'include_running': args.include_running,
+    }
+
+    start_time = time.time()
+    if args.create_subgroups:
+        create_starting_subgroups(set_names, plugin_names)
+
+    from eos_utils.extraction import get_workflow_records_by_group
+
+    group_labels = {
+        (set_name, plugin_name): f'acwf-verification/{set_name}/workflows/{plugin_name}'
+        for set_name in set_names for plugin_name in plugin_names
+    }
+    # The workflows of all sets and plugins, listed with a single query
+    records_by_group = get_workflow_records_by_group(list(group_labels.values()))
+
+    # Extract all the workflows together, with the same bulk queries (and the same pool of workers)
+    previous_index = {}
+    if args.incremental:
+        for set_name, plugin_name in group_labels:
+            previous_index.update(load_extraction_index(f"outputs/extraction-index-{set_name}-{plugin_name}.json"))
+    all_records = list({
+        record['pk']: record for records in records_by_group.values() for record in records
+    }.values())
+    raw_data, records_to_extract = extract_records(
+        all_records, previous_index, workers=args.workers, chunk_size=args.chunk_size, per_node=args.per_node,
+        include_running=args.include_running)
+    extracted_pks = set(record['pk'] for record in records_to_extract)
+    print(
+        f"Data of {len(records_to_extract)}/{len(all_records)} workflows of {len(group_labels)} sets and plugins "
+        f"extracted in {time.time() - start_time:.1f} s.")
+
+    if args.fit_cache:
+        os.makedirs(os.path.dirname(args.fit_cache) or '.', exist_ok=True)
+    manifest_entries = []
+    # Without --fit-cache, the fits are cached in memory for the duration of the run
+    with EOSFitCache(args.fit_cache or ':memory:', version=__version__) as fit_cache:
+        for (set_name, plugin_name), group_label in group_labels.items():
+            records = records_by_group[group_label]
+            print()
+            print(f"*** {set_name} - {plugin_name}: {len(records)} workflows")
+            if not records:
+                manifest_entries.append({
+                    'set_name': set_name, 'plugin_name': plugin_name, 'num_workflows': 0, 'files': [],
+                })
+                continue
+            data, warning_lines = process_results(set_name, records, raw_data, fit_cache=fit_cache, **options)
+            files = write_results(data, warning_lines, set_name, plugin_name)
+            if args.incremental:
+                index_fname = f"outputs/extraction-index-{set_name}-{plugin_name}.json"
+                save_extraction_index(index_fname, records, raw_data)
+                files.append(index_fname)
+            if args.errors:
+                # `get_errors.py` imports AiiDA at module level, so only import it if needed
+                from get_errors import collect_errors, write_errors
+                files += write_errors(*collect_errors(group_label), set_name, plugin_name)
+            manifest_entries.append({
+                'set_name': set_name,
+                'plugin_name': plugin_name,
+                'num_workflows': len(records),
+                'num_extracted': len([record for record in records if record['pk'] in extracted_pks]),
+                'num_fitted': len([fit_data for fit_data in data['BM_fit_data'].values() if fit_data is not None]),
+                'num_failed': len(data['failed_wfs']),
+                'files': files,
+            })
+        fit_cache_statistics = {'hits': fit_cache.hits, 'misses': fit_cache.misses}
+        print(fit_cache.get_statistics_string())
+
+    manifest = {
+        'script_version': __version__,
+        'created': datetime.now().isoformat(timespec='seconds'),
+        'elapsed_seconds': round(time.time() - start_time, 1),
+        'fit_cache': fit_cache_statistics,
+        'results': manifest_entries,
+    }
+    os.makedirs(os.path.dirname(args.manifest) or '.', exist_ok=True)
+    write_atomically(args.manifest, json.dumps(manifest, indent=2))
+    print(f"Manifest of {len(manifest_entries)} sets and plugins written to: '{args.manifest}'.")
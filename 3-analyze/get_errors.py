@@ -1,46 +1,172 @@
 #!/usr/bin/env runaiida
+import argparse
 import os
 import json
-import sys
+import re
+import time
+from collections import defaultdict
 
 from aiida import orm
 from aiida.cmdline.utils.common import get_workchain_report
+from aiida.common.log import LOG_LEVELS
 
+# Maximum number of node PKs in the `in` filter of a single query
+QUERY_CHUNK_SIZE = 500
+# Same indentation per nesting level as `get_workchain_report`
+REPORT_INDENT_SIZE = 4
 
-def get_plugin_name():
-    file_name = os.path.join(
-        os.path.dirname(os.path.realpath(__file__)),
-        os.pardir, 'plugin_name.txt'
-    )
-    try:
-        with open(file_name) as fhandle:
-            plugin_name = fhandle.read().strip()
-            # Simple check e.g. to make sure there are no weird characters,
-            # newlines, ... - one might still make a typo, but at least we
-            # do a basic check
-            assert plugin_name.isidentifier()
-        return plugin_name
-    except FileNotFoundError as exc:
-        raise FileNotFoundError(
-            "You need to define a file `../plugin_name.txt`, containing the "
-            "name of your plugin (siesta, quantum_espresso, ...) in the format "
-            "expected by the aiida-common-workflows project"
-        ) from exc
+# Parts of the report messages that change from workflow to workflow, replaced to get their signature
+SIGNATURE_PATTERNS = [
+    (re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}'), '<UUID>'),
+    # Prefix of the messages, e.g. `[1234|PwBaseWorkChain|on_terminated]`
+    (re.compile(r'^\[\d+\|'), '[<PK>|'),
+    # Links to other nodes, e.g. `PwCalculation<1235>`
+    (re.compile(r'<\d+>'), '<<PK>>'),
+    (re.compile(r'\bpk\s*[=:]?\s*\d+', re.IGNORECASE), 'pk <PK>'),
+    (re.compile(r'[-+]?\d*\.\d+(?:[eE][-+]?\d+)?'), '<FLOAT>'),
+]
 
-PLUGIN_NAME = get_plugin_name()
 
-if __name__ == "__main__":
+def _chunks(values, size=QUERY_CHUNK_SIZE):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
 
-    try:
-        SET_NAME = sys.argv[1]
-    except IndexError:
-        print("Pass as parameter the set name, e.g. oxides-verification-PBE-v1 or unaries-verification-PBE-v1")
-        sys.exit(1)
-    STRUCTURES_GROUP_LABEL = f'acwf-verification/{SET_NAME}/structures/{PLUGIN_NAME}'
-    WORKFLOWS_GROUP_LABEL = f'acwf-verification/{SET_NAME}/workflows/{PLUGIN_NAME}'
 
+def get_subtrees(workflow_pks):
+    """
+    Return, for each of the given workflows, the list of (PK, nesting level) of the workflow and of all the
+    workflows it called (recursively), as in `get_workchain_report`; each nesting level is fetched with a single query.
+    """
+    subtrees = {pk: [(pk, 0)] for pk in workflow_pks}
+    # Workflows of the current level, and the top workflow they belong to
+    frontier = {pk: pk for pk in workflow_pks}
+    level = 0
+    while frontier:
+        level += 1
+        children = {}
+        for chunk in _chunks(frontier):
+            query = orm.QueryBuilder()
+            query.append(orm.WorkflowNode, filters={'id': {'in': chunk}}, tag='parent', project=['id'])
+            query.append(orm.WorkflowNode, with_incoming='parent', project=['id'])
+            for parent_pk, child_pk in query.iterall():
+                subtrees[frontier[parent_pk]].append((child_pk, level))
+                children[child_pk] = frontier[parent_pk]
+        frontier = children
+    return subtrees
+
+
+def get_levelnames(levelname):
+    """Return the names of the log levels at least as severe as `levelname`, as shown by `get_workchain_report`."""
+    return [name for name, value in LOG_LEVELS.items() if value >= LOG_LEVELS[levelname]]
+
+
+def get_last_message(workflow_pk, levelname='REPORT'):
+    """
+    Return the last log message of a workflow and of all the workflows it called (recursively), i.e. the message
+    of the last line of its report, as in `get_reports_bulk` (None if there is no message).
+    """
+    node_pks = [pk for pk, _ in get_subtrees([workflow_pk])[workflow_pk]]
+    query = orm.QueryBuilder()
+    query.append(
+        orm.Log, filters={'dbnode_id': {'in': node_pks}, 'levelname': {'in': get_levelnames(levelname)}},
+        project=['message'])
+    query.order_by({orm.Log: [{'time': 'desc'}, {'id': 'desc'}]})
+    query.limit(1)
+    result = query.first()
+    return None if result is None else result[0]
+
+
+def get_reports_bulk(workflow_pks, levelname='REPORT'):
+    """
+    Return a dictionary workflow PK -> report, with the same content of `get_workchain_report(node, levelname)`,
+    fetching the log entries of all the given workflows and of their descendants in a single query.
+
+    :return: a tuple with the dictionary of the reports and a dictionary workflow PK -> last log message
+        (None if there is no message).
+    """
+    subtrees = get_subtrees(workflow_pks)
+    depths = {pk: depth for subtree in subtrees.values() for pk, depth in subtree}
+    levelnames = get_levelnames(levelname)
+
+    entries_per_node = defaultdict(list)
+    for chunk in _chunks(depths):
+        query = orm.QueryBuilder()
+        query.append(
+            orm.Log, filters={'dbnode_id': {'in': chunk}, 'levelname': {'in': levelnames}},
+            project=['id', 'time', 'levelname', 'message', 'dbnode_id'])
+        for entry in query.iterall():
+            entries_per_node[entry[4]].append(entry)
+
+    reports = {}
+    last_messages = {}
+    for pk, subtree in subtrees.items():
+        entries = sorted(
+            (entry for node_pk, _ in subtree for entry in entries_per_node[node_pk]),
+            key=lambda entry: (entry[1], entry[0]))
+        if not entries:
+            reports[pk] = 'No log messages recorded for this entry'
+            last_messages[pk] = None
+            continue
+        width_id = len(str(max(entry[0] for entry in entries)))
+        width_levelname = max(len(entry[2]) for entry in entries)
+        reports[pk] = '\n'.join(
+            '{time:%Y-%m-%d %H:%M:%S} [{id:>{width_id}} | {levelname:>{width_levelname}}]:{indent} {message}'.format(
+                id=log_id, levelname=log_levelname, message=message, time=log_time, width_id=width_id,
+                width_levelname=width_levelname, indent=' ' * (depths[node_pk] * REPORT_INDENT_SIZE))
+            for log_id, log_time, log_levelname, message, node_pk in entries
+        )
+        last_messages[pk] = entries[-1][3]
+    return reports, last_messages
+
+
+def get_message_signature(message):
+    """Return the signature of a report message, i.e. the message without PKs, UUIDs and numerical values."""
+    if message is None:
+        return None
+    for pattern, replacement in SIGNATURE_PATTERNS:
+        message = pattern.sub(replacement, message)
+    return message
+
+
+def get_error_catalogue(data, last_messages):
+    """
+    Group the failed workflows by exit status and signature of the last report message.
+
+    :param data: the dictionary written to the `errors-*.json` file.
+    :param last_messages: dictionary with the same keys as `data`, with the last report message of each workflow.
+    :return: list of dictionaries with the `exit_status`, `process_state`, the `signature`, one `example`
+        message, the `count` and the list of `systems`, sorted by decreasing count.
+    """
+    groups = {}
+    for system, system_data in sorted(data.items()):
+        key = (system_data['process_state'], system_data['exit_status'], get_message_signature(last_messages[system]))
+        if key not in groups:
+            groups[key] = {
+                'process_state': system_data['process_state'],
+                'exit_status': system_data['exit_status'],
+                'signature': key[2],
+                'example': last_messages[system],
+                'systems': [],
+            }
+        groups[key]['systems'].append(system)
+    catalogue = sorted(groups.values(), key=lambda group: -len(group['systems']))
+    for group in catalogue:
+        group['count'] = len(group['systems'])
+    return catalogue
+
+
+def collect_errors(group_label, per_node=False):
+    """
+    Collect the reports of all EOS workflows in the group that did not finish with a 0 exit status.
+
+    :param per_node: build the reports with `get_workchain_report` instead of with `get_reports_bulk`.
+    :return: a tuple with the dictionary written to the `errors-*.json` file (system -> UUIDs, state and report)
+        and the dictionary system -> last report message (see `get_error_catalogue`).
+    """
+    start_time = time.time()
     group_node_query = orm.QueryBuilder().append(
-        orm.Group, filters={'label': WORKFLOWS_GROUP_LABEL}, tag='groups',
+        orm.Group, filters={'label': group_label}, tag='groups',
     ).append(orm.Node, project='*', with_group='groups', filters={
         'and': [
             {'attributes.exit_status': {"!==": 0}},
@@ -50,20 +176,86 @@ if __name__ == "__main__":
     group_node_query.distinct()
     wf_nodes = group_node_query.all(flat=True)
 
+    if per_node:
+        reports = {node.pk: get_workchain_report(node, levelname='REPORT') for node in wf_nodes}
+        last_messages = {node.pk: get_last_message(node.pk, levelname='REPORT') for node in wf_nodes}
+    else:
+        reports, last_messages = get_reports_bulk([node.pk for node in wf_nodes], levelname='REPORT')
+
     data = {}
+    system_last_messages = {}
     for node in wf_nodes:
         structure = node.inputs.structure
         print(f"{structure.extras['element']} {structure.extras['configuration']} ({structure.pk}) -> {node.pk}: {node.process_state.value} ({node.exit_status})")
         data[f"{structure.extras['element']}-{structure.extras['configuration']}"] = {
             'structure': structure.uuid, 
             'eos_workflow': node.uuid, 
-            'eos_workflow_report': get_workchain_report(node, levelname='REPORT'),
+            'eos_workflow_report': reports[node.pk],
             'process_state': node.process_state.value,
             'exit_status': node.exit_status
         }
+        system_last_messages[f"{structure.extras['element']}-{structure.extras['configuration']}"] = last_messages[node.pk]
+    print(f"Reports of {len(wf_nodes)} workflows collected in {time.time() - start_time:.1f} s.")
+    return data, system_last_messages
+
 
-    fname = f"outputs/errors-{SET_NAME}-{PLUGIN_NAME}.json"
+def write_errors(data, last_messages, set_name, plugin_name):
+    """
+    Write the reports and the error catalogue (see `get_error_catalogue`) to the `outputs` folder,
+    and print a compact summary of the catalogue.
+
+    :return: the list of the names of the files written.
+    """
+    fname = f"outputs/errors-{set_name}-{plugin_name}.json"
     os.makedirs('outputs', exist_ok=True)
     with open(fname, 'w') as fhandle:
         json.dump(data, fhandle, indent=2, sort_keys=True)
     print(f"'{fname}' written.")
+
+    # Compact catalogue of the failures, grouped by exit status and last report message
+    catalogue = get_error_catalogue(data, last_messages)
+    print()
+    for group in catalogue:
+        print(f"{group['count']:4d} x {group['process_state']} ({group['exit_status']}): {group['signature']}")
+    catalogue_fname = f"outputs/error-catalogue-{set_name}-{plugin_name}.json"
+    with open(catalogue_fname, 'w') as fhandle:
+        json.dump(catalogue, fhandle, indent=2)
+    print(f"'{catalogue_fname}' written.")
+    return [fname, catalogue_fname]
+
+
+def get_plugin_name():
+    file_name = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        os.pardir, 'plugin_name.txt'
+    )
+    try:
+        with open(file_name) as fhandle:
+            plugin_name = fhandle.read().strip()
+            # Simple check e.g. to make sure there are no weird characters,
+            # newlines, ... - one might still make a typo, but at least we
+            # do a basic check
+            assert plugin_name.isidentifier()
+        return plugin_name
+    except FileNotFoundError as exc:
+        raise FileNotFoundError(
+            "You need to define a file `../plugin_name.txt`, containing the "
+            "name of your plugin (siesta, quantum_espresso, ...) in the format "
+            "expected by the aiida-common-workflows project"
+        ) from exc
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Collect the reports of the EOS workflows that failed.")
+    parser.add_argument(
+        "set_name", help="The set name, e.g. oxides-verification-PBE-v1 or unaries-verification-PBE-v1")
+    parser.add_argument(
+        "--per-node", action="store_true",
+        help="Build the report of each workflow with `get_workchain_report` (much slower) instead of fetching "
+             "all log entries in bulk")
+    args = parser.parse_args()
+    PLUGIN_NAME = get_plugin_name()
+    SET_NAME = args.set_name
+    WORKFLOWS_GROUP_LABEL = f'acwf-verification/{SET_NAME}/workflows/{PLUGIN_NAME}'
+
+    data, last_messages = collect_errors(WORKFLOWS_GROUP_LABEL, per_node=args.per_node)
+    write_errors(data, last_messages, SET_NAME, PLUGIN_NAME)
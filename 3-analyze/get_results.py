@@ -1,243 +1,492 @@
 #!/usr/bin/env runaiida
 
 # The version of the script will be placed in the json file containing the results.
-# We should change this number anytime this script or `eos_utils.eosfit_31_adapted` is modified.
-import sys
+# We should change this number anytime this script, `eos_utils.eosfit_31_adapted`, `eos_utils.eos_forms`,
+# `eos_utils.extraction` or `eos_utils.raw_data` is modified: the EOS fit cache (`--fit-cache`) and the extraction index
+# (`--incremental`) are keyed on it, so their fits and data are only reused with the same version.
+import argparse
+import functools
 import json
+import multiprocessing
 import os
+import subprocess
+import sys
+import time
 
-import tqdm
 import numpy as np
 
 from collections import Counter
-from eos_utils.eosfit_31_adapted import BM, echarge
+from eos_utils.eosfit_31_adapted import (
+    BM_joint_batch, BM_joint_point_reduction, BM_uncertainty, echarge, stack_eos_data, stack_stress_data,
+    stress_factor_batch
+)
+from eos_utils.eos_forms import EOS_FORMS, fit_eos_forms
+from eos_utils.fit_cache import EOSFitCache
 
-from aiida import orm
-from aiida.common import LinkType, NotExistentAttributeError
-from aiida_common_workflows.workflows.relax.workchain import CommonRelaxWorkChain
 
+__version__ = "0.0.6"
 
-__version__ = "0.0.4"
+# Process states of the workflows that will not change anymore
+TERMINATED_STATES = ('finished', 'excepted', 'killed')
 
-def extract_from_failed(node):
+def get_workflow_signature(record):
     """
-    For EoS workchain with exit status different than zero, try to extract info on the completed volumes.
-
-    This can be done only if the calculated volumes have a "relaxed_structure" output.
-    In fact the EoS workchain calles <Code>CommonRelaxWorkChains and they have a common
-    output interface, not an input one!
+    Return what identifies the extracted state of a workflow (process state, exit status and modification time):
+    its data is extracted again only if this changes.
     """
-    ens=[]
-    vols=[]
-    streses=[]
-    num_atoms = None
-    num_attempt_vols = 0
-    for i in node.get_outgoing(link_type=LinkType.CALL_WORK).all():
-        num_attempt_vols = num_attempt_vols + 1
-        if i.node.is_finished_ok:
-            if num_atoms is None:
-                try:
-                    num_atoms = len(i.node.outputs.relaxed_structure.sites)
-                except NotExistentAttributeError:
-                    # there is no output structure, can not retrieve the volume!
-                    break
-            ens.append(i.node.outputs.total_energy.value)
-            vol = i.node.outputs.relaxed_structure.get_cell_volume()
-            vols.append(vol)
-            try:
-                stress = i.node.outputs.stress.get_array('stress').tolist()
-            except AttributeError:
-                stress = None
-            stresses.append(stress)
-
-    return vols,ens,streses,num_atoms,num_attempt_vols
+    return [record['process_state'], record['exit_status'], record['mtime']]
 
 
-def get_plugin_name():
-    file_name = os.path.join(
-        os.path.dirname(os.path.realpath(__file__)),
-        os.pardir, 'plugin_name.txt'
-    )
-    try:
-        with open(file_name) as fhandle:
-            plugin_name = fhandle.read().strip()
-            # Simple check e.g. to make sure there are no weird characters,
-            # newlines, ... - one might still make a typo, but at least we
-            # do a basic check
-            assert plugin_name.isidentifier()
-        return plugin_name
-    except FileNotFoundError as exc:
-        raise FileNotFoundError(
-            "You need to define a file `../plugin_name.txt`, containing the "
-            "name of your plugin (siesta, quantum_espresso, ...) in the format "
-            "expected by the aiida-common-workflows project"
-        ) from exc
+def is_provisional(raw_data):
+    """Whether the raw data of a workflow (see `extract_raw_data`) only has the volumes completed so far of a running one."""
+    return bool(raw_data and raw_data.get('provisional'))
 
-PLUGIN_NAME = get_plugin_name()
 
-if __name__ == "__main__":
+def load_extraction_index(fname):
+    """
+    Load the index written by `save_extraction_index`.
+
+    :return: a dictionary workflow UUID -> dictionary with the `signature` and the `raw_data` of the workflow.
+        It is empty if the file does not exist or was written by a different version of this script.
+    """
     try:
-        SET_NAME = sys.argv[1]
-    except IndexError:
-        print("Pass as parameter the set name, e.g. oxides-verification-PBE-v1 or unaries-verification-PBE-v1")
-        sys.exit(1)
+        with open(fname) as fhandle:
+            index = json.load(fhandle)
+    except FileNotFoundError:
+        return {}
+    if index.get('script_version') != __version__:
+        return {}
+    return index['workflows']
 
-    STRUCTURES_GROUP_LABEL = f'acwf-verification/{SET_NAME}/structures/{PLUGIN_NAME}'
-    WORKFLOWS_GROUP_LABEL = f'acwf-verification/{SET_NAME}/workflows/{PLUGIN_NAME}'
 
-    # Get all nodes in the output group (EOS workflows)
-    group_node_query = orm.QueryBuilder().append(
-        orm.Group, filters={'label': WORKFLOWS_GROUP_LABEL}, tag='groups',
-    ).append(orm.Node, project='*', with_group='groups')
-    group_node_query.distinct()
-    wf_nodes = group_node_query.all(flat=True)
+def get_extraction_index(records, raw_data):
+    """
+    Return the index with the signature (see `get_workflow_signature`) and the raw data (as returned by
+    `extract_raw_data`, None for workflows still running) of all given workflows, keyed by workflow UUID.
+    """
+    return {
+        record['uuid']: {
+            'signature': get_workflow_signature(record),
+            'raw_data': raw_data.get(record['pk']),
+        }
+        for record in records
+    }
+
+
+def save_extraction_index(fname, records, raw_data):
+    """
+    Write the index of all given workflows (see `get_extraction_index`) to a file.
+    The file is replaced atomically, so an interrupted run never leaves a corrupted index.
+
+    The provisional data of running workflows (see `include_running`) is stored as None, i.e. as without
+    `include_running`: the index never has partial data that a later run could take as final.
+    """
+    index = {
+        'script_version': __version__,
+        'workflows': get_extraction_index(
+            records, {pk: None if is_provisional(data) else data for pk, data in raw_data.items()}),
+    }
+    write_atomically(fname, json.dumps(index, sort_keys=True))
+
+
+def get_system_payload(record, raw_data):
+    """
+    Process the raw data of one EOS workflow (from `extract_raw_data`, or None if the workflow is
+    neither finished nor excepted) into everything that `get_results.py` stores for the system.
+
+    :param record: the dictionary of the workflow as returned by `get_workflow_records`.
+    :return: a dictionary with the `element`, `configuration`, `uuid_mapping`, `state`, `eos_data`,
+        `stress_data` and `num_atoms` of the system, plus `failed_wf` (dictionary, if there are not enough
+        volumes to fit), `missing_outputs` (number of missing volumes, for failed workflows with enough of
+        them) and `completely_off` (side of the minimum, if on the edge); each of them can be None.
+        `provisional` is a tuple (number of completed volumes, number of volumes) if the data comes from a
+        workflow that is still running, and None otherwise.
+    """
+    element = record['element']
+    configuration = record['configuration']
+    process_state = record['process_state']
+    exit_status = record['exit_status']
+
+    # Get the state (possibly adding the exit status if it's finished)
+    state = process_state
+    if state == 'finished':
+        state = f'{state}.{exit_status}'
+
+    # Initialize to None if the outputs are not there
+    payload = {
+        'element': element,
+        'configuration': configuration,
+        'uuid_mapping': {
+            'structure': record['structure_uuid'],
+            'eos_workflow': record['uuid'],
+        },
+        'state': state,
+        'eos_data': None,
+        'stress_data': None,
+        'num_atoms': None,
+        'failed_wf': None,
+        'missing_outputs': None,
+        'completely_off': None,
+        'provisional': None,
+    }
+
+    # We return all None for the materials still running
+    if raw_data is None:
+        return payload
+
+    volumes = raw_data['volumes']
+    energies = raw_data['energies']
+    stresses = raw_data['stresses']
+    payload['num_atoms'] = raw_data['num_atoms']
+
+    # For failed workflows, check if some volumes concluded succesfully, if more than 80% of vol are ok, go on with fit
+    num_attempt_vols = raw_data['num_attempt_vols']
+    # The same applies to the volumes completed so far by running workflows (but they are not failed yet)
+    if raw_data.get('provisional'):
+        if not num_attempt_vols or len(volumes) / float(num_attempt_vols) < 0.8:
+            return payload
+        payload['provisional'] = (len(volumes), num_attempt_vols)
+    elif num_attempt_vols is not None:
+        if not num_attempt_vols or len(volumes) / float(num_attempt_vols) < 0.8:
+            # Not enough volumes, list the material as failed (no fit attempted)
+            payload['failed_wf'] = {
+                'element': element,
+                'configuration': configuration,
+                'process_state': process_state,
+                'exit_status': exit_status,
+            }
+            return payload
+        payload['missing_outputs'] = num_attempt_vols - len(volumes)
+
+    energies = [e for _, e in sorted(zip(volumes, energies))]
+    # Stresses must follow the same order (they can be None, so only sort on the volume)
+    stresses = [stress for _, stress in sorted(zip(volumes, stresses), key=lambda pair: pair[0])]
+    volumes = sorted(volumes)
+    # List as I need to JSON-serialize it
+    payload['eos_data'] = (np.array([volumes, energies]).T).tolist()
+    payload['stress_data'] = list(zip(volumes, stresses))
+
+    # Check if the central point was completely off (i.e. the minimum of the energies is
+    # on the very left or very right of the volume range)
+    min_loc = np.array(energies).argmin()
+    # Side is whether the minimum occurs on the left side (small volumes) or right side (large volumes)
+    if min_loc == 0:
+        payload['completely_off'] = 'left'
+    elif min_loc == len(energies) - 1:
+        payload['completely_off'] = 'right'
+
+    return payload
+
+
+def extract_from_profile(group_label, previous_index, workers=1, chunk_size=100, per_node=False,
+                         include_running=False):
+    """
+    Extract the data of all EOS workflows in the group from the AiiDA profile.
+
+    :param previous_index: the index of a previous extraction (see `load_extraction_index`): the workflows
+        whose signature did not change are not extracted again, and their data is taken from the index.
+    :param workers: number of worker processes; if larger than 1, the workflows are split in chunks of
+        `chunk_size` workflows, extracted in parallel.
+    :param per_node: load the outputs node by node instead of with bulk queries.
+    :param include_running: also collect the completed volumes of the workflows that are still running
+        (these are always extracted again).
+    :return: a tuple `(records, raw_data, records_to_extract)` with the records of all workflows (see
+        `extraction.get_workflow_records`), the dictionary workflow PK -> raw data of all of them, and the
+        records of the workflows that were actually extracted.
+    """
+    from eos_utils.extraction import get_workflow_records
+
+    # Get all EOS workflows in the output group, with their input structure
+    records = get_workflow_records(group_label)
+    raw_data, records_to_extract = extract_records(
+        records, previous_index, workers=workers, chunk_size=chunk_size, per_node=per_node,
+        include_running=include_running)
+    return records, raw_data, records_to_extract
+
+
+def get_records_to_extract(records, previous_index, include_running=False):
+    """
+    Return the records of the workflows that need to be extracted: those whose signature changed since
+    `previous_index` (see `load_extraction_index`), those still running with `include_running`, and those
+    with provisional data in the index without `include_running`.
+    """
+    return [
+        record for record in records
+        if previous_index.get(record['uuid'], {}).get('signature') != get_workflow_signature(record)
+        or (include_running and record['process_state'] not in TERMINATED_STATES)
+        or (not include_running and is_provisional(previous_index[record['uuid']]['raw_data']))
+    ]
+
+
+def iter_extracted_chunks(records, previous_index, workers=1, chunk_size=100, per_node=False, include_running=False):
+    """
+    Extract the data of the given EOS workflows (see `extraction.get_workflow_records`) from the AiiDA profile,
+    one chunk of `chunk_size` workflows at a time (in parallel with `workers` > 1). See `extract_from_profile`
+    for the parameters.
+
+    Yield a tuple `(chunk_records, chunk_raw_data)` as soon as each chunk is extracted, in the original order
+    of the workflows; the workflows whose data is taken from `previous_index` come first, in a single chunk.
+    """
+    from aiida.manage.configuration import get_profile
+    from eos_utils.extraction import extract_chunk, init_worker
+
+    records_to_extract = get_records_to_extract(records, previous_index, include_running=include_running)
+    extracted_uuids = set(record['uuid'] for record in records_to_extract)
+    unchanged_records = [record for record in records if record['uuid'] not in extracted_uuids]
+    if unchanged_records:
+        yield unchanged_records, {
+            record['pk']: previous_index[record['uuid']]['raw_data'] for record in unchanged_records
+        }
+
+    chunks = [
+        records_to_extract[start:start + chunk_size]
+        for start in range(0, len(records_to_extract), chunk_size)
+    ]
+    if workers > 1 and chunks:
+        # The chunks are extracted by a pool of worker processes; the results come back in the order
+        # of the chunks, so the output is the same as when extracting serially
+        with multiprocessing.get_context('spawn').Pool(
+                workers, initializer=init_worker, initargs=(get_profile().name,)) as pool:
+            chunk_results = pool.imap(functools.partial(extract_chunk, per_node=per_node, include_running=include_running), chunks)
+            for chunk_idx, (chunk, (chunk_raw_data, elapsed)) in enumerate(zip(chunks, chunk_results)):
+                print(f"  chunk {chunk_idx + 1}/{len(chunks)}: {len(chunk)} workflows in {elapsed:.1f} s")
+                yield chunk, chunk_raw_data
+        print(f"Extracted with {workers} workers, chunk size {chunk_size}.")
+    else:
+        for chunk in chunks:
+            chunk_raw_data, _ = extract_chunk(chunk, per_node=per_node, include_running=include_running)
+            yield chunk, chunk_raw_data
+
+
+def extract_records(records, previous_index, workers=1, chunk_size=100, per_node=False, include_running=False):
+    """
+    Extract the data of the given EOS workflows (see `extraction.get_workflow_records`) from the AiiDA profile,
+    possibly from several groups at once. See `extract_from_profile` for the parameters.
 
+    :return: a tuple `(raw_data, records_to_extract)`.
+    """
+    records_to_extract = get_records_to_extract(records, previous_index, include_running=include_running)
+    raw_data = {}
+    # Without workers, all workflows are extracted together (i.e. with the fewest queries)
+    for _, chunk_raw_data in iter_extracted_chunks(
+            records, previous_index, workers=workers, chunk_size=chunk_size if workers > 1 else max(len(records), 1),
+            per_node=per_node, include_running=include_running):
+        raw_data.update(chunk_raw_data)
+    return raw_data, records_to_extract
+
+
+def process_results(set_name, records, raw_data, extra_eos_forms=(), fit_cache=None, uncertainty=False,
+                    bootstrap_samples=200, joint_stress=False, joint_energy_sigma=1.e-4, joint_pressure_sigma=1.e-4,
+                    joint_volume_tolerance=1.e-4, joint_bulk_modulus_tolerance=1.e-3, joint_min_agreement=0.5,
+                    include_running=False):
+    """
+    Process the raw data of all workflows of a set and fit all EOS.
+
+    :param records: the records of all workflows (see `extraction.get_workflow_records`).
+    :param raw_data: dictionary workflow PK -> raw data (see `raw_data.assemble_raw_data`).
+    :param extra_eos_forms: EOS forms to fit on top of Birch-Murnaghan.
+    :param fit_cache: an optional `EOSFitCache`, to only fit the curves that were not fitted before.
+    :param uncertainty: also estimate the standard errors of the Birch-Murnaghan parameters.
+    :param joint_stress: also fit the Birch-Murnaghan EOS jointly to the energies and to the pressures.
+    :param joint_energy_sigma: the noise of the energies (eV) in the joint fit, see `BM_joint_batch`.
+    :param joint_pressure_sigma: the noise of the pressures (eV/ang^3) in the joint fit, see `BM_joint_batch`.
+    :param joint_volume_tolerance: the relative tolerance on V0 of the point reduction, see `BM_joint_point_reduction`.
+    :param joint_bulk_modulus_tolerance: the relative tolerance on B0 of the point reduction.
+    :param joint_min_agreement: systems whose stresses agree less than this with the energies (in either sign
+        convention, see `stress_factor_batch`) are not fitted jointly.
+    :param include_running: the raw data includes the completed volumes of running workflows; the systems
+        fitted from such partial data are listed under `provisional`.
+    :return: a tuple `(data, warning_lines)` with the dictionary written to the results JSON file and
+        the list of warning lines.
+    """
+    extra_eos_forms = list(extra_eos_forms)
     states = []
     data_to_print = {}
     warning_lines = []
 
     uuid_mapping = {}
     all_missing_outputs = {}
+    provisional = {}
     completely_off = []
     failed_wfs = []
     all_eos_data = {}
     all_stress_data = {}
     all_BM_fit_data = {}
     num_atoms_in_sim_cell = {}
+    # List of (element, configuration, eos_data) tuples, fitted all together below
+    systems_to_fit = []
 
-    # Initialize the progress bar as a variable so we can dynamically set its description
-    progress_bar = tqdm.tqdm(wf_nodes)
-    for node in progress_bar:
-        structure = node.inputs.structure
-        element = structure.extras['element']
-        configuration = structure.extras['configuration']
+    for record in records:
+        payload = get_system_payload(record, raw_data.get(record['pk']))
+        element = payload['element']
+        configuration = payload['configuration']
 
-        uuid_mapping[f'{element}-{configuration}'] = {
-            'structure': structure.uuid,
-            'eos_workflow': node.uuid
-        }
+        uuid_mapping[f'{element}-{configuration}'] = payload['uuid_mapping']
+        states.append(payload['state'])
+        if payload['failed_wf'] is not None:
+            failed_wfs.append(payload['failed_wf'])
+        if payload['missing_outputs'] is not None:
+            all_missing_outputs[f'{element}-{configuration}'] = payload['missing_outputs']
+            warning_lines.append(f"  WARNING! MISSING OUTPUTS: {payload['missing_outputs']}")
+        if payload['provisional'] is not None:
+            num_volumes, num_attempt_vols = payload['provisional']
+            provisional[f'{element}-{configuration}'] = {'completed_volumes': num_volumes, 'volumes': num_attempt_vols}
+            warning_lines.append(
+                f"  PROVISIONAL: {element} {configuration} still running, fitted with {num_volumes}/{num_attempt_vols} volumes")
+        if payload['completely_off'] is not None:
+            completely_off.append({'element': element, 'configuration': configuration, 'side': payload['completely_off']})
+        if payload['eos_data'] is not None:
+            systems_to_fit.append((element, configuration, payload['eos_data']))
 
-        # Set the progress bar description; using :16s to minimize length change of the description
-        description = f"{element} {configuration} ({structure.pk})"
-        progress_bar.set_description(f"{description:16s}")
-        progress_bar.refresh()
-
-        # Get the state (possibly adding the exit status if it's finished) and add to a list
-        state = node.process_state.value
-        if state == 'finished':
-            state = f'{state}.{node.exit_status}'
-        states.append(state)
-
-        # Initialize to None if the outputs are not there
-        eos_data = None
-        stress_data = None
-        BM_fit_data = None
-        num_atoms = None
-
-        volumes = []
-        energies = []
-        stresses = []
-
-        # For successfully finished workflows, collect the data from outputs
-        if node.process_state.value == 'finished' and node.exit_status == 0:
-            # Extract volumes and energies for this system
-            outputs = node.get_outgoing(link_type=LinkType.RETURN).nested()
-            for index, sub_structure in sorted(outputs['structures'].items()):
-                if num_atoms is None:
-                    num_atoms = len(sub_structure.sites)
-                else:
-                    assert num_atoms == len(sub_structure.sites), (
-                        f"Number of atoms changes between structures for {element} {configuration}!"
-                    )
-                volumes.append(sub_structure.get_cell_volume())
-                energy_node = outputs['total_energies'][index]
-                energies.append(energy_node.value)
-                parent_workflows_links = energy_node.get_incoming(link_type=LinkType.RETURN).all()
-                parent_workflows = [
-                    triple.node for triple in parent_workflows_links
-                    if issubclass(triple.node.process_class, CommonRelaxWorkChain)]
-                assert len(parent_workflows) == 1, "Error retrieving the parent Relax workflow!"
-                parent_workflow = parent_workflows[0]
-                try:
-                    stress = parent_workflow.outputs.stress.get_array('stress').tolist()
-                except AttributeError:
-                    stress = None
-                stresses.append(stress)
-        # For failed workflows, check if some volumes concluded succesfully, if more than 80% of vol are ok, go on with fit
-        elif (node.process_state.value == 'finished' and node.exit_status != 0) or (node.process_state.value == 'excepted'):
-            volumes,energies,stresses,num_atoms,num_attempt_vols = extract_from_failed(node)
-            if len(volumes)/float(num_attempt_vols) < 0.8:
-                # Not enough volumes, list the material as failed
-                failed_wfs.append({
-                    'element': element,
-                    'configuration': configuration,
-                    'process_state': node.process_state.value,
-                    'exit_status': node.exit_status,
-                })
-                # Return the info collected so far, eos_data, stress_data, BM_fit_data are still None
-                all_eos_data[f'{element}-{configuration}'] = eos_data
-                num_atoms_in_sim_cell[f'{element}-{configuration}'] = num_atoms
-                all_stress_data[f'{element}-{configuration}'] = stress_data
-                all_BM_fit_data[f'{element}-{configuration}'] = BM_fit_data
-                # Exit loop = no fit attempted
-                continue
-            all_missing_outputs[f'{element}-{configuration}'] = num_attempt_vols-len(volumes)
-            warning_lines.append(f"  WARNING! MISSING OUTPUTS: {num_attempt_vols-len(volumes)}")
-        # We return all None also for the case not covered by the two others if. For instance, fall here the materials still running.
+        all_eos_data[f'{element}-{configuration}'] = payload['eos_data']
+        num_atoms_in_sim_cell[f'{element}-{configuration}'] = payload['num_atoms']
+        all_stress_data[f'{element}-{configuration}'] = payload['stress_data']
+        # Set below if the fit succeeds
+        all_BM_fit_data[f'{element}-{configuration}'] = None
+
+    # Fit all EOS in one go, with all the requested forms
+    if systems_to_fit:
+        volumes, energies, mask = stack_eos_data([eos_data for _, _, eos_data in systems_to_fit])
+        if fit_cache is not None:
+            all_fit_results = fit_cache.fit_forms(volumes, energies, mask, forms=['BM'] + extra_eos_forms)
+            warning_lines.append(fit_cache.get_statistics_string())
         else:
-            #print(element,configuration,"probably still running?")
-            all_eos_data[f'{element}-{configuration}'] = eos_data
-            num_atoms_in_sim_cell[f'{element}-{configuration}'] = num_atoms
-            all_stress_data[f'{element}-{configuration}'] = stress_data
-            all_BM_fit_data[f'{element}-{configuration}'] = BM_fit_data
-            # Exit loop = no fit attempted
+            all_fit_results = fit_eos_forms(volumes, energies, mask, forms=['BM'] + extra_eos_forms)
+    else:
+        all_fit_results = {form: [[]] * 6 for form in ['BM'] + extra_eos_forms}
+    for (element, configuration, eos_data), min_volume, E0, bulk_modulus_internal, bulk_deriv, residuals, failed in zip(
+        systems_to_fit, *all_fit_results['BM']):
+        if failed:
+            # If we cannot find a minimum
+            # Note that BM_fit_data was already set to None in the loop
+            warning_lines.append(f"WARNING! Unable to fit for {element} {configuration}")
             continue
-        
-        energies = [e for _, e in sorted(zip(volumes, energies))]
-        volumes = sorted(volumes)
-        # List as I need to JSON-serialize it
-        eos_data = (np.array([volumes, energies]).T).tolist()
-        stress_data = list(zip(volumes, stresses))
-
-        # Check if the central point was completely off (i.e. the minimum of the energies is
-        # on the very left or very right of the volume range)
-        min_loc = np.array(energies).argmin()
-        if min_loc == 0:
-            # Side is whether the minimum occurs on the left side (small volumes) or right side (large volumes)
-            completely_off.append({'element': element, 'configuration': configuration, 'side': 'left'})
-        elif min_loc == len(energies) - 1:
-            completely_off.append({'element': element, 'configuration': configuration, 'side': 'right'})   
+        bulk_modulus_GPa = bulk_modulus_internal * echarge * 1.0e21
+        #1 eV/Angstrom3 = 160.21766208 GPa
+        bulk_modulus_ev_ang3 = bulk_modulus_GPa / 160.21766208
+        data_to_print[(element, configuration)] = (
+            min_volume, E0, bulk_modulus_GPa, bulk_deriv)
+        all_BM_fit_data[f'{element}-{configuration}'] = {
+            'min_volume': float(min_volume),
+            'E0': float(E0),
+            'bulk_modulus_ev_ang3': float(bulk_modulus_ev_ang3),
+            'bulk_deriv': float(bulk_deriv),
+            'residuals': float(residuals)
+        }
+        if residuals > 1.e-3:
+            warning_lines.append(f"WARNING! High fit residuals: {residuals} for {element} {configuration}")
 
-        try:
-            # I need to pass a numpy array
-            min_volume, E0, bulk_modulus_internal, bulk_deriv, residuals = BM(np.array(eos_data))
-            bulk_modulus_GPa = bulk_modulus_internal * echarge * 1.0e21
-            #1 eV/Angstrom3 = 160.21766208 GPa
-            bulk_modulus_ev_ang3 = bulk_modulus_GPa / 160.21766208
-            data_to_print[(structure.extras['element'], structure.extras['configuration'])] = (
-                min_volume, E0, bulk_modulus_GPa, bulk_deriv)
-            BM_fit_data = {
-                'min_volume': min_volume,
-                'E0': E0,
-                'bulk_modulus_ev_ang3': bulk_modulus_ev_ang3,
-                'bulk_deriv': bulk_deriv,
-                'residuals': residuals[0]
+    # Same format as `BM_fit_data` for the additional EOS forms, None where no fit was done or the fit failed
+    all_extra_fit_data = {}
+    for form in extra_eos_forms:
+        all_extra_fit_data[form] = {key: None for key in all_BM_fit_data}
+        for (element, configuration, _), min_volume, E0, bulk_modulus_internal, bulk_deriv, residuals, failed in zip(
+            systems_to_fit, *all_fit_results[form]):
+            if failed:
+                warning_lines.append(f"WARNING! Unable to fit {form} EOS for {element} {configuration}")
+                continue
+            bulk_modulus_ev_ang3 = bulk_modulus_internal * echarge * 1.0e21 / 160.21766208
+            all_extra_fit_data[form][f'{element}-{configuration}'] = {
+                'min_volume': float(min_volume),
+                'E0': float(E0),
+                'bulk_modulus_ev_ang3': float(bulk_modulus_ev_ang3),
+                'bulk_deriv': float(bulk_deriv),
+                'residuals': float(residuals)
             }
-            if residuals[0] > 1.e-3:
-                warning_lines.append(f"WARNING! High fit residuals: {residuals[0]} for {structure.extras['element']} {structure.extras['configuration']}")
-        except ValueError:
-            # If we cannot find a minimum
-            # Note that BM_fit_data was already set to None at the top
-            warning_lines.append(f"WARNING! Unable to fit for {structure.extras['element']} {structure.extras['configuration']}")
 
-        all_eos_data[f'{element}-{configuration}'] = eos_data
-        num_atoms_in_sim_cell[f'{element}-{configuration}'] = num_atoms
-        all_stress_data[f'{element}-{configuration}'] = stress_data
-        all_BM_fit_data[f'{element}-{configuration}'] = BM_fit_data
+    # Standard errors of the BM parameters, only for the systems with a successful BM fit
+    all_BM_fit_uncertainty = {}
+    if uncertainty and systems_to_fit:
+        loo_errors, bootstrap_errors, bootstrap_failed = BM_uncertainty(
+            volumes, energies, mask, num_bootstrap=bootstrap_samples)
+        for (element, configuration, _), loo_error, bootstrap_error, num_failed, failed in zip(
+            systems_to_fit, loo_errors, bootstrap_errors, bootstrap_failed, all_fit_results['BM'][5]):
+            if failed:
+                continue
+            # Same units as in `BM_fit_data`
+            bulk_modulus_error_factor = echarge * 1.0e21 / 160.21766208
+            all_BM_fit_uncertainty[f'{element}-{configuration}'] = {
+                'loo_std_error': {
+                    'min_volume': float(loo_error[0]),
+                    'bulk_modulus_ev_ang3': float(loo_error[1] * bulk_modulus_error_factor),
+                    'bulk_deriv': float(loo_error[2]),
+                },
+                'bootstrap_std_error': {
+                    'min_volume': float(bootstrap_error[0]),
+                    'bulk_modulus_ev_ang3': float(bootstrap_error[1] * bulk_modulus_error_factor),
+                    'bulk_deriv': float(bootstrap_error[2]),
+                },
+                'bootstrap_samples': bootstrap_samples,
+                'bootstrap_failed': int(num_failed),
+            }
+
+    # Joint energy and pressure fit, only for the systems with some stress data
+    all_BM_joint_fit_data = {}
+    if joint_stress and systems_to_fit:
+        pressures, pressure_mask = stack_stress_data(
+            [all_stress_data[f'{element}-{configuration}'] for element, configuration, _ in systems_to_fit],
+            max_points=volumes.shape[1])
+        # The codes use different sign conventions and units for the stresses: find the conversion of each
+        # system from the energy-only fit. All systems come from the same code, so only the most common
+        # conversion is kept, and the systems where it is ambiguous or different are skipped
+        BM_volume0, _, BM_bulk_modulus0, BM_bulk_deriv0, _, _ = all_fit_results['BM']
+        factors = stress_factor_batch(
+            volumes, pressures, BM_volume0, BM_bulk_modulus0, BM_bulk_deriv0, pressure_mask,
+            min_agreement=joint_min_agreement)
+        found_factors, counts = np.unique(factors[factors != 0.], return_counts=True)
+        if len(found_factors):
+            factors = np.where(factors == found_factors[np.argmax(counts)], factors, 0.)
+        ambiguous_systems = [
+            f'{element}-{configuration}' for (element, configuration, _), factor, has_stress in zip(
+                systems_to_fit, factors, pressure_mask.any(axis=1)) if has_stress and factor == 0.]
+        pressures = pressures * factors[:, None]
+        pressure_mask = pressure_mask & (factors != 0.)[:, None]
+        joint_fit_results = BM_joint_batch(
+            volumes, energies, pressures, mask, pressure_mask,
+            energy_sigma=joint_energy_sigma, pressure_sigma=joint_pressure_sigma)
+        joint_min_points, energy_min_points = BM_joint_point_reduction(
+            volumes, energies, pressures, mask, pressure_mask,
+            volume_tolerance=joint_volume_tolerance, bulk_modulus_tolerance=joint_bulk_modulus_tolerance,
+            energy_sigma=joint_energy_sigma, pressure_sigma=joint_pressure_sigma)
+        for (element, configuration, eos_data), min_volume, E0, bulk_modulus_internal, bulk_deriv, residuals, \
+                failed, num_joint, num_energy, has_stress in zip(
+                systems_to_fit, *joint_fit_results, joint_min_points, energy_min_points, pressure_mask.any(axis=1)):
+            if failed or not has_stress:
+                continue
+            bulk_modulus_ev_ang3 = bulk_modulus_internal * echarge * 1.0e21 / 160.21766208
+            all_BM_joint_fit_data[f'{element}-{configuration}'] = {
+                'min_volume': float(min_volume),
+                'E0': float(E0),
+                'bulk_modulus_ev_ang3': float(bulk_modulus_ev_ang3),
+                'bulk_deriv': float(bulk_deriv),
+                'residuals': float(residuals),
+                # Minimum number of volume points to get V0 and B0 within tolerance of the same fit with
+                # all points, fitting also the pressures (w.r.t. the joint fit) or only the energies
+                # (w.r.t. the energy-only fit); None if that fit with all points failed
+                'min_points_joint': int(num_joint) if num_joint else None,
+                'min_points_energy_only': int(num_energy) if num_energy else None,
+                'num_points': len(eos_data),
+            }
+        fit_data = [
+            item for item in all_BM_joint_fit_data.values()
+            if item['min_points_joint'] is not None and item['min_points_energy_only'] is not None]
+        if fit_data:
+            warning_lines.append("")
+            warning_lines.append(
+                f"Joint energy+stress fit: {len(fit_data)} systems, "
+                f"{sum(item['num_points'] - item['min_points_joint'] for item in fit_data)} volume points could be dropped "
+                f"(only {sum(item['num_points'] - item['min_points_energy_only'] for item in fit_data)} "
+                "fitting the energies only) for the same V0 and B0 accuracy w.r.t. the fit with all points")
+        if ambiguous_systems:
+            warning_lines.append("")
+            warning_lines.append(
+                f"Joint energy+stress fit skipped for {len(ambiguous_systems)} systems whose stresses do not agree "
+                f"with the energies in the sign convention and units of the other systems: "
+                f"{', '.join(sorted(ambiguous_systems))}")
 
     data = {
         'script_version': __version__,
-        'set_name': SET_NAME,
+        'set_name': set_name,
         # Mapping from strings like "He-X2O" to a dictionary with the UUIDs of the structure and the EOS workflow
         'uuid_mapping': uuid_mapping,
         # A list of dictionaries with information on the workchains that did not finish with a 0 exit code
@@ -257,6 +506,21 @@ if __name__ == "__main__":
         'BM_fit_data': all_BM_fit_data,
         'num_atoms_in_sim_cell': num_atoms_in_sim_cell
     }
+    # Fit data for the additional EOS forms, if requested (same keys as `BM_fit_data`)
+    for form, fit_data in all_extra_fit_data.items():
+        data[f'{form}_fit_data'] = fit_data
+    if uncertainty:
+        # Standard errors of the BM fit parameters (same keys and units as in `BM_fit_data`), from all the
+        # leave-one-out refits and from bootstrap resamples of the E(V) points. NaN if less than 2 refits succeeded.
+        data['BM_fit_uncertainty'] = all_BM_fit_uncertainty
+    if joint_stress:
+        # Birch-Murnaghan fit to both energies and pressures (same keys as `BM_fit_data`, plus the number
+        # of volume points needed for the same V0 and B0 accuracy). Only for systems with stress data.
+        data['BM_joint_fit_data'] = all_BM_joint_fit_data
+    if include_running:
+        # Systems whose EOS workflow is still running, fitted with the volumes completed so far (all their data
+        # and fits are provisional). Dictionary with the number of completed volumes and of volumes.
+        data['provisional'] = provisional
 
     # Print some statistics on the results
     warning_lines.append("")
@@ -271,16 +535,308 @@ if __name__ == "__main__":
             f"({'<' if system['side'] == 'left' else '>'})"
         )
 
-    fname = f"outputs/warnings-{SET_NAME}-{PLUGIN_NAME}.txt"
-    with open(fname, 'w') as fhandle:
-        for line in warning_lines:
-            fhandle.write(f"{line}\n")
-            print(line)
+    return data, warning_lines
+
+
+def stream_results(stream_fname, set_name, records, previous_index, fit_cache, workers=1, chunk_size=100,
+                   per_node=False, extra_eos_forms=(), include_running=False):
+    """
+    Extract and fit the given workflows one chunk at a time, writing the results of each system to an
+    NDJSON stream (see `eos_utils.results_stream`) as soon as its chunk is fitted. See `extract_from_profile`
+    and `process_results` for the parameters.
+
+    Only the sections fitted with `fit_cache` are streamed (i.e. not the uncertainties nor the joint fits,
+    which are only computed for the final results): fitting the final results with the same cache does not
+    fit any curve again.
+
+    :return: the dictionary workflow PK -> raw data of all the workflows.
+    """
+    from eos_utils.results_stream import ResultsStreamWriter, split_results
+
+    raw_data = {}
+    with ResultsStreamWriter(stream_fname, __version__, set_name, extra_eos_forms, include_running) as stream:
+        for chunk_records, chunk_raw_data in iter_extracted_chunks(
+                records, previous_index, workers=workers, chunk_size=chunk_size, per_node=per_node,
+                include_running=include_running):
+            raw_data.update(chunk_raw_data)
+            chunk_data, _ = process_results(
+                set_name, chunk_records, chunk_raw_data, extra_eos_forms=extra_eos_forms, fit_cache=fit_cache,
+                include_running=include_running)
+            for record in split_results(chunk_data):
+                stream.write_system(record)
+    return raw_data
+
+
+def write_atomically(fname, content):
+    """Write `content` to the file `fname`, replacing it atomically (readers never see a partially written file)."""
+    with open(f'{fname}.tmp', 'w') as fhandle:
+        fhandle.write(content)
+    os.replace(f'{fname}.tmp', fname)
+
+
+def write_results(data, warning_lines, set_name, plugin_name):
+    """
+    Print the warnings and write them and the results to the `outputs` folder.
+
+    :return: the list of the names of the files written.
+    """
+    os.makedirs('outputs', exist_ok=True)
+    fname = f"outputs/warnings-{set_name}-{plugin_name}.txt"
+    for line in warning_lines:
+        print(line)
+    write_atomically(fname, "".join(f"{line}\n" for line in warning_lines))
     print(f"Warning log written to: '{fname}'.")
 
     # Output results to file
-    os.makedirs('outputs', exist_ok=True)
-    fname = f"outputs/results-{SET_NAME}-{PLUGIN_NAME}.json"
-    with open(fname, 'w') as fhandle:
-        json.dump(data, fhandle, indent=2, sort_keys=True)
-    print(f"Output results written to: '{fname}'.")
+    results_fname = f"outputs/results-{set_name}-{plugin_name}.json"
+    write_atomically(results_fname, json.dumps(data, indent=2, sort_keys=True))
+    print(f"Output results written to: '{results_fname}'.")
+    return [results_fname, fname]
+
+
+def regenerate_plots(set_name, plugin_name, systems):
+    """Regenerate only the EOS plots of the given systems (e.g. `Ag-X/FCC`), with `outputs/generate_plots.py`."""
+    subprocess.run(
+        [sys.executable, 'generate_plots.py', set_name, '--plugin-name', plugin_name, '--systems', *systems],
+        cwd='outputs', check=False)
+
+
+def get_plugin_name():
+    file_name = os.path.join(
+        os.path.dirname(os.path.realpath(__file__)),
+        os.pardir, 'plugin_name.txt'
+    )
+    try:
+        with open(file_name) as fhandle:
+            plugin_name = fhandle.read().strip()
+            # Simple check e.g. to make sure there are no weird characters,
+            # newlines, ... - one might still make a typo, but at least we
+            # do a basic check
+            assert plugin_name.isidentifier()
+        return plugin_name
+    except FileNotFoundError as exc:
+        raise FileNotFoundError(
+            "You need to define a file `../plugin_name.txt`, containing the "
+            "name of your plugin (siesta, quantum_espresso, ...) in the format "
+            "expected by the aiida-common-workflows project"
+        ) from exc
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Extract and fit the EOS results of a set.")
+    parser.add_argument(
+        "set_name", help="The set name, e.g. oxides-verification-PBE-v1 or unaries-verification-PBE-v1")
+    parser.add_argument(
+        "eos_forms", nargs="*", metavar="EOS_FORM",
+        help="Additional EOS forms to fit on top of Birch-Murnaghan, their results are stored under "
+             f"`<form>_fit_data`. Choose among: {', '.join(form for form in EOS_FORMS if form != 'BM')}")
+    parser.add_argument(
+        "--uncertainty", action="store_true",
+        help="Also estimate the standard errors of the Birch-Murnaghan parameters, from leave-one-out "
+             "and bootstrap refits; they are stored under `BM_fit_uncertainty`")
+    parser.add_argument(
+        "--bootstrap-samples", type=int, default=200,
+        help="Number of bootstrap resamples per system for --uncertainty (default: %(default)s)")
+    parser.add_argument(
+        "--fit-cache", nargs="?", const="outputs/eos-fit-cache.sqlite", default=None, metavar="PATH",
+        help="Reuse the EOS fits of previous runs (with the same script version) stored in an on-disk cache, "
+             "and store the new ones (default path if no PATH is given: %(const)s)")
+    parser.add_argument(
+        "--joint-stress", action="store_true",
+        help="Also fit the Birch-Murnaghan EOS jointly to the energies and to the pressures from the stresses "
+             "(stored under `BM_joint_fit_data`), and report how many volume points could be dropped")
+    parser.add_argument(
+        "--joint-energy-sigma", type=float, default=1.e-4, metavar="EV",
+        help="Estimated noise of the total energies in the --joint-stress fit, in eV (default: %(default)s)")
+    parser.add_argument(
+        "--joint-pressure-sigma", type=float, default=1.e-4, metavar="EV_ANG3",
+        help="Estimated noise of the pressures in the --joint-stress fit, in eV/ang^3 (default: %(default)s, "
+             "i.e. ~0.016 GPa); only the ratio of the two sigmas changes the fit")
+    parser.add_argument(
+        "--joint-tolerances", type=float, nargs=2, default=[1.e-4, 1.e-3], metavar=("V0", "B0"),
+        help="Relative tolerances on V0 and B0 for the number of volume points that could be dropped with "
+             "--joint-stress (default: %(default)s, about half of the median FLEUR-WIEN2k differences)")
+    parser.add_argument(
+        "--joint-min-agreement", type=float, default=0.5,
+        help="With --joint-stress, skip the systems whose pressures agree less than this (between 0 and 1) with "
+             "those of the energy-only fit, whatever the sign convention of the stresses (default: %(default)s)")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Number of worker processes extracting the data of the workflows in parallel (default: %(default)s)")
+    parser.add_argument(
+        "--chunk-size", type=int, default=100,
+        help="Number of workflows per chunk of work with --workers (default: %(default)s)")
+    parser.add_argument(
+        "--incremental", action="store_true",
+        help="Keep an index of the extracted workflows in `outputs/extraction-index-<SET_NAME>-<PLUGIN_NAME>.json`, "
+             "and only extract again the workflows whose state or modification time changed since the last run")
+    parser.add_argument(
+        "--per-node", action="store_true",
+        help="Load the outputs of the workflows node by node instead of with bulk projected queries (much slower)")
+    parser.add_argument(
+        "--archive", metavar="PATH",
+        help="Read the workflows directly from an exported .aiida archive (e.g. from `4-export/export_results.sh`) "
+             "instead of from the AiiDA profile; no profile is needed, run the script with `python`")
+    parser.add_argument(
+        "--include-running", action="store_true",
+        help="Also fit the workflows that are still running, if at least 80%% of their volumes are completed; "
+             "these systems are listed under `provisional`")
+    parser.add_argument(
+        "--watch", action="store_true",
+        help="Keep polling the workflows group and update the results each time some workflows terminate "
+             "(stop with Ctrl+C); fits are cached, so only the new curves are fitted")
+    parser.add_argument(
+        "--watch-interval", type=float, nargs=2, default=[30., 960.], metavar=("MIN", "MAX"),
+        help="Minimum and maximum time in seconds between two polls in --watch mode: the interval doubles "
+             "every time nothing changed, and is reset to the minimum when something changed (default: %(default)s)")
+    parser.add_argument(
+        "--watch-plots", action="store_true",
+        help="In --watch mode, also regenerate the EOS plots (with `outputs/generate_plots.py`) of the systems "
+             "whose workflows terminated")
+    parser.add_argument(
+        "--stream", action="store_true",
+        help="Also write the results of each system, as soon as its chunk of --chunk-size workflows is extracted and "
+             "fitted, to the NDJSON stream `outputs/results-<SET_NAME>-<PLUGIN_NAME>.ndjson` (that e.g. "
+             "`outputs/generate_plots.py --follow` can read while the extraction is running)")
+    parser.add_argument(
+        "--compact-stream", action="store_true",
+        help="Only write the results file from the NDJSON stream of a previous --stream run (e.g. if it was "
+             "interrupted); no profile is needed, run the script with `python`")
+    parser.add_argument(
+        "--plugin-name",
+        help="The plugin name (default: read from `../plugin_name.txt`), e.g. to extract the archive of another code")
+    args = parser.parse_args()
+    for form in args.eos_forms:
+        if form not in EOS_FORMS:
+            parser.error(f"invalid EOS form '{form}'")
+    if args.workers < 1 or args.chunk_size < 1:
+        parser.error("--workers and --chunk-size must be positive")
+    if args.archive and (args.incremental or args.workers > 1 or args.per_node):
+        parser.error("--archive cannot be combined with --incremental, --workers or --per-node")
+    if args.archive and args.watch:
+        parser.error("--archive cannot be combined with --watch")
+    if args.stream and (args.archive or args.watch):
+        parser.error("--stream cannot be combined with --archive or --watch")
+    if not 0 < args.watch_interval[0] <= args.watch_interval[1]:
+        parser.error("--watch-interval needs 0 < MIN <= MAX")
+    PLUGIN_NAME = args.plugin_name or get_plugin_name()
+
+    SET_NAME = args.set_name
+    options = {
+        # Birch-Murnaghan is always fitted
+        'extra_eos_forms': [form for form in args.eos_forms if form != 'BM'],
+        'uncertainty': args.uncertainty,
+        'bootstrap_samples': args.bootstrap_samples,
+        'joint_stress': args.joint_stress,
+        'joint_energy_sigma': args.joint_energy_sigma,
+        'joint_pressure_sigma': args.joint_pressure_sigma,
+        'joint_volume_tolerance': args.joint_tolerances[0],
+        'joint_bulk_modulus_tolerance': args.joint_tolerances[1],
+        'joint_min_agreement': args.joint_min_agreement,
+        'include_running': args.include_running,
+    }
+
+    STRUCTURES_GROUP_LABEL = f'acwf-verification/{SET_NAME}/structures/{PLUGIN_NAME}'
+    WORKFLOWS_GROUP_LABEL = f'acwf-verification/{SET_NAME}/workflows/{PLUGIN_NAME}'
+
+    if args.compact_stream:
+        # Nothing is imported from AiiDA in this case
+        from eos_utils.results_stream import compact_stream
+        stream_fname = f"outputs/results-{SET_NAME}-{PLUGIN_NAME}.ndjson"
+        data, complete = compact_stream(stream_fname)
+        if not complete:
+            print(f"WARNING! The stream '{stream_fname}' is incomplete: only {len(data['uuid_mapping'])} systems are included.")
+        fname = f"outputs/results-{SET_NAME}-{PLUGIN_NAME}.json"
+        write_atomically(fname, json.dumps(data, indent=2, sort_keys=True))
+        print(f"Output results written to: '{fname}'.")
+        sys.exit(0)
+
+    if args.watch:
+        index_fname = f"outputs/extraction-index-{SET_NAME}-{PLUGIN_NAME}.json"
+        index = load_extraction_index(index_fname) if args.incremental else {}
+        if args.fit_cache:
+            os.makedirs(os.path.dirname(args.fit_cache) or '.', exist_ok=True)
+        # Without --fit-cache, the fits are cached in memory for the duration of the watch
+        fit_cache = EOSFitCache(args.fit_cache or ':memory:', version=__version__)
+        interval = args.watch_interval[0]
+        is_first_poll = True
+        try:
+            while True:
+                records, raw_data, records_to_extract = extract_from_profile(
+                    WORKFLOWS_GROUP_LABEL, index, workers=args.workers, chunk_size=args.chunk_size,
+                    per_node=args.per_node, include_running=args.include_running)
+                # Workflows that are still running are extracted again at every poll (their mtime changes),
+                # but only those that terminated since the last poll have new data (or, with --include-running,
+                # those with new completed volumes)
+                terminated = [record for record in records_to_extract if record['process_state'] in TERMINATED_STATES]
+                updated = [
+                    record for record in records_to_extract
+                    if record['process_state'] in TERMINATED_STATES
+                    or index.get(record['uuid'], {}).get('raw_data') != raw_data.get(record['pk'])
+                ]
+                index = get_extraction_index(records, raw_data)
+                if updated or is_first_poll:
+                    data, warning_lines = process_results(SET_NAME, records, raw_data, fit_cache=fit_cache, **options)
+                    write_results(data, warning_lines, SET_NAME, PLUGIN_NAME)
+                    if args.incremental:
+                        save_extraction_index(index_fname, records, raw_data)
+                    if args.watch_plots and updated:
+                        regenerate_plots(
+                            SET_NAME, PLUGIN_NAME, [f"{record['element']}-{record['configuration']}" for record in updated])
+                    interval = args.watch_interval[0]
+                else:
+                    interval = min(2 * interval, args.watch_interval[1])
+                is_first_poll = False
+                num_terminated = len([record for record in records if record['process_state'] in TERMINATED_STATES])
+                print(
+                    f"[{time.strftime('%Y-%m-%d %H:%M:%S')}] {len(terminated)} workflows terminated since the "
+                    f"last poll ({num_terminated}/{len(records)} in total), next poll in {interval:.0f} s.")
+                time.sleep(interval)
+        except KeyboardInterrupt:
+            print("Stopped watching.")
+        finally:
+            fit_cache.close()
+        sys.exit(0)
+
+    start_time = time.time()
+    fit_cache = None
+    if args.fit_cache:
+        os.makedirs(os.path.dirname(args.fit_cache) or '.', exist_ok=True)
+        fit_cache = EOSFitCache(args.fit_cache, version=__version__)
+    elif args.stream:
+        # The curves fitted for the stream are not fitted again for the final results
+        fit_cache = EOSFitCache(':memory:', version=__version__)
+    if args.archive:
+        # Nothing is imported from AiiDA in this case
+        from eos_utils.archive import read_archive
+        records, raw_data = read_archive(args.archive, WORKFLOWS_GROUP_LABEL, include_running=args.include_running)
+        records_to_extract = records
+    else:
+        # In incremental mode, only extract the workflows that are new or changed since the last run
+        index_fname = f"outputs/extraction-index-{SET_NAME}-{PLUGIN_NAME}.json"
+        previous_index = load_extraction_index(index_fname) if args.incremental else {}
+        if args.stream:
+            from eos_utils.extraction import get_workflow_records
+            records = get_workflow_records(WORKFLOWS_GROUP_LABEL)
+            stream_fname = f"outputs/results-{SET_NAME}-{PLUGIN_NAME}.ndjson"
+            os.makedirs('outputs', exist_ok=True)
+            raw_data = stream_results(
+                stream_fname, SET_NAME, records, previous_index, fit_cache, workers=args.workers,
+                chunk_size=args.chunk_size, per_node=args.per_node, extra_eos_forms=options['extra_eos_forms'],
+                include_running=args.include_running)
+            records_to_extract = get_records_to_extract(records, previous_index, include_running=args.include_running)
+            print(f"Results streamed to: '{stream_fname}'.")
+        else:
+            records, raw_data, records_to_extract = extract_from_profile(
+                WORKFLOWS_GROUP_LABEL, previous_index, workers=args.workers, chunk_size=args.chunk_size,
+                per_node=args.per_node, include_running=args.include_running)
+        if args.incremental:
+            os.makedirs('outputs', exist_ok=True)
+            save_extraction_index(index_fname, records, raw_data)
+    print(f"Data of {len(records_to_extract)}/{len(records)} workflows extracted in {time.time() - start_time:.1f} s.")
+
+    try:
+        data, warning_lines = process_results(SET_NAME, records, raw_data, fit_cache=fit_cache, **options)
+    finally:
+        if fit_cache is not None:
+            fit_cache.close()
+    write_results(data, warning_lines, SET_NAME, PLUGIN_NAME)
@@ -6,7 +6,6 @@ import sys
 import numpy as np
 import pylab as pl
 from scipy.optimize import curve_fit
-import tqdm
 
 import quantities_for_comparison as qc
 
@@ -44,7 +43,7 @@ DEFAULT_PREFACTOR = 100
 DEFAULT_wb0 = 1.0/20.0  
 DEFAULT_wb1 = 1.0/400.0
 
-EXPECTED_SCRIPT_VERSION = ["0.0.3","0.0.4"]
+EXPECTED_SCRIPT_VERSION = ["0.0.3","0.0.4","0.0.5","0.0.6"]
 
 
 def gaussian(x, a, x0, sigma):
@@ -137,14 +136,12 @@ if __name__ == "__main__":
     
     for index, compare_plugin in enumerate(compare_plugin_data):
 
-        collect = []
+        # Collect the parameters of all systems, and compute the quantity for all of them with one call
+        ref_params = []
+        compare_params = []
 
         print(f"comparing with {all_args[index]}")
-        progress_bar = tqdm.tqdm(sorted(all_systems))
-        for element_and_configuration in progress_bar:
-            progress_bar.set_description(f"{element_and_configuration:12s}")
-            progress_bar.refresh()
-
+        for element_and_configuration in sorted(all_systems):
             element, configuration = element_and_configuration.split('-')
             # Get the data for the reference plugin
             ref_BM_fit_data = reference_plugin_data['BM_fit_data'][f'{element}-{configuration}']
@@ -157,10 +154,6 @@ if __name__ == "__main__":
                     element, configuration
                 )
 
-            V0=ref_BM_fit_data['min_volume']/scaling_factor_ref
-            B0=ref_BM_fit_data['bulk_modulus_ev_ang3']
-            B01=ref_BM_fit_data['bulk_deriv']
-
             # Get the data for the compare_with plugin, if specified (and if the EOS worked for the 
             # reference plugin, otherwise we don't know which E0 to use)
             try:
@@ -181,13 +174,20 @@ if __name__ == "__main__":
                     element, configuration
                 )
 
-            CV0=compare_BM_fit_data['min_volume']/scaling_factor_comp
-            CB0=compare_BM_fit_data['bulk_modulus_ev_ang3']
-            CB01=compare_BM_fit_data['bulk_deriv']
-
-            quant = quantity_for_comparison_map[QUANTITY](V0,B0,B01,CV0,CB0,CB01,DEFAULT_PREFACTOR,DEFAULT_wb0,DEFAULT_wb1)
-
-            collect.append(quant)
+            ref_params.append((
+                ref_BM_fit_data['min_volume']/scaling_factor_ref,
+                ref_BM_fit_data['bulk_modulus_ev_ang3'],
+                ref_BM_fit_data['bulk_deriv']
+            ))
+            compare_params.append((
+                compare_BM_fit_data['min_volume']/scaling_factor_comp,
+                compare_BM_fit_data['bulk_modulus_ev_ang3'],
+                compare_BM_fit_data['bulk_deriv']
+            ))
+
+        V0, B0, B01 = np.array(ref_params).T
+        CV0, CB0, CB01 = np.array(compare_params).T
+        collect = quantity_for_comparison_map[QUANTITY](V0,B0,B01,CV0,CB0,CB01,DEFAULT_PREFACTOR,DEFAULT_wb0,DEFAULT_wb1).tolist()
 
         mini = min(collect)
 
@@ -1,3 +1,12 @@
+"""
+Quantities to compare two EOS fits.
+
+All comparison functions (`delta`, `epsilon`, `nu`, `V0_rel_diff`, ...) share the same
+signature and are written with NumPy operations only: `v0w, b0w, b1w, v0f, b0f, b1f`
+can be either scalars or NumPy arrays of any (broadcastable) shape, in which case an array
+with one value per system is returned. It is therefore much faster to collect the fit
+parameters of all systems first, and call the function once.
+"""
 import numpy as np
 
 def get_num_atoms_in_formula_unit(configuration):
@@ -231,7 +240,7 @@ def epsilon(v0w, b0w, b1w, v0f, b0f, b1f, prefact, weight_b0, weight_b1):
 
     intdiff2 = intE12sq(v0w,b0w,b1w,v0f,b0f,b1f,Vi,Vf)
     Eavg1 = intEdV(v0w,b0w,b1w,Vi,Vf)/deltaV
-    Eavg2 = intEdV(v0w,b0w,b1w,Vi,Vf)/deltaV
+    Eavg2 = intEdV(v0f,b0f,b1f,Vi,Vf)/deltaV
     int3 = intE2dV(v0w,b0w,b1w,Vi,Vf) - \
             2*Eavg1*intEdV(v0w,b0w,b1w,Vi,Vf) + \
             deltaV*Eavg1**2 # integrate (ene - mean(ene))**2
@@ -241,11 +250,10 @@ def epsilon(v0w, b0w, b1w, v0f, b0f, b1f, prefact, weight_b0, weight_b1):
     eps2 = intdiff2/np.sqrt(int3*int4)
 
     #We saw a case when, for numerical error, intdiff2 was negative
-    #(about -1*10^{-13}). For this reason, we add a safty check.
-    if eps2 < 0.0:
-        print(f"eps2 = {eps2}, negative due to numerical error probably, we take the absolute value")
-        eps2 = abs(eps2)
-    
+    #(about -1*10^{-13}). For this reason, we add a safty check
+    #(written with np.where, so that it also works element-wise on arrays).
+    eps2 = np.where(eps2 < 0.0, -eps2, eps2)
+
     return np.sqrt(eps2)*prefact
 
 
@@ -303,3 +311,101 @@ def nu(v0w, b0w, b1w, v0f, b0f, b1f, prefact, weight_b0, weight_b1):
     B1err =  2*(b1w-b1f)/(b1w+b1f)
     leng = np.sqrt(V0err**2+(weight_b0*B0err)**2+(weight_b1*B1err)**2)
     return leng*prefact
+
+def bm_polynomial_coefficients(V0, B0, B0pr):
+    """
+    Return the coefficients [a0, a1, a2, a3] of the Birch Murnaghan E(V) (with E0=0)
+    written as a polynomial in V**(-2/3): E(V) = sum_n a_n * V**(-2n/3).
+    """
+    return [
+        9. * V0 * B0 / 16. * (6. - B0pr),
+        9. * V0**(5. / 3.) * B0 / 16. * (3. * B0pr - 16.),
+        9. * V0**(7. / 3.) * B0 / 16. * (14. - 3. * B0pr),
+        9. * V0**3. * B0 / 16. * (B0pr - 4.),
+    ]
+
+def _polynomial_product(coeffs1, coeffs2):
+    """Coefficients of the product of two polynomials, given as lists of (array) coefficients."""
+    product = [0.] * (len(coeffs1) + len(coeffs2) - 1)
+    for idx1, coeff1 in enumerate(coeffs1):
+        for idx2, coeff2 in enumerate(coeffs2):
+            product[idx1 + idx2] = product[idx1 + idx2] + coeff1 * coeff2
+    return product
+
+def _volume_moments(V1, V2, max_power):
+    """
+    Return the integrals of V**(-2n/3) in dV between volumes V1 and V2, for n = 0..max_power.
+    """
+    moments = []
+    for n in range(max_power + 1):
+        exponent = -(2. * n - 3.) / 3.
+        moments.append((V2**exponent - V1**exponent) / exponent)
+    return moments
+
+COMPARE_ALL_FIELDS = [
+    'delta', 'delta_over_b0', 'epsilon', 'nu', 'rel_errors_vec_length_unsquared',
+    'V0_rel_diff', 'B0_rel_diff', 'B1_rel_diff'
+]
+
+def compare_all(v0w, b0w, b1w, v0f, b0f, b1f, prefact, weight_b0, weight_b1):
+    """
+    Compute all the comparison measures in a single pass.
+
+    The integration window, the polynomial coefficients of the two Birch Murnaghan curves
+    (in powers of V**(-2/3)), the integrals of the powers of V over the window and the relative
+    errors are computed only once, and shared among all measures.
+    Inputs can be scalars or NumPy arrays (of broadcastable shapes), as for the individual functions.
+
+    Return a NumPy structured array with fields `COMPARE_ALL_FIELDS` (named as the corresponding
+    functions); for each field, the value is the same as the one returned by the function with
+    the same name and the same arguments (up to round-off).
+    """
+    v0w, b0w, b1w, v0f, b0f, b1f = np.broadcast_arrays(
+        *(np.asarray(value, dtype=float) for value in (v0w, b0w, b1w, v0f, b0f, b1f)))
+
+    # volume range
+    Vi = 0.94 * (v0w + v0f) / 2.
+    Vf = 1.06 * (v0w + v0f) / 2.
+    deltaV = Vf - Vi
+    moments = _volume_moments(Vi, Vf, max_power=6)
+
+    coeffs_w = bm_polynomial_coefficients(v0w, b0w, b1w)
+    coeffs_f = bm_polynomial_coefficients(v0f, b0f, b1f)
+    coeffs_diff = [coeff_w - coeff_f for coeff_w, coeff_f in zip(coeffs_w, coeffs_f)]
+
+    def integrate(coeffs):
+        return sum(coeff * moment for coeff, moment in zip(coeffs, moments))
+
+    # integral of (E1(V) - E2(V))**2
+    intdiff2 = integrate(_polynomial_product(coeffs_diff, coeffs_diff))
+    # integrals of E and E**2 for both curves
+    intEw = integrate(coeffs_w)
+    intEf = integrate(coeffs_f)
+    intE2w = integrate(_polynomial_product(coeffs_w, coeffs_w))
+    intE2f = integrate(_polynomial_product(coeffs_f, coeffs_f))
+    # integrate (ene - mean(ene))**2
+    int3 = intE2w - intEw**2 / deltaV
+    int4 = intE2f - intEf**2 / deltaV
+
+    delta_value = 1000. * np.sqrt(intdiff2 / deltaV)
+    eps2 = intdiff2 / np.sqrt(int3 * int4)
+    # Same safety check as in `epsilon` for negative values due to numerical errors
+    eps2 = np.where(eps2 < 0.0, -eps2, eps2)
+
+    V0err = 2*(v0w-v0f)/(v0w+v0f)
+    B0err = 2*(b0w-b0f)/(b0w+b0f)
+    B1err = 2*(b1w-b1f)/(b1w+b1f)
+
+    results = np.empty(v0w.shape, dtype=[(field, float) for field in COMPARE_ALL_FIELDS])
+    # As in `delta` and `delta_over_b0`, the prefactor is not used for Delta
+    results['delta'] = delta_value
+    results['delta_over_b0'] = delta_value / ((b0w+b0f)/2.)
+    results['epsilon'] = np.sqrt(eps2)*prefact
+    results['nu'] = np.sqrt(V0err**2+(weight_b0*B0err)**2+(weight_b1*B1err)**2)*prefact
+    results['rel_errors_vec_length_unsquared'] = np.sqrt(
+        V0err**2+weight_b0*(B0err)**2+weight_b1*(B1err)**2)*prefact
+    results['V0_rel_diff'] = prefact*V0err
+    results['B0_rel_diff'] = prefact*B0err
+    results['B1_rel_diff'] = prefact*B1err
+
+    return results
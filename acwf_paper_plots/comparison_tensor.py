@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+"""
+Dense comparison tensor of all methods against all methods, for all systems.
+
+The tensor has shape `[n_codes, n_codes, n_systems, n_measures]`, where the entry
+`[i, j, k, m]` is the measure `m` computed for system `k` between code `i` (passed as
+first set of parameters, i.e. `v0w, b0w, b1w`) and code `j`. Entries are NaN if
+the fit is missing for either of the two codes.
+
+The tensor is computed in a single vectorized pass (see `quantities_for_comparison.compare_all`),
+in chunks over the first code axis to cap the memory of the intermediate arrays.
+It can be dumped to (and loaded from) a `.npz` file, so that every pairwise figure
+only needs to slice it.
+
+Run it as a script to dump the tensor for both unaries and oxides:
+
+    python -m acwf_paper_plots.comparison_tensor [LABELS_KEY] [OUTPUT_FILE]
+"""
+import os
+import sys
+
+import numpy as np
+
+import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.results_cube import PARAMETERS, SYSTEMS, build_results_cube
+from acwf_paper_plots.results_repository import REFERENCE_LABEL, ResultsRepository
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'code-data')
+SET_NAMES = ['unaries', 'oxides']
+
+DEFAULT_wb0 = 1.0/20.0
+DEFAULT_wb1 = 1.0/400.0
+# Default prefactor if not indicated: 1.
+PREFACTOR_DICT = {'nu': 100.}
+
+# Field of the output of `qc.compare_all` for each measure (as named in the figure scripts),
+# and whether to take the absolute value
+compare_all_field_map = {
+    "delta_per_formula_unit": ("delta", False),
+    "delta_per_formula_unit_over_b0": ("delta_over_b0", False),
+    "B0_rel_diff": ("B0_rel_diff", False),
+    "V0_rel_diff": ("V0_rel_diff", False),
+    "B1_rel_diff": ("B1_rel_diff", False),
+    "abs_V0_rel_diff": ("V0_rel_diff", True),
+    "abs_B0_rel_diff": ("B0_rel_diff", True),
+    "abs_B1_rel_diff": ("B1_rel_diff", True),
+    "nu": ("nu", False),
+    "epsilon": ("epsilon", False),
+}
+MEASURES = [
+    "epsilon", "nu", "delta_per_formula_unit", "delta_per_formula_unit_over_b0",
+    "V0_rel_diff", "B0_rel_diff", "B1_rel_diff",
+]
+# Columns of the parameters of `results_cube` used by the measures: V0, B0 and B1
+PARAMETER_COLUMNS = [PARAMETERS.index(parameter) for parameter in ('V0', 'B0', 'B1')]
+
+# Default maximum number of (code, code, system) entries computed at once
+DEFAULT_CHUNK_ELEMENTS = 2_000_000
+
+
+def load_parameters(labels_key='methods-main', set_names=SET_NAMES, data_folder=DATA_FOLDER, include_reference=True):
+    """
+    Load the Birch-Murnaghan parameters of all methods listed under `labels_key` in `labels.json`.
+
+    :return: a tuple `(code_labels, systems, params)`, where `systems` is the list of the canonical
+        system keys of `results_cube.SYSTEMS` (e.g. `Ag-X/FCC`, `Ag-XO`), and `params` is a float array
+        of shape `[n_codes, n_systems, 3]` with V0 (per formula unit), B0 (in eV/ang^3) and B1;
+        it is NaN where the fit is missing.
+    """
+    # The all-electron average reference is added as an additional 'code'
+    cube = build_results_cube(
+        set_names=set_names, labels_key=labels_key, include_reference=include_reference,
+        results_repository=ResultsRepository(data_folder, labels_key=labels_key))
+    return cube.code_labels, SYSTEMS, cube.values[..., PARAMETER_COLUMNS]
+
+
+def build_comparison_tensor(params, measures=MEASURES, prefactors=None, weight_b0=DEFAULT_wb0,
+                            weight_b1=DEFAULT_wb1, chunk_elements=DEFAULT_CHUNK_ELEMENTS):
+    """
+    Compute all measures for all pairs of codes and all systems.
+
+    :param params: array of shape `[n_codes, n_systems, 3]` with V0, B0, B1 (NaN if missing),
+        e.g. as returned by `load_parameters`.
+    :param measures: list of measure names (keys of `compare_all_field_map`, default: `MEASURES`).
+    :param prefactors: dictionary measure -> prefactor (default: `PREFACTOR_DICT`, 1 if not present).
+    :param chunk_elements: maximum number of (code, code, system) entries evaluated at once;
+        the first code axis is split in chunks accordingly.
+    :return: array of shape `[n_codes, n_codes, n_systems, n_measures]`.
+    """
+    if prefactors is None:
+        prefactors = PREFACTOR_DICT
+    params = np.asarray(params, dtype=float)
+    n_codes, n_systems, _ = params.shape
+
+    tensor = np.full((n_codes, n_codes, n_systems, len(measures)), np.nan)
+    rows_per_chunk = max(1, chunk_elements // max(1, n_codes * n_systems))
+
+    # The second code of the pair is the same for all chunks
+    v0f, b0f, b1f = (params[None, :, :, idx] for idx in range(3))
+    for start in range(0, n_codes, rows_per_chunk):
+        stop = min(start + rows_per_chunk, n_codes)
+        v0w, b0w, b1w = (params[start:stop, None, :, idx] for idx in range(3))
+        # Missing data is NaN and just propagates
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # All measures in one pass; prefactors are applied afterwards
+            all_measures = qc.compare_all(v0w, b0w, b1w, v0f, b0f, b1f, 1., weight_b0, weight_b1)
+        for measure_idx, measure in enumerate(measures):
+            field, take_abs = compare_all_field_map[measure]
+            values = all_measures[field] * prefactors.get(measure, 1.)
+            tensor[start:stop, :, :, measure_idx] = np.abs(values) if take_abs else values
+
+    return tensor
+
+
+def save_comparison_tensor(fname, tensor, code_labels, systems, measures=MEASURES):
+    """Dump the tensor, together with the labels of its axes, to a (compressed) `.npz` file."""
+    np.savez_compressed(
+        fname,
+        tensor=tensor,
+        code_labels=np.array(code_labels),
+        systems=np.array(systems),
+        measures=np.array(measures),
+    )
+
+
+def load_comparison_tensor(fname):
+    """
+    Load a tensor written by `save_comparison_tensor`.
+
+    :return: a dictionary with keys `tensor`, `code_labels`, `systems` and `measures`
+        (the last three as lists of strings).
+    """
+    with np.load(fname) as data:
+        return {
+            'tensor': data['tensor'],
+            'code_labels': data['code_labels'].tolist(),
+            'systems': data['systems'].tolist(),
+            'measures': data['measures'].tolist(),
+        }
+
+
+def get_pair_values(tensor_data, code_label, reference_label, measure):
+    """
+    Return a dictionary system -> value of `measure` for `code_label` vs. `reference_label`,
+    skipping systems where either fit is missing.
+
+    `tensor_data` is a dictionary as returned by `load_comparison_tensor`.
+    """
+    values = tensor_data['tensor'][
+        tensor_data['code_labels'].index(code_label),
+        tensor_data['code_labels'].index(reference_label),
+        :,
+        tensor_data['measures'].index(measure)
+    ]
+    return {
+        system: value for system, value in zip(tensor_data['systems'], values.tolist())
+        if not np.isnan(value)
+    }
+
+
+if __name__ == "__main__":
+    LABELS_KEY = sys.argv[1] if len(sys.argv) > 1 else 'methods-main'
+    OUTPUT_FILE = sys.argv[2] if len(sys.argv) > 2 else f'comparison-tensor-{LABELS_KEY}.npz'
+
+    code_labels, systems, params = load_parameters(LABELS_KEY)
+    tensor = build_comparison_tensor(params)
+    save_comparison_tensor(OUTPUT_FILE, tensor, code_labels, systems)
+    print(f"Tensor of shape {tensor.shape} ({len(code_labels)} codes, {len(systems)} systems, "
+          f"{len(MEASURES)} measures) written to: '{OUTPUT_FILE}'.")
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+"""
+Persistent cache of the comparison measures between two results files, shared by all figure scripts.
+
+The measures (the fields of `qc.compare_all`: `epsilon`, `nu`, `delta`, `V0_rel_diff`, ...) between two results files
+are stored in the cache folder, one `.npy` file per key: a float array `[NUM_SYSTEMS]` in the order of the canonical
+system index of `results_cube`, NaN where the fit is missing in either file. The key is a hash of:
+
+- the SHA-256 of the content of the two files (in order: the measures are not all symmetric);
+- the name of the measure, the prefactor and the two weights;
+- the version of the code computing the measures (`CACHE_VERSION` and the source of `quantities_for_comparison`
+  and of `results_cube`).
+
+Since each key only depends on two files, after updating the results of one code only the measures involving that
+code are recomputed. All missing measures of a pair of files are computed together, with one call to `qc.compare_all`.
+
+Run it as a script to warm the cache with the measures used by the figure scripts (all methods vs. the all-electron
+average, and the two all-electron codes vs. each other), and print the hit rate:
+
+    python -m acwf_paper_plots.measures_cache [LABELS_KEY ...]
+"""
+import hashlib
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+import acwf_paper_plots.quantities_for_comparison as qc
+import acwf_paper_plots.results_cube
+from acwf_paper_plots.results_cube import SYSTEMS, get_file_parameters
+from acwf_paper_plots.results_repository import REFERENCE_LABEL, ResultsRepository, get_content_hash
+
+DEFAULT_CACHE_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'measures-cache')
+# Increase it to invalidate all the measures in the caches, if their computation changes outside of the source files
+# that are already hashed (see `get_code_version`)
+CACHE_VERSION = '0.1'
+MEASURES = list(qc.COMPARE_ALL_FIELDS)
+# Order of the canonical systems sorted by their keys (e.g. `Ac-X/BCC`, `Ac-X/Diamond`, ...)
+_SORTED_SYSTEMS = np.argsort(SYSTEMS, kind='stable')
+
+
+def get_code_version():
+    """Return a hash of `CACHE_VERSION` and of the source of the modules that compute the measures."""
+    digest = hashlib.sha256(CACHE_VERSION.encode())
+    for module in (qc, acwf_paper_plots.results_cube):
+        with open(module.__file__, 'rb') as fhandle:
+            digest.update(fhandle.read())
+    return digest.hexdigest()
+
+
+def get_system_values(values):
+    """Return a dictionary system key -> value for the systems where `values` (an array `[NUM_SYSTEMS]`) is not NaN,
+    sorted by system key."""
+    return {
+        SYSTEMS[idx]: value for idx, value in zip(_SORTED_SYSTEMS.tolist(), values[_SORTED_SYSTEMS].tolist())
+        if not np.isnan(value)
+    }
+
+
+class MeasuresCache:
+    """
+    On-disk cache of the comparison measures between two results files (see the module docstring).
+
+    The number of measures taken from the cache and computed is counted in the `hits` and `misses` attributes.
+
+    :param folder: the cache folder (created if it does not exist).
+    :param version: version of the code computing the measures (default: `get_code_version()`);
+        measures computed with a different version are never reused.
+    """
+
+    def __init__(self, folder=DEFAULT_CACHE_FOLDER, version=None):
+        self.folder = folder
+        self.version = get_code_version() if version is None else str(version)
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, path_1, path_2, measure, prefactor=1., weight_b0=0., weight_b1=0.):
+        """Return the cache key of a measure between two results files."""
+        return hashlib.sha256(':'.join([
+            self.version, get_content_hash(path_1), get_content_hash(path_2),
+            measure, repr(float(prefactor)), repr(float(weight_b0)), repr(float(weight_b1)),
+        ]).encode()).hexdigest()
+
+    def _get_fname(self, key):
+        return os.path.join(self.folder, key[:2], f'{key}.npy')
+
+    def _store(self, key, values):
+        """Write the values of a key, atomically (other scripts may be reading the cache at the same time)."""
+        fname = self._get_fname(key)
+        os.makedirs(os.path.dirname(fname), exist_ok=True)
+        fhandle, tmp_fname = tempfile.mkstemp(dir=os.path.dirname(fname), suffix='.npy.tmp')
+        try:
+            with os.fdopen(fhandle, 'wb') as tmp_fhandle:
+                np.save(tmp_fhandle, values)
+            os.replace(tmp_fname, fname)
+        except BaseException:
+            os.remove(tmp_fname)
+            raise
+
+    def get_measures(self, path_1, path_2, measures=MEASURES, prefactors=None, weight_b0=0., weight_b1=0.,
+                     expected_script_version=None):
+        """
+        Return some measures between two results files, computing (and storing) only those that are not in the cache.
+
+        The parameters of `path_1` are passed to the measures as first set (`v0w, b0w, b1w`), those of `path_2`
+        as second set (`v0f, b0f, b1f`).
+
+        :param measures: the names of the measures (fields of `qc.compare_all`).
+        :param prefactors: a dictionary measure -> prefactor (1 if not present); as in `qc.compare_all`,
+            the prefactor is not applied to `delta` and `delta_over_b0`.
+        :param expected_script_version: if given, check the script version of the two files before computing measures.
+        :return: a dictionary measure -> float array `[NUM_SYSTEMS]`, NaN where either fit is missing.
+        """
+        if prefactors is None:
+            prefactors = {}
+        for measure in measures:
+            if measure not in MEASURES:
+                raise ValueError(f"Unknown measure '{measure}', valid ones are: {', '.join(MEASURES)}")
+
+        results = {}
+        missing = {}
+        for measure in measures:
+            prefactor = prefactors.get(measure, 1.)
+            key = self.get_key(path_1, path_2, measure, prefactor, weight_b0, weight_b1)
+            try:
+                results[measure] = np.load(self._get_fname(key))
+            except (OSError, ValueError):
+                missing.setdefault(prefactor, []).append((measure, key))
+        self.misses += sum(len(items) for items in missing.values())
+        self.hits += len(results)
+
+        if missing:
+            params_1 = get_file_parameters(path_1, expected_script_version)
+            params_2 = get_file_parameters(path_2, expected_script_version)
+            # Only the systems where both fits are there are computed, the others are NaN
+            valid = ~np.isnan(params_1).any(axis=1) & ~np.isnan(params_2).any(axis=1)
+            v0w, _, b0w, b1w = params_1[valid].T
+            v0f, _, b0f, b1f = params_2[valid].T
+            for prefactor, items in missing.items():
+                all_measures = qc.compare_all(v0w, b0w, b1w, v0f, b0f, b1f, prefactor, weight_b0, weight_b1)
+                for measure, key in items:
+                    values = np.full(len(SYSTEMS), np.nan)
+                    values[valid] = all_measures[measure]
+                    self._store(key, values)
+                    results[measure] = values
+        return results
+
+    def get_measure(self, path_1, path_2, measure, prefactor=1., weight_b0=0., weight_b1=0.,
+                    expected_script_version=None):
+        """Same as `get_measures`, for a single measure: return the float array `[NUM_SYSTEMS]`."""
+        return self.get_measures(
+            path_1, path_2, [measure], {measure: prefactor}, weight_b0, weight_b1, expected_script_version)[measure]
+
+    def get_statistics_string(self):
+        """Return a string with the number of hits and misses, e.g. to print at the end of a script."""
+        total = self.hits + self.misses
+        hit_rate = 100. * self.hits / total if total else 0.
+        return f"Measures cache '{self.folder}': {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)"
+
+
+def warm_cache(measures_cache, labels_key='methods-main', set_names=('unaries', 'oxides')):
+    """
+    Compute the measures used by the figure scripts, for all methods of `labels_key` vs. the all-electron average
+    (both orders) and between the two all-electron codes, with the weights and prefactors of the scripts.
+    """
+    # The (prefactors, weight_b0, weight_b1) used by the figure scripts
+    settings = [
+        # Periodic tables and comparison tensor
+        ({'nu': 100.}, 1. / 20., 1. / 400.),
+        # Box plots and histograms (% differences)
+        ({measure: 100. for measure in MEASURES}, 0., 0.),
+    ]
+    results_repository = ResultsRepository(labels_key=labels_key)
+    code_labels = results_repository.get_method_labels()
+    all_electron_labels = [results_repository.get_all_electron_label(short_label) for short_label in ('FLEUR', 'WIEN2k')]
+    for set_name in set_names:
+        pairs = []
+        for code_label in code_labels:
+            if results_repository.has_results(code_label, set_name):
+                pairs.append((REFERENCE_LABEL, code_label))
+                pairs.append((code_label, REFERENCE_LABEL))
+        if labels_key == 'methods-main':
+            pairs.append(tuple(all_electron_labels[::-1]))
+        for label_1, label_2 in pairs:
+            for prefactors, weight_b0, weight_b1 in settings:
+                measures_cache.get_measures(
+                    results_repository.get_path(label_1, set_name), results_repository.get_path(label_2, set_name),
+                    MEASURES, prefactors, weight_b0, weight_b1)
+
+
+if __name__ == "__main__":
+    LABELS_KEYS = sys.argv[1:] or ['methods-main', 'methods-supplementary']
+    MEASURES_CACHE = MeasuresCache()
+    for LABELS_KEY in LABELS_KEYS:
+        warm_cache(MEASURES_CACHE, LABELS_KEY)
+    print(MEASURES_CACHE.get_statistics_string())
@@ -1,14 +1,14 @@
 #!/usr/bin/env python
 import json
-import os
 import sys
 
 import numpy as np
 import pylab as pl
 from scipy.optimize import curve_fit
-import tqdm
 
-import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.comparison_tensor import compare_all_field_map
+from acwf_paper_plots.measures_cache import MeasuresCache, get_system_values
+from acwf_paper_plots.results_repository import REFERENCE_LABEL, ResultsRepository
 
 # As found in the paper, nu and eps can be roughly related via just a multiplication: nu=NU_EPS_FACTOR*eps
 # Use this to set a consistent maximum colorbar value
@@ -19,7 +19,7 @@ DEFAULT_wb0 = 1.0/20.0
 DEFAULT_wb1 = 1.0/400.0
 # Default prefactor if not indicated: 1.
 PREFACTOR_DICT = {'nu': 100.}
-EXPECTED_SCRIPT_VERSION = ["0.0.3","0.0.4"]
+EXPECTED_SCRIPT_VERSION = ["0.0.3","0.0.4","0.0.5","0.0.6"]
 # NOTE! in the code, I call the function e.g. 'delta_per_formula_unit', but in reality I then already divide by
 # the number of atoms in the formula unit, so the numbers I get are per atom.
 # Therefore, the UNICODE name has 'per atom' since it is shown in the final plot
@@ -271,151 +271,79 @@ def make_simple_cmap(data, high, min_data, cmap_name="plasma", log_scale=False):
     return norm, cmap, color_mapper
 
 
-def abs_V0_rel_diff(*args, **kwargs):
-    return abs(qc.V0_rel_diff(*args, **kwargs))
-def abs_B0_rel_diff(*args, **kwargs):
-    return abs(qc.B0_rel_diff(*args, **kwargs))
-def abs_B1_rel_diff(*args, **kwargs):
-    return abs(qc.B1_rel_diff(*args, **kwargs))
-
-quantity_for_comparison_map = {
-    "delta_per_formula_unit": qc.delta,
-    "delta_per_formula_unit_over_b0": qc.delta_over_b0,
-    "B0_rel_diff": qc.B0_rel_diff,
-    "V0_rel_diff": qc.V0_rel_diff,
-    "B1_rel_diff": qc.B1_rel_diff,
-    "abs_V0_rel_diff": abs_V0_rel_diff,
-    "abs_B0_rel_diff": abs_B0_rel_diff,
-    "abs_B1_rel_diff": abs_B1_rel_diff,            
-    "nu": qc.nu,
-    "epsilon": qc.epsilon
-}
-
 def load_data(SET_NAME):
 
-    DATA_FOLDER = "../../../code-data"
-    with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-        labels_data = json.load(fhandle)
-    
+    # Each results file is loaded once (only the sections needed here), and its version is checked at that point
+    results_repository = ResultsRepository(expected_script_version=EXPECTED_SCRIPT_VERSION, labels_key=LABELS_KEY)
+
     if USE_AE_AVERAGE_AS_REFERENCE:
-        reference_data_files = labels_data['references']['all-electron average']
-        reference_short_label = "ae"
+        reference_code_label = REFERENCE_LABEL
     else:
-        reference_data_files = labels_data[LABELS_KEY][REFERENCE_CODE_LABEL]
-        reference_short_label = labels_data[LABELS_KEY][REFERENCE_CODE_LABEL]['short_label']
+        reference_code_label = REFERENCE_CODE_LABEL
+    reference_short_label = results_repository.get_short_label(reference_code_label)
     try:
-        with open(os.path.join(DATA_FOLDER, reference_data_files[SET_NAME])) as fhandle:
-            compare_plugin_data = json.load(fhandle)
-            if not compare_plugin_data['script_version'] in EXPECTED_SCRIPT_VERSION:
-                raise ValueError(
-                    f"This script only works with data generated at version {EXPECTED_SCRIPT_VERSION}. "
-                    f"Please re-run ./get_results.py to update the data format for the all-electron dataset!"
-                    )
-                #sys.exit(1)
+        # Only the script version is loaded here, the measures are then taken from the measures cache
+        results_repository.get_script_version(reference_code_label, SET_NAME)
     except OSError:
         print(f"No data found for the all-electron dataset (set '{SET_NAME}'), it is the reference and must be present")
         sys.exit(1)
 
-    code_results = {}
+    code_paths = {}
     short_labels = {}
-    for code_label in labels_data[LABELS_KEY]:
+    for code_label in results_repository.get_method_labels():
         if ONLY_CODES is not None and code_label not in ONLY_CODES:
             continue
-        short_labels[code_label] = labels_data[LABELS_KEY][code_label]['short_label']
-        with open(os.path.join(DATA_FOLDER, labels_data[LABELS_KEY][code_label][SET_NAME])) as fhandle:
-            code_results[code_label] = json.load(fhandle)
-            if not code_results[code_label]['script_version'] in EXPECTED_SCRIPT_VERSION:
-                raise ValueError(
-                    f"This script only works with data generated at version {EXPECTED_SCRIPT_VERSION}. "
-                    f"Please re-run ./get_results.py to update the data format for {code_label}! Skipping it"
-                    )
-                #code_results.pop(label)
+        short_labels[code_label] = results_repository.get_short_label(code_label)
+        results_repository.get_script_version(code_label, SET_NAME)
+        code_paths[code_label] = results_repository.get_path(code_label, SET_NAME)
 
     loaded_data = {
-        "code_results": code_results,
+        "code_paths": code_paths,
         "short_labels": short_labels,
         "reference_short_label": reference_short_label,
-        "compare_plugin_data": compare_plugin_data
+        "compare_path": results_repository.get_path(reference_code_label, SET_NAME)
     }
 
     return loaded_data
 
 
-def calculate_quantities(plugin_data, compare_plugin_data, QUANTITY):
-    prefactor = PREFACTOR_DICT.get(QUANTITY, 1.)
-
-    all_systems = set(plugin_data['eos_data'].keys())
-    all_systems = set(plugin_data['BM_fit_data'].keys())
-    #all_systems.update(compare_plugin_data['BM_fit_data'].keys())
-
-    collect = {
-        "X/Diamond" : {"elements": [], "values": []},
-        "X/FCC" : {"elements": [], "values": []},
-        "X/BCC" : {"elements": [], "values": []},
-        "X/SC" : {"elements": [], "values": []},
-        "X2O3" : {"elements": [], "values": []},
-        "X2O5" : {"elements": [], "values": []},
-        "XO2" : {"elements": [], "values": []},
-        "XO3" : {"elements": [], "values": []},
-        "XO" : {"elements": [], "values": []},
-        "X2O" : {"elements": [], "values": []}
-        }
-
-    progress_bar = tqdm.tqdm(sorted(all_systems))
-    for element_and_configuration in progress_bar:
-        progress_bar.set_description(f"{element_and_configuration:12s}")
-        progress_bar.refresh()
-
-        element, configuration = element_and_configuration.split('-')
-        # Get the data for the reference plugin
-        ref_BM_fit_data = plugin_data['BM_fit_data'][f'{element}-{configuration}']
-    
-        if ref_BM_fit_data is None:
-            continue
-    
-        scaling_factor_ref = qc.get_volume_scaling_to_formula_unit(
-                plugin_data['num_atoms_in_sim_cell'][f'{element}-{configuration}'],
-                element, configuration
-            )
-
-        # Here I normalize quantities, so that they are now per atom and not per formula unit!
-        # This does not change anything for epsilon and nu, but changes for delta
-        V0=ref_BM_fit_data['min_volume']/scaling_factor_ref
-        B0=ref_BM_fit_data['bulk_modulus_ev_ang3']
-        B01=ref_BM_fit_data['bulk_deriv']
-
-        # Get the data for the compare_with plugin, if specified (and if the EOS worked for the 
-        # reference plugin, otherwise we don't know which E0 to use)
-        try:
-            compare_BM_fit_data = compare_plugin_data['BM_fit_data'][f'{element}-{configuration}']
-            if compare_BM_fit_data is None:
-                # No fitting data in the plugin to compare with.
-                # Raise this exception that is catched one line below, so
-                # it will set `compare_eos_fit_energy` to None.
-                raise KeyError                    
-        except KeyError:
-            # Set to None if fit data is missing (if we are here, the EOS points
-            # are there, so it means that the fit failed). I will still plot the
-            # points
-            continue
-
-        scaling_factor_comp = qc.get_volume_scaling_to_formula_unit(
-                compare_plugin_data['num_atoms_in_sim_cell'][f'{element}-{configuration}'],
-                element, configuration
-            )
-
-        # Here I normalize quantities, so that they are now per atom and not per formula unit!
-        # This does not change anything for epsilon and nu, but changes for delta
-        CV0=compare_BM_fit_data['min_volume']/scaling_factor_comp
-        CB0=compare_BM_fit_data['bulk_modulus_ev_ang3']
-        CB01=compare_BM_fit_data['bulk_deriv']
-
-        quant = quantity_for_comparison_map[QUANTITY](V0,B0,B01,CV0,CB0,CB01,prefactor,DEFAULT_wb0,DEFAULT_wb1)
+def calculate_quantities(plugin_path, compare_path, quantities, measures_cache):
+    """
+    Return a dictionary with, for each quantity in `quantities`, the values collected per configuration.
 
-        collect[configuration]["values"].append(quant)
-        collect[configuration]["elements"].append(element)
+    The measures between the two results files are taken from `measures_cache`, and only computed
+    (with a single call to `qc.compare_all` per quantity) if they are not there yet.
+    """
+    all_collect = {}
+    for QUANTITY in quantities:
+        all_collect[QUANTITY] = {
+            "X/Diamond" : {"elements": [], "values": []},
+            "X/FCC" : {"elements": [], "values": []},
+            "X/BCC" : {"elements": [], "values": []},
+            "X/SC" : {"elements": [], "values": []},
+            "X2O3" : {"elements": [], "values": []},
+            "X2O5" : {"elements": [], "values": []},
+            "XO2" : {"elements": [], "values": []},
+            "XO3" : {"elements": [], "values": []},
+            "XO" : {"elements": [], "values": []},
+            "X2O" : {"elements": [], "values": []}
+            }
 
-    return collect
+    for QUANTITY in quantities:
+        field, take_abs = compare_all_field_map[QUANTITY]
+        # NaN for the systems without a fit in either file; V0 and E0 are normalized per formula unit
+        quants = measures_cache.get_measure(
+            plugin_path, compare_path, field, PREFACTOR_DICT.get(QUANTITY, 1.), DEFAULT_wb0, DEFAULT_wb1,
+            expected_script_version=EXPECTED_SCRIPT_VERSION)
+        if take_abs:
+            quants = np.abs(quants)
+        collect = all_collect[QUANTITY]
+        for element_and_configuration, quant in get_system_values(quants).items():
+            element, configuration = element_and_configuration.split('-')
+            collect[configuration]["values"].append(quant)
+            collect[configuration]["elements"].append(element)
+
+    return all_collect
 
 def export_json_file(SET_NAME, QUANTITY, collect, list_confs, short_labels, plugin, reference_short_label):
     # EXPORT JSON: a dictionary with key = element+config, value = measure
@@ -800,7 +728,7 @@ def plot_periodic_tables(SET_NAME, QUANTITY, measures_max_and_avg, master_data_d
 
     ld = master_data_dict[SET_NAME]["loaded_data"]
 
-    for plugin, plugin_data in ld["code_results"].items():
+    for plugin in ld["code_paths"]:
 
         print(f"Using data for method '{plugin}' (set '{SET_NAME}') compared with {ld['reference_short_label']}.")
 
@@ -869,7 +797,7 @@ def find_code_measures_max_and_avg(master_data_dict):
 
         for QUANTITY in QUANTITIES:
 
-            for plugin, plugin_data in ld["code_results"].items():
+            for plugin in ld["code_paths"]:
 
                 if plugin not in tmp:
                     tmp[plugin] = {}
@@ -982,19 +910,19 @@ def analyze_stats(master_data_dict):
 if __name__ == "__main__":
 
     master_data_dict = {}
+    measures_cache = MeasuresCache()
 
     for SET_NAME in SET_NAMES:
         ld = load_data(SET_NAME)
 
         master_data_dict[SET_NAME] = {
             "loaded_data": ld,
-            "calculated_quantities": {}
+            "calculated_quantities": {QUANTITY: {} for QUANTITY in QUANTITIES}
         }
-        for QUANTITY in QUANTITIES:
-            master_data_dict[SET_NAME]["calculated_quantities"][QUANTITY] = {}
-            for plugin, plugin_data in ld["code_results"].items():
-                collect = calculate_quantities(plugin_data, ld["compare_plugin_data"], QUANTITY)
-                master_data_dict[SET_NAME]["calculated_quantities"][QUANTITY][plugin] = collect
+        for plugin, plugin_path in ld["code_paths"].items():
+            all_collect = calculate_quantities(plugin_path, ld["compare_path"], QUANTITIES, measures_cache)
+            for QUANTITY in QUANTITIES:
+                master_data_dict[SET_NAME]["calculated_quantities"][QUANTITY][plugin] = all_collect[QUANTITY]
 
 
     output_quantity_dict = {}
@@ -1022,6 +950,8 @@ if __name__ == "__main__":
             json.dump(output_quantity_dict, fhandle, indent=2)
         print(f"{fname} written.")
 
+    print(measures_cache.get_statistics_string())
+
     measures_max_and_avg = find_code_measures_max_and_avg(master_data_dict)
 
 
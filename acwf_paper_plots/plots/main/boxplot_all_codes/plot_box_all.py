@@ -1,10 +1,11 @@
 #!/usr/bin/env python
-import json
 import matplotlib.pyplot as plt
-import os
 import sys
 import copy
-import acwf_paper_plots.quantities_for_comparison as qc
+import numpy as np
+from acwf_paper_plots.measures_cache import MeasuresCache
+from acwf_paper_plots.results_cube import build_results_cube
+from acwf_paper_plots.results_repository import REFERENCE_LABEL, ResultsRepository
 
 plt.rcParams.update({
     "text.usetex": True,
@@ -12,7 +13,7 @@ plt.rcParams.update({
     "font.sans-serif": "Helvetica",
 })
 
-EXPECTED_SCRIPT_VERSION = ['0.0.3','0.0.4']
+EXPECTED_SCRIPT_VERSION = ['0.0.3','0.0.4','0.0.5','0.0.6']
 DEFAULT_PREFACTOR = 100 # to convert from relative to % errors
 DEFAULT_WB0 = 0.
 DEFAULT_WB01 = 0.
@@ -42,11 +43,12 @@ FLIERPROPS = {
 }
 # %%
 
+# Measure of `qc.compare_all` (see `measures_cache`) for each quantity
 quantity_for_comparison_map = {
-    "delta_per_formula_unit": qc.delta,
-    "% difference in B0": qc.B0_rel_diff,
-    "% difference in V0": qc.V0_rel_diff,
-    "% difference in B1": qc.B1_rel_diff,
+    "delta_per_formula_unit": "delta",
+    "% difference in B0": "B0_rel_diff",
+    "% difference in V0": "V0_rel_diff",
+    "% difference in B1": "B1_rel_diff",
 }
 
 xlims = {
@@ -64,13 +66,14 @@ QUANTITY_FANCY_NAMES = {
     'B1': "$B_1$"
 }
 
-DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
-code_labels = list(labels_data['methods-main'].keys())[::-1] # invert order because they are plot bottom to top, so we keep them alphabetical
+# Each results file is loaded once, the first time it is needed, and its version is checked at that point
+results_repository = ResultsRepository(expected_script_version=EXPECTED_SCRIPT_VERSION)
+code_labels = results_repository.get_method_labels()[::-1] # invert order because they are plot bottom to top, so we keep them alphabetical
 
 ALL_ELECTRON_CODES_SHORT = ["FLEUR", "WIEN2k"][::-1] # Revert order as they are printed from top to bottom
-ALL_ELECTRON_CODES = [labels_data['all-electron-keys'][short_label] for short_label in ALL_ELECTRON_CODES_SHORT]
+ALL_ELECTRON_CODES = [results_repository.get_all_electron_label(short_label) for short_label in ALL_ELECTRON_CODES_SHORT]
+# The measures vs. the all-electron average are only computed if they are not in the cache yet
+measures_cache = MeasuresCache()
 
 
 def generate_box_plt(set_names, file_name, material_set_label, file_suffix, only_must_have_elements=None, keep_only_codes=None):
@@ -100,6 +103,9 @@ def generate_box_plt(set_names, file_name, material_set_label, file_suffix, only
     for code_label in ALL_ELECTRON_CODES:
         used_code_labels.append(code_label)
 
+    # The parameters of all used codes and of the all-electron average, for all systems
+    results_cube = build_results_cube(used_code_labels, results_repository=results_repository)
+
     all_data = {}
     print()
     print('#####################################################################')
@@ -113,81 +119,35 @@ def generate_box_plt(set_names, file_name, material_set_label, file_suffix, only
             plugin_small = 0
             out_data[code_label] = {}
             for set_name in set_names:
-                reference_data_files = labels_data['references']['all-electron average']
-                with open(os.path.join(DATA_FOLDER, reference_data_files[set_name])) as fhandle:
-                    ref_plugin_data = json.load(fhandle)
-                with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][code_label][set_name])) as fhandle:
-                    plugin_data = json.load(fhandle)
-
-                ref_BM_fit_data = ref_plugin_data['BM_fit_data']
-                # List the reference systems that have BM fit data
-                ref_systems = set(
-                    el_conf for el_conf in ref_BM_fit_data.keys()
-                    if ref_BM_fit_data[el_conf] is not None
-                )
-                plugin_BM_fit_data = plugin_data['BM_fit_data']
-
-                plugin_systems = set(
-                    el_conf for el_conf in plugin_BM_fit_data.keys()
-                    if plugin_BM_fit_data[el_conf] is not None
-                )
                 # Take the systems that are both in the reference and plugin sets
-                plot_systems = plugin_systems.intersection(ref_systems)
-                               
-                if set_name == 'oxides':
-                    variants = ['XO', 'XO2', 'X2O', 'X2O3', 'X2O5', 'XO3']
-                elif set_name == 'unaries':
-                    variants = ['X/SC', 'X/FCC', 'X/BCC', 'X/Diamond']
-                else:
-                    raise ValueError("Unrecognized set name!")
-                missing = []
-                new_plot_systems = set()
-                for element in only_must_have_elements:
-                    for variant in variants:
-                        expected_key = f"{element}-{variant}"
-                        if expected_key not in plot_systems:
-                            missing.append(expected_key)
-                        else:
-                            new_plot_systems.add(expected_key)
+                plot_systems = (
+                    results_cube.get_common_mask([code_label, REFERENCE_LABEL])
+                    & results_cube.get_system_mask(set_name=set_name)
+                )
+                must_have_systems = results_cube.get_system_mask(set_name=set_name, elements=only_must_have_elements)
+                missing = [results_cube.systems[idx] for idx in np.flatnonzero(must_have_systems & ~plot_systems)]
+                plot_systems &= must_have_systems
                 if quantity_name == '% difference in V0':
                     if missing:
                         print(f"{code_label} ({set_name}) misses the following keys: {missing}")
-                        print(f"   -> Plotting: {len(new_plot_systems)}")
+                        print(f"   -> Plotting: {plot_systems.sum()}")
                     else:
                         print(f"{code_label} ({set_name}) is complete")
-                        print(f"   -> Plotting: {len(new_plot_systems)}")
-                plot_systems = new_plot_systems
-
-                for element_and_configuration in plot_systems:
-                    element, configuration = element_and_configuration.split('-')
-                
-                    ref_n_atoms = ref_plugin_data['num_atoms_in_sim_cell'][f'{element}-{configuration}']
-                    ref_scaling_factor = qc.get_volume_scaling_to_formula_unit(
-                        ref_n_atoms, element, configuration
-                    )
-                    ref_V0 = ref_BM_fit_data[f'{element}-{configuration}']['min_volume'] / ref_scaling_factor
-                    ref_B0 = ref_BM_fit_data[f'{element}-{configuration}']['bulk_modulus_ev_ang3']
-                    ref_B01 = ref_BM_fit_data[f'{element}-{configuration}']['bulk_deriv']
+                        print(f"   -> Plotting: {plot_systems.sum()}")
 
-                    plugin_n_atoms = plugin_data['num_atoms_in_sim_cell'][f'{element}-{configuration}']
-                    plugin_scaling_factor = qc.get_volume_scaling_to_formula_unit(
-                        plugin_n_atoms, element, configuration
-                    )
-                    plugin_V0 = plugin_BM_fit_data[f'{element}-{configuration}']['min_volume'] / plugin_scaling_factor
-                    plugin_B0 = plugin_BM_fit_data[f'{element}-{configuration}']['bulk_modulus_ev_ang3']
-                    plugin_B01 = plugin_BM_fit_data[f'{element}-{configuration}']['bulk_deriv']
+                if not plot_systems.any():
+                    continue
 
-                    quantity_value = quantity_for_comparison_map[quantity_name](
-                        ref_V0, ref_B0, ref_B01,
-                        plugin_V0, plugin_B0, plugin_B01,
-                        DEFAULT_PREFACTOR, DEFAULT_WB0, DEFAULT_WB01
-                    )
+                # The quantity for all systems of the set (indexed as the systems of the cube)
+                quantity_values = measures_cache.get_measure(
+                    results_repository.get_path(REFERENCE_LABEL, set_name),
+                    results_repository.get_path(code_label, set_name),
+                    quantity_for_comparison_map[quantity_name], DEFAULT_PREFACTOR, DEFAULT_WB0, DEFAULT_WB01
+                )[plot_systems]
 
-                    plugin_values.append(quantity_value)
-                    if quantity_value < xlims[quantity_name][0]:
-                        plugin_big = plugin_big+1  
-                    if quantity_value > xlims[quantity_name][1]:
-                        plugin_small = plugin_small+1
+                plugin_values.extend(quantity_values.tolist())
+                plugin_big += int((quantity_values < xlims[quantity_name][0]).sum())
+                plugin_small += int((quantity_values > xlims[quantity_name][1]).sum())
 
             out_data[code_label]['values'] = plugin_values
             out_data[code_label]['big'] = plugin_big
@@ -335,3 +295,4 @@ if __name__ == "__main__":
         print("Pass as first parameter 'separate' (separate analysis for unaries and oxides) or 'together'.")
         sys.exit(1)
 
+    print(measures_cache.get_statistics_string())
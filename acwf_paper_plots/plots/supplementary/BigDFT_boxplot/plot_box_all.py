@@ -1,10 +1,9 @@
 #!/usr/bin/env python
-import json
 import matplotlib.pyplot as plt
-import os
 import sys
 import copy
 import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.results_repository import ResultsRepository, load_results
 
 plt.rcParams.update({
     "text.usetex": True,
@@ -12,7 +11,7 @@ plt.rcParams.update({
     "font.sans-serif": "Helvetica",
 })
 
-EXPECTED_SCRIPT_VERSION = ['0.0.3','0.0.4']
+EXPECTED_SCRIPT_VERSION = ['0.0.3','0.0.4','0.0.5','0.0.6']
 DEFAULT_PREFACTOR = 100 # to convert from relative to % errors
 DEFAULT_WB0 = 0.
 DEFAULT_WB01 = 0.
@@ -64,13 +63,12 @@ QUANTITY_FANCY_NAMES = {
     'B1': "$B_1$"
 }
 
-DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
-code_labels = list(labels_data['methods-main'].keys())[::-1] # invert order because they are plot bottom to top, so we keep them alphabetical
+# Each results file is loaded once, the first time it is needed, and its version is checked at that point
+results_repository = ResultsRepository(expected_script_version=EXPECTED_SCRIPT_VERSION)
+code_labels = results_repository.get_method_labels()[::-1] # invert order because they are plot bottom to top, so we keep them alphabetical
 
 ALL_ELECTRON_CODES_SHORT = ["FLEUR", "WIEN2k"][::-1] # Revert order as they are printed from top to bottom
-ALL_ELECTRON_CODES = [labels_data['all-electron-keys'][short_label] for short_label in ALL_ELECTRON_CODES_SHORT]
+ALL_ELECTRON_CODES = [results_repository.get_all_electron_label(short_label) for short_label in ALL_ELECTRON_CODES_SHORT]
 
 
 def generate_box_plt(set_names, file_name, material_set_label, file_suffix, only_must_have_elements=None, keep_only_codes=None):
@@ -94,18 +92,17 @@ def generate_box_plt(set_names, file_name, material_set_label, file_suffix, only
             plugin_small = 0
             out_data[code_label] = {}
             for set_name in set_names:
-                reference_data_files = labels_data['references']['all-electron average']
-                with open(os.path.join(DATA_FOLDER, reference_data_files[set_name])) as fhandle:
-                    ref_plugin_data = json.load(fhandle)
+                ref_plugin_data = results_repository.get_reference(set_name)
                 if code_label == 'bigdft_semicore':
-                    with open('results-combined-verification-PBE-v1-bigdft_semicore_only.json') as fhandle:
-                        plugin_data = json.load(fhandle)
+                    plugin_data = load_results(
+                        'results-combined-verification-PBE-v1-bigdft_semicore_only.json',
+                        expected_script_version=EXPECTED_SCRIPT_VERSION)
                 elif code_label == 'bigdft_original':
-                    with open('results-combined-verification-PBE-v1-bigdft_original.json') as fhandle:
-                        plugin_data = json.load(fhandle)
+                    plugin_data = load_results(
+                        'results-combined-verification-PBE-v1-bigdft_original.json',
+                        expected_script_version=EXPECTED_SCRIPT_VERSION)
                 else:
-                    with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][code_label][set_name])) as fhandle:
-                        plugin_data = json.load(fhandle)
+                    plugin_data = results_repository.get_results(code_label, set_name)
 
 
                 ref_BM_fit_data = ref_plugin_data['BM_fit_data']
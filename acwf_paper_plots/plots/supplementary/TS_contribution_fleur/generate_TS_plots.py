@@ -7,7 +7,8 @@ import numpy as np
 import pylab as pl
 import tqdm
 
-from acwf_paper_plots.eosfit_31_adapted import BM, echarge
+from acwf_paper_plots.eosfit_31_adapted import BM_batch, echarge, stack_eos_data
+from acwf_paper_plots.fit_cache import EOSFitCache, get_code_version
 from acwf_paper_plots.quantities_for_comparison import birch_murnaghan
 
 EXPECTED_SCRIPT_VERSION = '0.0.3'
@@ -27,20 +28,29 @@ ONLY_THESE_SYSTEMS = [
 ]
 
 
-def fit_eos_data(eos_data):
-    # I need to pass a numpy array
-    min_volume, E0, bulk_modulus_internal, bulk_deriv, residuals = BM(np.array(eos_data))
-    bulk_modulus_GPa = bulk_modulus_internal * echarge * 1.0e21
-    #1 eV/Angstrom3 = 160.21766208 GPa
-    bulk_modulus_ev_ang3 = bulk_modulus_GPa / 160.21766208
-    BM_fit_data = {
-        'min_volume': min_volume,
-        'E0': E0,
-        'bulk_modulus_ev_ang3': bulk_modulus_ev_ang3,
-        'bulk_deriv': bulk_deriv,
-        'residuals': residuals[0]
-    }
-    return BM_fit_data
+def fit_eos_data(*all_eos_data, cache=None):
+    """
+    Fit all the given E(V) datasets at once, returning a list with a BM_fit_data dictionary for each of them.
+    If an `EOSFitCache` is passed as `cache`, previous fits of the same data are reused.
+    """
+    fit_function = BM_batch if cache is None else cache.fit
+    min_volumes, E0s, bulk_moduli_internal, bulk_derivs, residuals, failed = fit_function(*stack_eos_data(all_eos_data))
+    if failed.any():
+        raise ValueError('Error: No minimum could be found')
+    all_BM_fit_data = []
+    for min_volume, E0, bulk_modulus_internal, bulk_deriv, residual in zip(
+        min_volumes, E0s, bulk_moduli_internal, bulk_derivs, residuals):
+        bulk_modulus_GPa = bulk_modulus_internal * echarge * 1.0e21
+        #1 eV/Angstrom3 = 160.21766208 GPa
+        bulk_modulus_ev_ang3 = bulk_modulus_GPa / 160.21766208
+        all_BM_fit_data.append({
+            'min_volume': min_volume,
+            'E0': E0,
+            'bulk_modulus_ev_ang3': bulk_modulus_ev_ang3,
+            'bulk_deriv': bulk_deriv,
+            'residuals': residual
+        })
+    return all_BM_fit_data
 
 def get_conf_nice(configuration_string):
     """Convert the configuration string to a nicely typeset string in LaTeX."""
@@ -53,7 +63,7 @@ def get_conf_nice(configuration_string):
     return "".join(ret_pieces)
 
 
-def plot(SET_NAME):
+def plot(SET_NAME, cache=None):
     # Load the TS data provided by FLEUR
     try:
         with open(f'TS_data_fleur/ts_contributions-{SET_NAME}-verification-PBE-v1-fleur.json') as fhandle:
@@ -101,9 +111,12 @@ def plot(SET_NAME):
 
 
         # FIT CURVES!
-        BM_fit_data_free_energy = fit_eos_data(np.array([volumes, free_energies]).T)
-        BM_fit_data_E = fit_eos_data(np.array([volumes, free_energies + TS_contrib]).T) # I cannot do F_data + TS_data, it would also sum the volumes
-        BM_fit_data_E_minus_TS_half = fit_eos_data(np.array([volumes, free_energies + TS_contrib / 2]).T)
+        BM_fit_data_free_energy, BM_fit_data_E, BM_fit_data_E_minus_TS_half = fit_eos_data(
+            np.array([volumes, free_energies]).T,
+            np.array([volumes, free_energies + TS_contrib]).T, # I cannot do F_data + TS_data, it would also sum the volumes
+            np.array([volumes, free_energies + TS_contrib / 2]).T,
+            cache=cache
+        )
 
         fitted_free_energy = birch_murnaghan(
              V=dense_volumes,
@@ -165,5 +178,7 @@ def plot(SET_NAME):
     print(f"Plots written to: '{PLOT_FOLDER}'")
 
 if __name__ == "__main__":
-    plot("unaries")
-    plot("oxides")
+    with EOSFitCache("eos-fit-cache.sqlite", version=get_code_version()) as fit_cache:
+        plot("unaries", cache=fit_cache)
+        plot("oxides", cache=fit_cache)
+        print(fit_cache.get_statistics_string())
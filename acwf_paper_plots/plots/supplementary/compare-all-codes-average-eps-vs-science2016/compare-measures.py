@@ -1,10 +1,9 @@
 #!/usr/bin/env python
-import json
-import os
 import pylab as pl
 import numpy as np
 #from adjustText import adjust_text
-import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.measures_cache import MeasuresCache, get_system_values
+from acwf_paper_plots.results_repository import ResultsRepository
 
 DO_ZOOM_PANEL = False
 
@@ -45,17 +44,16 @@ overlapping_elements = [
     "Sn-X/Diamond"
 ]
 
-DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
-all_methods = sorted(labels_data['methods-main'].keys())
+results_repository = ResultsRepository()
+all_methods = sorted(results_repository.get_method_labels())
 
-raw_data = {}
-for set_name in ['unaries', 'oxides']:
-    raw_data[set_name] = {}
-    for method in all_methods:
-        with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][method][set_name])) as fhandle:
-            raw_data[set_name][method] = json.load(fhandle)
+# The measures are only computed if they are not in the cache yet
+measures_cache = MeasuresCache()
+
+prefactor = 1.
+# Next two not used
+DEFAULT_wb0 = 1.
+DEFAULT_wb1 = 1.
 
 # measure = "epsilon"
 data = {}
@@ -67,45 +65,12 @@ for i, method1 in enumerate(all_methods):
         print(f"Computing {method1} vs {method2}...")
         data[(method1, method2)] = {}
         for set_name in ["unaries", "oxides"]:
-            # Compute here epsilon between the two sets
-            for structure in raw_data[set_name][method1]['BM_fit_data'].keys():
-                element, configuration = structure.split('-')
-                BM_fit_data_1 = raw_data[set_name][method1]['BM_fit_data'][structure]
-                if BM_fit_data_1 is None:
-                    continue
-                scaling_factor_1 = qc.get_volume_scaling_to_formula_unit(
-                    raw_data[set_name][method1]['num_atoms_in_sim_cell'][f'{element}-{configuration}'],
-                    element, configuration
-                )
-                # Here I normalize quantities, so that they are now per atom and not per formula unit!
-                # This does not change anything for epsilon and nu, but changes for delta
-                V0=BM_fit_data_1['min_volume']/scaling_factor_1
-                B0=BM_fit_data_1['bulk_modulus_ev_ang3']
-                B01=BM_fit_data_1['bulk_deriv']
-
-                # Get the data for the compare_with plugin, if specified (and if the EOS worked for the 
-                # reference plugin, otherwise we don't know which E0 to use)
-                try:
-                    BM_fit_data_2 = raw_data[set_name][method2]['BM_fit_data'][structure]
-                    if BM_fit_data_2 is None:
-                        continue               
-                except KeyError:
-                    continue
-                scaling_factor_2 = qc.get_volume_scaling_to_formula_unit(
-                    raw_data[set_name][method1]['num_atoms_in_sim_cell'][f'{element}-{configuration}'],
-                    element, configuration
-                )
-                # Here I normalize quantities, so that they are now per atom and not per formula unit!
-                # This does not change anything for epsilon and nu, but changes for delta
-                CV0=BM_fit_data_2['min_volume']/scaling_factor_2
-                CB0=BM_fit_data_2['bulk_modulus_ev_ang3']
-                CB01=BM_fit_data_2['bulk_deriv']
-
-                prefactor = 1.
-                # Next two not used
-                DEFAULT_wb0 = 1.
-                DEFAULT_wb1 = 1.
-                data[(method1, method2)][structure]= qc.epsilon(V0,B0,B01,CV0,CB0,CB01,prefactor,DEFAULT_wb0,DEFAULT_wb1)
+            # Epsilon between the two sets, for the structures with a fit for both methods
+            # (V0 is normalized per formula unit, that does not change anything for epsilon)
+            eps_values = measures_cache.get_measure(
+                results_repository.get_path(method1, set_name), results_repository.get_path(method2, set_name),
+                'epsilon', prefactor, DEFAULT_wb0, DEFAULT_wb1)
+            data[(method1, method2)].update(get_system_values(eps_values))
 
 ## Compare delta on old set with nu and epsilon on new set
 print("# METHOD EPS_AVERAGE EPS_AVERAGE_SCIENCE_SUBSET")
@@ -169,3 +134,4 @@ ax.add_patch(e1)
 
 pl.savefig(filename)
 print(f"File '{filename}' written.")
+print(measures_cache.get_statistics_string())
@@ -5,11 +5,10 @@ downloaded from https://molmod.ugent.be/deltacodesdft, and compares
 with our new results, for the two AE codes.
 The output is the % error (in %, so relative error multiplied by 100) for the discrepancy in the 3 Birch-Murnaghan parameters, for Wien2K and Fleur, old results (Science 2016) vs. new results (this work)
 """
-import json
-import os
 import numpy as np
 import pylab as pl
 import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.results_repository import ResultsRepository
 
 
 # The following list summarizes the subset of the 71 elements from the
@@ -67,35 +66,31 @@ for l in overlapping_elements_str.splitlines():
     element, structure = l.split()
     overlapping_elements[element] = {'structure': structure}
 
-DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
-FLEUR_LABEL = labels_data['all-electron-keys']["FLEUR"]
-WIEN2k_LABEL = labels_data['all-electron-keys']["WIEN2k"]
-
-with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][FLEUR_LABEL]["unaries"])) as fhandle:             
-    raw = json.load(fhandle)
-    for element in overlapping_elements:
-        structure = overlapping_elements[element]['structure']
-        fit_data = raw["BM_fit_data"][f"{element}-X/{structure}"]
-        formula_unit_atoms = 2 if structure == "Diamond" else 1
-        overlapping_elements[element]['fleur'] = [
-            fit_data['min_volume'] / formula_unit_atoms,
-            fit_data['bulk_modulus_ev_ang3'] * 160.21766208, # in GPa
-            fit_data['bulk_deriv']
-        ]
-
-with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][WIEN2k_LABEL]["unaries"])) as fhandle:             
-    raw = json.load(fhandle)
-    for element in overlapping_elements:
-        structure = overlapping_elements[element]['structure']
-        fit_data = raw["BM_fit_data"][f"{element}-X/{structure}"]
-        formula_unit_atoms = 2 if structure == "Diamond" else 1
-        overlapping_elements[element]['wien2k'] = [
-            fit_data['min_volume'] / formula_unit_atoms,
-            fit_data['bulk_modulus_ev_ang3'] * 160.21766208, # in GPa
-            fit_data['bulk_deriv']
-        ]
+results_repository = ResultsRepository()
+FLEUR_LABEL = results_repository.get_all_electron_label("FLEUR")
+WIEN2k_LABEL = results_repository.get_all_electron_label("WIEN2k")
+
+raw = results_repository.get_results(FLEUR_LABEL, "unaries")
+for element in overlapping_elements:
+    structure = overlapping_elements[element]['structure']
+    fit_data = raw["BM_fit_data"][f"{element}-X/{structure}"]
+    formula_unit_atoms = 2 if structure == "Diamond" else 1
+    overlapping_elements[element]['fleur'] = [
+        fit_data['min_volume'] / formula_unit_atoms,
+        fit_data['bulk_modulus_ev_ang3'] * 160.21766208, # in GPa
+        fit_data['bulk_deriv']
+    ]
+
+raw = results_repository.get_results(WIEN2k_LABEL, "unaries")
+for element in overlapping_elements:
+    structure = overlapping_elements[element]['structure']
+    fit_data = raw["BM_fit_data"][f"{element}-X/{structure}"]
+    formula_unit_atoms = 2 if structure == "Diamond" else 1
+    overlapping_elements[element]['wien2k'] = [
+        fit_data['min_volume'] / formula_unit_atoms,
+        fit_data['bulk_modulus_ev_ang3'] * 160.21766208, # in GPa
+        fit_data['bulk_deriv']
+    ]
 
 #print(overlapping_elements)
 
@@ -1,6 +1,4 @@
 #!/usr/bin/env python
-import json
-import os
 import sys
 from collections import defaultdict
 
@@ -8,6 +6,8 @@ from ase.data import chemical_symbols, atomic_numbers
 import numpy as np
 import pylab as pl
 
+from acwf_paper_plots.results_repository import ResultsRepository
+
 Z_max = 96
 Pettifor_max = 103
 
@@ -67,7 +67,7 @@ volume_per_atom_to_cubic_volume = {
 }
 
 def get_alat_from_raw_json(json_data):
-    assert json_data['script_version'] in ["0.0.3", "0.0.4"]
+    assert json_data['script_version'] in ["0.0.3", "0.0.4", "0.0.5", "0.0.6"]
 
     data = defaultdict(dict)
 
@@ -208,16 +208,12 @@ if __name__ == "__main__":
         print("Pass either 'oxides' or 'unaries' on the command line.")
         sys.exit(2)
 
-    DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
-    FLEUR_LABEL = labels_data['all-electron-keys']["FLEUR"]
-    WIEN2k_LABEL = labels_data['all-electron-keys']["WIEN2k"]
+    results_repository = ResultsRepository()
+    FLEUR_LABEL = results_repository.get_all_electron_label("FLEUR")
+    WIEN2k_LABEL = results_repository.get_all_electron_label("WIEN2k")
 
-    with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][WIEN2k_LABEL][set_name])) as fhandle:
-            wien2k_data = json.load(fhandle)
-    with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][FLEUR_LABEL][set_name])) as fhandle:
-            fleur_data = json.load(fhandle)
+    wien2k_data = results_repository.get_results(WIEN2k_LABEL, set_name)
+    fleur_data = results_repository.get_results(FLEUR_LABEL, set_name)
 
     fleur_alats = get_alat_from_raw_json(fleur_data)
     wien2k_alats = get_alat_from_raw_json(wien2k_data)
@@ -1,21 +1,21 @@
 #!/usr/bin/env python
 import json
-import os
 import re
 import sys
 
 import ase.data
 import numpy as np
 
+from acwf_paper_plots.results_repository import ResultsRepository
+
 UNARIES_CONFIGURATIONS = ['X/BCC', 'X/SC', 'X/FCC', 'X/Diamond']
 OXIDES_CONFIGURATIONS = ['XO', 'XO2', 'XO3', 'X2O', 'X2O3', 'X2O5']
 ALL_ELEMENTS = [ase.data.chemical_symbols[Z] for Z in range(1, 96+1)]
-EXPECTED_SCRIPT_VERSION = ['0.0.3', '0.0.4']
+EXPECTED_SCRIPT_VERSION = ['0.0.3', '0.0.4', '0.0.5', '0.0.6']
 VERBOSE = False
 
-DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
+# The version of each results file is checked once, when it is loaded
+results_repository = ResultsRepository(expected_script_version=EXPECTED_SCRIPT_VERSION)
 
 
 def get_num_atoms_in_formula_unit(configuration):
@@ -176,19 +176,13 @@ def get_unaries_energy_difference(
 def generate_json_data(ONLY_CODES=None):
     short_labels = {}
     code_results = {}
-    for code_label in labels_data['methods-main']:
+    for code_label in results_repository.get_method_labels():
         if ONLY_CODES is not None and code_label not in ONLY_CODES:
             continue
-        short_labels[code_label] = labels_data['methods-main'][code_label]['short_label']
+        short_labels[code_label] = results_repository.get_short_label(code_label)
         code_results[code_label] = {}
         for SET_NAME in ['unaries', 'oxides']:
-            with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][code_label][SET_NAME])) as fhandle:
-                code_results[code_label][SET_NAME] = json.load(fhandle)
-                if not code_results[code_label][SET_NAME]['script_version'] in EXPECTED_SCRIPT_VERSION:
-                    raise ValueError(
-                        f"This script only works with data generated at version {EXPECTED_SCRIPT_VERSION}. "
-                        f"Please re-run ./get_results.py to update the data format for {code_label}! Skipping it"
-                        )
+            code_results[code_label][SET_NAME] = results_repository.get_results(code_label, SET_NAME)
 
     # Note: we are computing everything twice (plugin A-B and B-A) as well as pairs of the same plugin A-A
     # But anyway it's cheap
@@ -245,7 +239,7 @@ def generate_json_data(ONLY_CODES=None):
     print(f"File '{fname}' written.")
 
 if __name__ == "__main__":
-    FLEUR_LABEL = labels_data['all-electron-keys']["FLEUR"]
-    WIEN2k_LABEL = labels_data['all-electron-keys']["WIEN2k"]
+    FLEUR_LABEL = results_repository.get_all_electron_label("FLEUR")
+    WIEN2k_LABEL = results_repository.get_all_electron_label("WIEN2k")
 
     generate_json_data(ONLY_CODES = [FLEUR_LABEL, WIEN2k_LABEL])
@@ -1,6 +1,5 @@
 #!/usr/bin/env python
 import json
-import os
 import sys
 
 import numpy as np
@@ -164,9 +163,5 @@ def generate_plots(plugin1, plugin2, what, x_zoom_factor=1., abs_x_range=None):
             fhandle.write(f"{system:30s}: {dissimilarity:.6f} ({data_plugin1} vs {data_plugin2})\n")
 
 if __name__ == "__main__":
-    DATA_FOLDER = "../../../code-data"
-    with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-        labels_data = json.load(fhandle)
-
     what = 'formation-energy'
     generate_plots("FLEUR", "WIEN2k", what, x_zoom_factor=None, abs_x_range=0.05)
@@ -1,14 +1,12 @@
 #!/usr/bin/env python
-import json
-import os
 import sys
 
 import numpy as np
 import pylab as pl
 from scipy.optimize import curve_fit
-import tqdm
 
-import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.measures_cache import MeasuresCache, get_system_values
+from acwf_paper_plots.results_repository import ResultsRepository
 
 # Adapt this factor to change the zoom on the x axis
 # The default zoom is obtained from the standard deviation of the data
@@ -18,6 +16,7 @@ BINS = 100
 DEFAULT_PREFACTOR = 100. # To convert from relative to % errors
 DEFAULT_wb0 = 0. # not used
 DEFAULT_wb1 = 0. # not used
+EXPECTED_SCRIPT_VERSION = ["0.0.3","0.0.4","0.0.5","0.0.6"]
 LIMITS = {"V0_rel_diff":0.3,"B0_rel_diff":2,"B1_rel_diff":10}
 
 QUANTITY_FANCY_NAMES = {
@@ -31,31 +30,24 @@ def gaussian(x, a, x0, sigma):
     return a * np.exp(-(x - x0)**2 / (2 * sigma**2))
 
 
-quantity_for_comparison_map = {
-    "delta_per_formula_unit": qc.delta,
-    "B0_rel_diff": qc.B0_rel_diff,
-    "V0_rel_diff": qc.V0_rel_diff,
-    "B1_rel_diff": qc.B1_rel_diff,
-}
-
-
-DATA_FOLDER = "../../../code-data"
-with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-    labels_data = json.load(fhandle)
+# Each results file is loaded once (only the sections needed here), and its version is checked at that point
+results_repository = ResultsRepository(
+    expected_script_version=EXPECTED_SCRIPT_VERSION, labels_key='methods-supplementary')
+# The measures are only computed if they are not in the cache yet
+measures_cache = MeasuresCache()
 
 def generate_histo(sets, name_file, code_ref, code_comp):
     """
     """
-    reference_plugin_data = []
-    compare_plugin_data = []
+    reference_paths = []
+    compare_paths = []
 
     for SET_NAME in sets:
 
-        with open(os.path.join(DATA_FOLDER, labels_data['methods-supplementary'][code_ref][SET_NAME])) as fhandle:
-            reference_plugin_data.append(json.load(fhandle))
-
-        with open(os.path.join(DATA_FOLDER, labels_data['methods-supplementary'][code_comp][SET_NAME])) as fhandle:
-            compare_plugin_data.append(json.load(fhandle))
+        results_repository.get_script_version(code_ref, SET_NAME)
+        results_repository.get_script_version(code_comp, SET_NAME)
+        reference_paths.append(results_repository.get_path(code_ref, SET_NAME))
+        compare_paths.append(results_repository.get_path(code_comp, SET_NAME))
 
     # Plotting
     #fig = pl.figure(figsize=(18,6))
@@ -78,63 +70,17 @@ def generate_histo(sets, name_file, code_ref, code_comp):
        
         collect = []
 
-        for ind in range(len(reference_plugin_data)):
-        
-            all_systems = set(reference_plugin_data[ind]['eos_data'].keys())
-            all_systems = set(reference_plugin_data[ind]['BM_fit_data'].keys())
-            #all_systems.update(compare_plugin_data['BM_fit_data'].keys())
+        for ind in range(len(reference_paths)):
 
-       
-            progress_bar = tqdm.tqdm(sorted(all_systems))
-            for element_and_configuration in progress_bar:
-                progress_bar.set_description(f"{element_and_configuration:12s}")
-                progress_bar.refresh()
-
-                element, configuration = element_and_configuration.split('-')
-                # Get the data for the reference plugin
-                ref_BM_fit_data = reference_plugin_data[ind]['BM_fit_data'][f'{element}-{configuration}']
-            
-                if ref_BM_fit_data is None:
-                    continue
-            
-                scaling_factor_ref = qc.get_volume_scaling_to_formula_unit(
-                        reference_plugin_data[ind]['num_atoms_in_sim_cell'][f'{element}-{configuration}'],
-                        element, configuration
-                    )
-
-                V0=ref_BM_fit_data['min_volume']/scaling_factor_ref
-                B0=ref_BM_fit_data['bulk_modulus_ev_ang3']
-                B01=ref_BM_fit_data['bulk_deriv']
-
-                # Get the data for the compare_with plugin, if specified (and if the EOS worked for the 
-                # reference plugin, otherwise we don't know which E0 to use)
-                try:
-                    compare_BM_fit_data = compare_plugin_data[ind]['BM_fit_data'][f'{element}-{configuration}']
-                    if compare_BM_fit_data is None:
-                        # No fitting data in the plugin to compare with.
-                        # Raise this exception that is catched one line below, so
-                        # it will set `compare_eos_fit_energy` to None.
-                        raise KeyError                    
-                except KeyError:
-                    # Set to None if fit data is missing (if we are here, the EOS points
-                    # are there, so it means that the fit failed). I will still plot the
-                    # points
-                    continue
-
-                scaling_factor_comp = qc.get_volume_scaling_to_formula_unit(
-                        compare_plugin_data[ind]['num_atoms_in_sim_cell'][f'{element}-{configuration}'],
-                        element, configuration
-                    )
-
-                CV0=compare_BM_fit_data['min_volume']/scaling_factor_comp
-                CB0=compare_BM_fit_data['bulk_modulus_ev_ang3']
-                CB01=compare_BM_fit_data['bulk_deriv']
-
-                quant = quantity_for_comparison_map[QUANTITY](V0,B0,B01,CV0,CB0,CB01,DEFAULT_PREFACTOR,DEFAULT_wb0,DEFAULT_wb1)
+            # The quantity for the systems with a fit in both codes, with V0 normalized per formula unit
+            quants = measures_cache.get_measure(
+                reference_paths[ind], compare_paths[ind], QUANTITY, DEFAULT_PREFACTOR, DEFAULT_wb0, DEFAULT_wb1)
+
+            for element_and_configuration, quant in get_system_values(quants).items():
                 if quant > LIMITS[QUANTITY]:
-                    print(f'{element}-{configuration} has {QUANTITY} > {LIMITS[QUANTITY]} = {quant}')
+                    print(f'{element_and_configuration} has {QUANTITY} > {LIMITS[QUANTITY]} = {quant}')
                 if quant < -LIMITS[QUANTITY]:
-                    print(f'{element}-{configuration} has {QUANTITY} < -{LIMITS[QUANTITY]} = {quant}')
+                    print(f'{element_and_configuration} has {QUANTITY} < -{LIMITS[QUANTITY]} = {quant}')
 
                 collect.append(quant)
 
@@ -227,3 +173,4 @@ if __name__ == "__main__":
         print("Pass as first parameter 'separate' (separate analysis for unaries and oxides) or 'all'.")
         sys.exit(1)
 
+    print(measures_cache.get_statistics_string())
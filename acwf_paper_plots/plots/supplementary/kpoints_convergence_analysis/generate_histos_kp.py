@@ -1,5 +1,4 @@
 #!/usr/bin/env python
-import json
 import os
 import sys
 
@@ -9,6 +8,7 @@ from scipy.optimize import curve_fit
 import tqdm
 
 import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.results_repository import load_results
 
 
 BINS = 100
@@ -51,14 +51,12 @@ if __name__ == "__main__":
 
         for set_name in ['unaries','oxides']:
             
-            with open(f'results-{set_name}-006.json') as fhandle:
-                reference_plugin_data = json.load(fhandle)
+            # Loaded only for the first quantity, and taken from the cache for the others
+            reference_plugin_data = load_results(f'results-{set_name}-006.json')
 
             compare_plugin_data = []
-            with open(f'results-{set_name}-0045.json') as fhandle:
-                compare_plugin_data.append(json.load(fhandle))
+            compare_plugin_data.append(load_results(f'results-{set_name}-0045.json'))
 
-            all_systems = set(reference_plugin_data['eos_data'].keys())
             all_systems = set(reference_plugin_data['BM_fit_data'].keys())
 
             print(f'{set_name} {QUANTITY}')
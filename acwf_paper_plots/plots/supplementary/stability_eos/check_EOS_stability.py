@@ -5,15 +5,15 @@ Check the effect of random noise on the relative errors of fitted parameters.
 
 Authors: wolloch, giovannipizzi
 """
-import json
 import numpy as np
-import os
 from scipy.optimize import curve_fit
 from scipy.stats import pearsonr
 import matplotlib.pyplot as plt
 import tqdm
 from acwf_paper_plots.eosfit_31_adapted import BM
-from acwf_paper_plots.quantities_for_comparison import birch_murnaghan
+from acwf_paper_plots.eos_forms import EOS_FORMS
+from acwf_paper_plots.quantities_for_comparison import birch_murnaghan, vinet
+from acwf_paper_plots.results_repository import ResultsRepository
 
 eV_over_ang3_to_GPa = 160.21766208
 
@@ -127,9 +127,9 @@ def fit_eos(EV, eos_type='BM'):
                     'equilibrium_vol_in_A3': V0}
         return out_dict
     elif eos_type == 'BM':
-        popt, pcov = curve_fit(birch_murnaghan_EOS, vol, en, p0=initial_guess)
+        popt, pcov = curve_fit(birch_murnaghan, vol, en, p0=initial_guess)
     elif eos_type == 'vignet':
-        popt, pcov = curve_fit(vignet_EOS, vol, en, p0=initial_guess)
+        popt, pcov = curve_fit(vinet, vol, en, p0=initial_guess)
     else:
         print('incorrect eos_type')
         return
@@ -150,13 +150,23 @@ def fit_eos(EV, eos_type='BM'):
                 'equilibrium_vol_in_A3': popt[1]}
     return out_dict
 
-def perturb_en(data, noise_sigma):
+def perturb_en(data, noise_sigma, nr_of_samples=None):
+    """
+    Add gaussian noise to the energies. If `nr_of_samples` is specified,
+    return an array of shape (nr_of_samples, len(data)) with independent noise on each row.
+    """
     l = len(data)
-    noise = np.random.normal(0, noise_sigma, l)
+    shape = l if nr_of_samples is None else (nr_of_samples, l)
+    noise = np.random.normal(0, noise_sigma, shape)
     noisy_data = np.array(data) + noise
     return noisy_data
 
-def get_statistics(dataset, noise_sigma, volumes_percents, nr_of_samples=10000):
+def get_statistics(dataset, noise_sigma, volumes_percents, nr_of_samples=10000, eos_form='BM'):
+    """
+    The noiseless and the noisy data are fitted with the EOS form `eos_form` (a key of
+    `acwf_paper_plots.eos_forms.EOS_FORMS`), all samples of a system in a single batched fit.
+    """
+    fit_function = EOS_FORMS[eos_form]
     deviations = {}
     stats = {}
     progress_bar = tqdm.tqdm(sorted(dataset['BM_fit_data'].items()))
@@ -168,23 +178,24 @@ def get_statistics(dataset, noise_sigma, volumes_percents, nr_of_samples=10000):
                            'failed_runs': 0}
         volumes_list = [i*val['min_volume'] for i in volumes_percents]
         en_ok_murn = birch_murnaghan(np.array(volumes_list), 0, val['min_volume'], val["bulk_modulus_ev_ang3"], val['bulk_deriv'])
-        data_diff_vols = np.array([[volumes_list[i], en_ok_murn[i]] for i in range(len(en_ok_murn))])
-        new_fit_with_different_vols = fit_eos(data_diff_vols, eos_type='AiiDA')
-        #print(val['min_volume'], new_fit_with_different_vols['fitted_parameters']['equilibrium_volume'])
-        for i in range(nr_of_samples):
-            new_en = perturb_en(en_ok_murn, noise_sigma)
-            data = np.array([[volumes_list[i], new_en[i]] for i in range(len(new_en))])
-            try:
-                eos = fit_eos(data, eos_type='AiiDA')
-                for k, v in eos['fitted_parameters'].items():
-                    # Symmetric deviation, as in the definition of epsilon and nu
-                    dev = (100*
-                        (new_fit_with_different_vols['fitted_parameters'][k]-eos['fitted_parameters'][k])/
-                        ((new_fit_with_different_vols['fitted_parameters'][k]+eos['fitted_parameters'][k])/2)
-                    )
-                    deviations[key][k].append(dev)
-            except Exception:
-                deviations[key]['failed_runs'] += 1
+        V0, E0, B0, B1, _, _ = fit_function(np.array([volumes_list]), np.array([en_ok_murn]))
+        reference_parameters = {'total_energy': E0[0],
+                                'equilibrium_volume': V0[0],
+                                'bulk_modulus': B0[0],
+                                'bulk_modulus_derivative': B1[0]}
+        # All noisy samples are fitted at once
+        new_ens = perturb_en(en_ok_murn, noise_sigma, nr_of_samples)
+        V0s, E0s, B0s, B1s, _, failed = fit_function(np.tile(volumes_list, (nr_of_samples, 1)), new_ens)
+        deviations[key]['failed_runs'] = int(failed.sum())
+        for k, v in [('total_energy', E0s), ('equilibrium_volume', V0s),
+                     ('bulk_modulus', B0s), ('bulk_modulus_derivative', B1s)]:
+            v = v[~failed]
+            # Symmetric deviation, as in the definition of epsilon and nu
+            dev = (100*
+                (reference_parameters[k]-v)/
+                ((reference_parameters[k]+v)/2)
+            )
+            deviations[key][k] = dev.tolist()
         stats[key] = {'mean_V0': np.mean(abs(np.asarray(deviations[key]['equilibrium_volume']))),
                       'mean_B0': np.mean(abs(np.asarray(deviations[key]['bulk_modulus']))),
                       'mean_B1': np.mean(abs(np.asarray(deviations[key]['bulk_modulus_derivative']))),
@@ -193,16 +204,9 @@ def get_statistics(dataset, noise_sigma, volumes_percents, nr_of_samples=10000):
 
 
 if __name__ == '__main__':
-    DATA_FOLDER = "../../../code-data"
-    with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-        labels_data = json.load(fhandle)
-    
-    reference_data_files = labels_data['references']['all-electron average']
-
-    with open(os.path.join(DATA_FOLDER, reference_data_files['oxides'])) as fhandle:
-            oxides = json.load(fhandle)
-    with open(os.path.join(DATA_FOLDER, reference_data_files['unaries'])) as fhandle:
-            unaries = json.load(fhandle)
+    results_repository = ResultsRepository()
+    oxides = results_repository.get_reference('oxides')
+    unaries = results_repository.get_reference('unaries')
             
     noise_sigma = 1E-4
     nr_of_samples = 100
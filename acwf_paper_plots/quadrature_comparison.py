@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+"""
+Comparison measures (epsilon, delta) evaluated with Gauss-Legendre quadrature.
+
+Contrary to the closed forms in `quantities_for_comparison` (that only work for two
+Birch-Murnaghan curves), the integrals here are evaluated numerically at a fixed number of
+Gauss-Legendre nodes, so any fitted EOS can be compared (Birch-Murnaghan, Vinet,
+Murnaghan, a spline, ...). All pairs of systems are treated at once: the energies are
+evaluated on a `[n_pairs, order]` grid of volumes, and each integral is then a single
+matrix-vector product with the quadrature weights.
+
+Run it as a script to check the quadrature against the analytic Birch-Murnaghan path
+for all methods against the all-electron average:
+
+    python -m acwf_paper_plots.quadrature_comparison [LABELS_KEY] [ORDER]
+"""
+import sys
+
+import numpy as np
+
+import acwf_paper_plots.quantities_for_comparison as qc
+
+# The integration window is only +-6% around the average V0, so a moderate order already
+# integrates smooth EOS forms to machine precision
+DEFAULT_ORDER = 16
+
+QUADRATURE_FIELDS = ['delta', 'epsilon']
+
+eos_function_map = {
+    'birch_murnaghan': qc.birch_murnaghan,
+    'vinet': qc.vinet,
+    'murnaghan': qc.murnaghan,
+}
+
+
+def make_eos(form, V0, B0, B01, E0=0.):
+    """
+    Return a function of the volume for the given EOS form and (arrays of) parameters.
+
+    The returned function accepts volumes of shape `[n_pairs, order]` (where the parameters
+    have shape `[n_pairs]`, or are scalars) and returns the energies on the same grid.
+    As in the analytic path, E0 is zero by default, i.e. the curves are aligned at their minimum.
+
+    :param form: a key of `eos_function_map`.
+    """
+    eos_function = eos_function_map[form]
+    params = [np.asarray(value, dtype=float)[..., None] for value in (E0, V0, B0, B01)]
+
+    def energy(V):
+        return eos_function(V, *params)
+
+    return energy
+
+
+def get_quadrature_grid(V1, V2, order=DEFAULT_ORDER):
+    """
+    Return the Gauss-Legendre nodes (shape `[..., order]`) for the integration between volumes
+    `V1` and `V2` (arrays of the same shape), the reference weights (shape `[order]`) and the
+    half-widths of the intervals, so that the integral of f is `half_width * (f(nodes) @ weights)`.
+    """
+    reference_nodes, reference_weights = np.polynomial.legendre.leggauss(order)
+    V1 = np.asarray(V1, dtype=float)
+    V2 = np.asarray(V2, dtype=float)
+    midpoint = (V1 + V2) / 2.
+    half_width = (V2 - V1) / 2.
+    nodes = midpoint[..., None] + half_width[..., None] * reference_nodes
+    return nodes, reference_weights, half_width
+
+
+def quadrature_compare(eos_w, eos_f, v0w, v0f, prefact=1., order=DEFAULT_ORDER):
+    """
+    Compute delta and epsilon between two sets of EOS curves with Gauss-Legendre quadrature.
+
+    :param eos_w: function of the volume (e.g. from `make_eos`, or a spline) returning the energies
+        of the first curves on a `[n_pairs, order]` grid of volumes.
+    :param eos_f: same as `eos_w`, for the second curves.
+    :param v0w: equilibrium volumes of the first curves (used, as in the analytic path, only
+        to define the integration window).
+    :param v0f: equilibrium volumes of the second curves.
+    :param prefact: prefactor for epsilon (as in `quantities_for_comparison.epsilon`, delta does not use it).
+    :return: a NumPy structured array with fields `QUADRATURE_FIELDS`.
+    """
+    v0w, v0f = np.broadcast_arrays(np.asarray(v0w, dtype=float), np.asarray(v0f, dtype=float))
+
+    # volume range
+    Vi = 0.94 * (v0w + v0f) / 2.
+    Vf = 1.06 * (v0w + v0f) / 2.
+    deltaV = Vf - Vi
+
+    nodes, weights, half_width = get_quadrature_grid(Vi, Vf, order)
+    energies_w = eos_w(nodes)
+    energies_f = eos_f(nodes)
+
+    intdiff2 = half_width * ((energies_w - energies_f)**2 @ weights)
+    Eavg1 = half_width * (energies_w @ weights) / deltaV
+    Eavg2 = half_width * (energies_f @ weights) / deltaV
+    # integrate (ene - mean(ene))**2; this is positive by construction
+    int3 = half_width * ((energies_w - Eavg1[..., None])**2 @ weights)
+    int4 = half_width * ((energies_f - Eavg2[..., None])**2 @ weights)
+
+    results = np.empty(v0w.shape, dtype=[(field, float) for field in QUADRATURE_FIELDS])
+    results['delta'] = 1000. * np.sqrt(intdiff2 / deltaV)
+    results['epsilon'] = np.sqrt(intdiff2 / np.sqrt(int3 * int4)) * prefact
+    return results
+
+
+def check_consistency(v0w, b0w, b1w, v0f, b0f, b1f, order=DEFAULT_ORDER):
+    """
+    Compare the quadrature engine with the analytic Birch-Murnaghan path (`qc.compare_all`).
+
+    :return: a dictionary with, for each field in `QUADRATURE_FIELDS`, the array of relative
+        differences between the two paths.
+    """
+    quadrature = quadrature_compare(
+        make_eos('birch_murnaghan', v0w, b0w, b1w),
+        make_eos('birch_murnaghan', v0f, b0f, b1f),
+        v0w, v0f, order=order
+    )
+    analytic = qc.compare_all(v0w, b0w, b1w, v0f, b0f, b1f, 1., 0., 0.)
+    return {
+        field: np.abs(quadrature[field] - analytic[field]) / np.abs(analytic[field])
+        for field in QUADRATURE_FIELDS
+    }
+
+
+if __name__ == "__main__":
+    from acwf_paper_plots.comparison_tensor import load_parameters, REFERENCE_LABEL
+
+    LABELS_KEY = sys.argv[1] if len(sys.argv) > 1 else 'methods-main'
+    ORDER = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_ORDER
+
+    code_labels, systems, params = load_parameters(LABELS_KEY)
+    reference_params = params[code_labels.index(REFERENCE_LABEL)]
+    for code_idx, code_label in enumerate(code_labels):
+        if code_label == REFERENCE_LABEL:
+            continue
+        valid = ~np.isnan(params[code_idx, :, 0]) & ~np.isnan(reference_params[:, 0])
+        rel_diffs = check_consistency(*params[code_idx, valid].T, *reference_params[valid].T, order=ORDER)
+        print(f"{code_label:45s} " + "  ".join(
+            f"{field}: median rel. diff {np.median(rel_diff):.2e}, max {np.max(rel_diff):.2e}"
+            for field, rel_diff in rel_diffs.items()
+        ))
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+Columnar binary companion format of the `results-*.json` files.
+
+Each results file is converted to an (uncompressed) `.npz` file next to it, with:
+
+- `systems`: the system keys (e.g. `Ag-X/FCC`), whose position is the integer system index of all other columns;
+- `script_version`, `set_name`: as in the JSON file;
+- for each fit section (`BM_fit_data`, `<form>_fit_data`, ...): `<section>/values`, a float64 array
+  `[n_systems, 5]` with the columns of `FIT_COLUMNS`, and `<section>/mask`, True where the fit is there;
+- `num_atoms_in_sim_cell/values` (int64) and `num_atoms_in_sim_cell/mask`;
+- `eos_data/offsets` (`[n_systems + 1]`), `eos_data/values` (`[n_points, 2]`, volumes and energies) and
+  `eos_data/mask`: the points of system `i` are `values[offsets[i]:offsets[i + 1]]`;
+- `stress_data/offsets`, `stress_data/volumes`, `stress_data/stresses` (`[n_points, 3, 3]`, NaN where the stress
+  is missing, see `stress_data/point_mask`) and `stress_data/mask`, in the same ragged layout;
+- `uuid_mapping/structure`, `uuid_mapping/eos_workflow` and `uuid_mapping/mask` (False where the mapping is None);
+- for each of the sections above, `<section>/present`, True for the systems that are keys of the section in the JSON
+  file (the other ones are not listed by `ColumnarResults.get_section`);
+- `json/<section>`: all other sections (e.g. `failed_wfs`), as a JSON string;
+- `format_version`: `FORMAT_VERSION`.
+
+Since the file is not compressed, `ColumnarResults` memory-maps each array the first time it is requested, so that
+only the requested sections are ever read from disk.
+
+Run it as a script to convert results files (by default, all those in `code-data`):
+
+    python -m acwf_paper_plots.results_columnar [JSON_FILE ...]
+"""
+import glob
+import json
+import os
+import struct
+import sys
+import zipfile
+
+import numpy as np
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'code-data')
+# Columns of the arrays of the fit sections, in this order
+FIT_COLUMNS = ['min_volume', 'E0', 'bulk_modulus_ev_ang3', 'bulk_deriv', 'residuals']
+# Increase it when the arrays change: companions with a different version are converted again
+FORMAT_VERSION = 2
+
+
+def is_fit_section(section, value):
+    """Whether a section of a results file has the format of `BM_fit_data`."""
+    return section.endswith('_fit_data') and isinstance(value, dict) and all(
+        item is None or set(item) == set(FIT_COLUMNS) for item in value.values())
+
+
+def get_companion_path(json_path):
+    """Return the path of the columnar companion of a results file (same name, with the `.npz` extension)."""
+    return f'{os.path.splitext(json_path)[0]}.npz'
+
+
+def open_companion(json_path, mmap=True):
+    """
+    Return a `ColumnarResults` for the columnar companion of a results file, or None if there is none,
+    if it is older than the results file or if it has another `FORMAT_VERSION` (i.e. it must be converted again).
+    """
+    npz_path = get_companion_path(json_path)
+    try:
+        if os.path.getmtime(npz_path) < os.path.getmtime(json_path):
+            return None
+    except OSError:
+        return None
+    columnar_results = ColumnarResults(npz_path, mmap=mmap)
+    if columnar_results.format_version != FORMAT_VERSION:
+        return None
+    return columnar_results
+
+
+def _ragged(systems, section_data, point_shape, get_points):
+    """Return `(offsets, points, mask)` of a section with a list of points per system (see `convert_results`)."""
+    offsets = np.zeros(len(systems) + 1, dtype=np.int64)
+    mask = np.zeros(len(systems), dtype=bool)
+    points = []
+    for idx, system in enumerate(systems):
+        system_points = section_data.get(system)
+        if system_points is not None:
+            mask[idx] = True
+            points.extend(get_points(system_points))
+        offsets[idx + 1] = len(points)
+    return offsets, np.array(points, dtype=float).reshape((len(points),) + point_shape), mask
+
+
+def convert_results(results):
+    """
+    Convert the content of a results file (as a dictionary) into the arrays of the columnar format.
+
+    :return: a dictionary array name -> array, see the module docstring.
+    """
+    systems = sorted(set().union(*(
+        value for section, value in results.items()
+        if isinstance(value, dict) and section != 'missing_outputs'
+    )))
+    system_index = {system: idx for idx, system in enumerate(systems)}
+    arrays = {'systems': np.array(systems, dtype=str), 'format_version': np.array(FORMAT_VERSION)}
+
+    for section, value in results.items():
+        if section in ('script_version', 'set_name'):
+            arrays[section] = np.array(value)
+            continue
+        if is_fit_section(section, value) or section in (
+                'num_atoms_in_sim_cell', 'eos_data', 'stress_data', 'uuid_mapping'):
+            arrays[f'{section}/present'] = np.array([system in value for system in systems], dtype=bool)
+        if is_fit_section(section, value):
+            values = np.full((len(systems), len(FIT_COLUMNS)), np.nan)
+            mask = np.zeros(len(systems), dtype=bool)
+            for system, fit_data in value.items():
+                if fit_data is not None:
+                    values[system_index[system]] = [fit_data[column] for column in FIT_COLUMNS]
+                    mask[system_index[system]] = True
+            arrays[f'{section}/values'] = values
+            arrays[f'{section}/mask'] = mask
+        elif section == 'num_atoms_in_sim_cell':
+            values = np.zeros(len(systems), dtype=np.int64)
+            mask = np.zeros(len(systems), dtype=bool)
+            for system, num_atoms in value.items():
+                if num_atoms is not None:
+                    values[system_index[system]] = num_atoms
+                    mask[system_index[system]] = True
+            arrays[f'{section}/values'] = values
+            arrays[f'{section}/mask'] = mask
+        elif section == 'eos_data':
+            arrays['eos_data/offsets'], arrays['eos_data/values'], arrays['eos_data/mask'] = _ragged(
+                systems, value, (2,), lambda points: points)
+        elif section == 'stress_data':
+            offsets, points, mask = _ragged(
+                systems, value, (10,),
+                lambda points: [
+                    [volume] + (np.full(9, np.nan) if stress is None else np.ravel(stress)).tolist()
+                    for volume, stress in points
+                ])
+            arrays['stress_data/offsets'] = offsets
+            arrays['stress_data/volumes'] = points[:, 0]
+            arrays['stress_data/stresses'] = points[:, 1:].reshape(-1, 3, 3)
+            arrays['stress_data/point_mask'] = np.array(
+                [stress is not None for system in systems for _, stress in (value.get(system) or [])], dtype=bool)
+            arrays['stress_data/mask'] = mask
+        elif section == 'uuid_mapping':
+            for key in ('structure', 'eos_workflow'):
+                arrays[f'uuid_mapping/{key}'] = np.array(
+                    [value[system][key] if value.get(system) else '' for system in systems], dtype=str)
+            arrays['uuid_mapping/mask'] = np.array([value.get(system) is not None for system in systems], dtype=bool)
+        else:
+            arrays[f'json/{section}'] = np.array(json.dumps(value))
+    return arrays
+
+
+def convert_results_file(json_path, npz_path=None):
+    """
+    Write the columnar companion of a results file.
+
+    :param npz_path: the output file (default: see `get_companion_path`).
+    :return: the path of the file written.
+    """
+    if npz_path is None:
+        npz_path = get_companion_path(json_path)
+    with open(json_path) as fhandle:
+        results = json.load(fhandle)
+    # Not compressed, so that the arrays can be memory-mapped
+    np.savez(npz_path, **convert_results(results))
+    return npz_path
+
+
+def _memmap_member(path, info):
+    """Memory-map an array stored (not compressed) in a `.npz` file; return None if it cannot be memory-mapped."""
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+    with open(path, 'rb') as fhandle:
+        fhandle.seek(info.header_offset)
+        local_header = fhandle.read(30)
+        name_length, extra_length = struct.unpack('<HH', local_header[26:30])
+        fhandle.seek(info.header_offset + 30 + name_length + extra_length)
+        version = np.lib.format.read_magic(fhandle)
+        if version == (1, 0):
+            shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fhandle)
+        else:
+            shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fhandle)
+        offset = fhandle.tell()
+    if dtype.hasobject:
+        return None
+    if not shape or 0 in shape:
+        # `np.memmap` does not support empty (nor 0-d) arrays, these are small anyway
+        return None
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape, order='F' if fortran_order else 'C', offset=offset)
+
+
+class ColumnarResults:
+    """
+    Lazy reader of the columnar companion of a results file (see `convert_results_file`).
+
+    Arrays are only read (memory-mapped, if `mmap` is True) the first time they are requested.
+
+    :param path: path of the `.npz` file.
+    :param mmap: memory-map the arrays instead of reading them in memory.
+    """
+
+    def __init__(self, path, mmap=True):
+        self.path = path
+        self.mmap = mmap
+        with zipfile.ZipFile(path) as archive:
+            self._members = {
+                info.filename[:-len('.npy')]: info for info in archive.infolist() if info.filename.endswith('.npy')
+            }
+        self._arrays = {}
+        self._system_index = None
+
+    def __getitem__(self, name):
+        """Return the array `name` (e.g. `BM_fit_data/values`)."""
+        if name not in self._arrays:
+            array = _memmap_member(self.path, self._members[name]) if self.mmap else None
+            if array is None:
+                with np.load(self.path) as data:
+                    array = data[name]
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    def __contains__(self, name):
+        return name in self._members
+
+    @property
+    def sections(self):
+        """List of the sections of the results file."""
+        return sorted(set(name.split('/')[-1] if name.startswith('json/') else name.split('/')[0]
+                          for name in self._members if name not in ('systems', 'format_version')))
+
+    @property
+    def script_version(self):
+        return str(self['script_version'])
+
+    @property
+    def format_version(self):
+        """The `FORMAT_VERSION` of the file (None if it was converted before it was stored)."""
+        return int(self['format_version']) if 'format_version' in self else None
+
+    @property
+    def systems(self):
+        """List of the system keys, in the order of the system index."""
+        return self['systems'].tolist()
+
+    @property
+    def system_index(self):
+        """Dictionary system key -> system index."""
+        if self._system_index is None:
+            self._system_index = {system: idx for idx, system in enumerate(self.systems)}
+        return self._system_index
+
+    def get_fit(self, section='BM_fit_data'):
+        """Return `(values, mask)` of a fit section: values is an array `[n_systems, 5]` (see `FIT_COLUMNS`)."""
+        return self[f'{section}/values'], self[f'{section}/mask']
+
+    def get_num_atoms(self):
+        """Return `(values, mask)` with the number of atoms in the simulation cell of each system."""
+        return self['num_atoms_in_sim_cell/values'], self['num_atoms_in_sim_cell/mask']
+
+    def get_eos_points(self, system):
+        """Return the array `[n_points, 2]` with the volumes and energies of a system, or None if there is no data."""
+        idx = self.system_index[system]
+        if not self['eos_data/mask'][idx]:
+            return None
+        offsets = self['eos_data/offsets']
+        return self['eos_data/values'][offsets[idx]:offsets[idx + 1]]
+
+    def get_section(self, section):
+        """Return a section in the same format as in the JSON file (e.g. to use the columnar file as a drop-in)."""
+        if f'json/{section}' in self:
+            return json.loads(str(self[f'json/{section}']))
+        if section in ('script_version', 'set_name'):
+            return str(self[section])
+        systems = self.systems
+        if section.endswith('_fit_data') and f'{section}/values' in self:
+            values, mask = self.get_fit(section)
+            items = [
+                dict(zip(FIT_COLUMNS, row)) if is_valid else None
+                for row, is_valid in zip(values.tolist(), mask.tolist())
+            ]
+        elif section == 'num_atoms_in_sim_cell':
+            values, mask = self.get_num_atoms()
+            items = [value if is_valid else None for value, is_valid in zip(values.tolist(), mask.tolist())]
+        elif section == 'eos_data':
+            items = []
+            for system in systems:
+                points = self.get_eos_points(system)
+                items.append(None if points is None else points.tolist())
+        elif section == 'stress_data':
+            offsets, mask = self['stress_data/offsets'], self['stress_data/mask']
+            volumes = self['stress_data/volumes'].tolist()
+            stresses = self['stress_data/stresses'].tolist()
+            point_mask = self['stress_data/point_mask'].tolist()
+            items = [
+                [
+                    [volumes[point], stresses[point] if point_mask[point] else None]
+                    for point in range(offsets[idx], offsets[idx + 1])
+                ] if mask[idx] else None
+                for idx in range(len(systems))
+            ]
+        elif section == 'uuid_mapping':
+            items = [
+                {'structure': structure, 'eos_workflow': eos_workflow} if is_valid else None
+                for structure, eos_workflow, is_valid in zip(
+                    self['uuid_mapping/structure'].tolist(), self['uuid_mapping/eos_workflow'].tolist(),
+                    self['uuid_mapping/mask'].tolist())
+            ]
+        else:
+            raise KeyError(section)
+        # Only the systems that are in the section of the JSON file
+        return {
+            system: item for system, item, is_present in zip(systems, items, self[f'{section}/present'].tolist())
+            if is_present
+        }
+
+if __name__ == "__main__":
+    JSON_FILES = sys.argv[1:] or sorted(glob.glob(os.path.join(DATA_FOLDER, 'results-*.json')))
+    for json_file in JSON_FILES:
+        npz_file = convert_results_file(json_file)
+        print(f"{os.path.basename(json_file)} ({os.path.getsize(json_file) / 1e6:.2f} MB) -> "
+              f"{os.path.basename(npz_file)} ({os.path.getsize(npz_file) / 1e6:.2f} MB)")
@@ -0,0 +1,285 @@
+#!/usr/bin/env python
+"""
+Dense in-memory cube of the Birch-Murnaghan parameters of several codes, for all systems.
+
+Every system (e.g. `Ag-X/FCC`) has a canonical integer index, that is the same for all codes and files:
+`(Z - 1) * len(CONFIGURATIONS) + configuration_index`, for Z = 1 to `MAX_Z` and the 4 unaries and 6 oxides
+configurations of `CONFIGURATIONS`. A `ResultsCube` has a float array `values` of shape `[n_codes, n_systems, 4]`
+with the parameters of `PARAMETERS` (V0 and E0 per formula unit, B0 in eV/ang^3, B1), NaN where the fit is missing,
+and a boolean array `mask` of shape `[n_codes, n_systems]`, True where the fit is there.
+
+The cube is built from the results files (`build_results_cube`), with all the scalings to the formula unit
+applied at once to the arrays of each file; figures can then be obtained with slices and reductions over it,
+e.g. for the relative difference in V0 of a code w.r.t. the all-electron average, for the oxides only:
+
+    cube = build_results_cube()
+    systems = cube.get_system_mask(set_name='oxides') & cube.get_common_mask([code_label, REFERENCE_LABEL])
+    values = cube.compare(qc.V0_rel_diff, code_label, REFERENCE_LABEL, systems=systems)
+
+Run it as a script to print the number of systems with a fit, per code and per set:
+
+    python -m acwf_paper_plots.results_cube [LABELS_KEY]
+"""
+import sys
+
+import ase.data
+import numpy as np
+
+import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.results_columnar import FIT_COLUMNS, open_companion
+from acwf_paper_plots.results_repository import REFERENCE_LABEL, EOSParameters, ResultsRepository, load_results
+
+UNARIES_CONFIGURATIONS = ['X/SC', 'X/FCC', 'X/BCC', 'X/Diamond']
+OXIDES_CONFIGURATIONS = ['XO', 'XO2', 'X2O', 'X2O3', 'X2O5', 'XO3']
+CONFIGURATIONS = UNARIES_CONFIGURATIONS + OXIDES_CONFIGURATIONS
+SET_CONFIGURATIONS = {'unaries': UNARIES_CONFIGURATIONS, 'oxides': OXIDES_CONFIGURATIONS}
+SET_NAMES = list(SET_CONFIGURATIONS)
+MAX_Z = 96
+NUM_SYSTEMS = MAX_Z * len(CONFIGURATIONS)
+# The last axis of the cube, in the same order as the fields of `EOSParameters`
+PARAMETERS = list(EOSParameters._fields)
+
+CONFIGURATION_INDEX = {configuration: idx for idx, configuration in enumerate(CONFIGURATIONS)}
+# Number of atoms in the formula unit of each configuration, in the order of `CONFIGURATIONS`
+NUM_ATOMS_IN_FORMULA_UNIT = np.array([qc.get_num_atoms_in_formula_unit(conf) for conf in CONFIGURATIONS])
+OXYGEN_Z = ase.data.atomic_numbers['O']
+
+
+def get_system_index(element, configuration):
+    """Return the canonical index of a system, e.g. of (`Ag`, `X/FCC`)."""
+    return (ase.data.atomic_numbers[element] - 1) * len(CONFIGURATIONS) + CONFIGURATION_INDEX[configuration]
+
+
+def get_system_indices(systems):
+    """
+    Return an integer array with the canonical index of each system key (e.g. `Ag-X/FCC`) of a list.
+
+    :raise ValueError: if a system is not among the canonical ones (unknown element or configuration, or Z > `MAX_Z`).
+    """
+    indices = np.empty(len(systems), dtype=np.int64)
+    for idx, system in enumerate(systems):
+        element, _, configuration = system.partition('-')
+        try:
+            indices[idx] = get_system_index(element, configuration)
+        except KeyError:
+            raise ValueError(f"Unknown system '{system}'")
+    if len(indices) and indices.max() >= NUM_SYSTEMS:
+        raise ValueError(f"Only elements up to Z={MAX_Z} are supported")
+    return indices
+
+
+def get_system_key(system_index):
+    """Return the key (e.g. `Ag-X/FCC`) of a system from its canonical index."""
+    Z, configuration_index = divmod(int(system_index), len(CONFIGURATIONS))
+    return f'{ase.data.chemical_symbols[Z + 1]}-{CONFIGURATIONS[configuration_index]}'
+
+
+# Atomic number and configuration index of each system, in the order of the canonical index
+SYSTEM_Z = np.repeat(np.arange(1, MAX_Z + 1), len(CONFIGURATIONS))
+SYSTEM_CONFIGURATION = np.tile(np.arange(len(CONFIGURATIONS)), MAX_Z)
+SYSTEMS = [get_system_key(idx) for idx in range(NUM_SYSTEMS)]
+
+
+def get_parameters_per_formula_unit(systems, fit_values, fit_mask, num_atoms):
+    """
+    Scale the fit parameters of a results file to the formula unit, for all its systems at once.
+
+    :param systems: the list of system keys of the file.
+    :param fit_values: float array `[n, 5]` with the columns of `FIT_COLUMNS`, one row per system.
+    :param fit_mask: boolean array `[n]`, True where the fit is there.
+    :param num_atoms: array `[n]` with the number of atoms in the simulation cell.
+    :return: a tuple `(indices, values)` with the canonical indices of the systems with a fit, and the
+        float array `[n_valid, 4]` of their `PARAMETERS`.
+    """
+    fit_mask = np.asarray(fit_mask, dtype=bool)
+    indices = get_system_indices(systems)[fit_mask]
+    fit_values = np.asarray(fit_values, dtype=float)[fit_mask]
+    num_atoms = np.asarray(num_atoms)[fit_mask]
+
+    num_atoms_in_formula_unit = NUM_ATOMS_IN_FORMULA_UNIT[SYSTEM_CONFIGURATION[indices]]
+    # As in `qc.get_volume_scaling_to_formula_unit`: only for oxygen the cell can be smaller than the formula unit
+    wrong = (num_atoms % num_atoms_in_formula_unit != 0) & (SYSTEM_Z[indices] != OXYGEN_Z)
+    assert not wrong.any(), (
+        f"Weird! number of atoms in cell not a multiple of the number of atoms in the formula unit for "
+        f"{[SYSTEMS[idx] for idx in indices[wrong]]}!")
+    scaling = num_atoms / num_atoms_in_formula_unit
+
+    columns = {column: fit_values[:, idx] for idx, column in enumerate(FIT_COLUMNS)}
+    values = np.stack([
+        columns['min_volume'] / scaling,
+        columns['E0'] / scaling,
+        columns['bulk_modulus_ev_ang3'],
+        columns['bulk_deriv'],
+    ], axis=-1)
+    return indices, values
+
+
+def _load_fit_arrays(path, expected_script_version=None):
+    """Return `(systems, fit_values, fit_mask, num_atoms)` of a results file, from its columnar companion if possible."""
+    # Also checks the script version, if given
+    load_results(path, ['script_version'], expected_script_version)
+    companion = open_companion(path)
+    if companion is not None:
+        fit_values, fit_mask = companion.get_fit()
+        num_atoms, _ = companion.get_num_atoms()
+        return companion.systems, fit_values, fit_mask, num_atoms
+
+    results = load_results(path, ['BM_fit_data', 'num_atoms_in_sim_cell'])
+    systems = list(results['BM_fit_data'])
+    fit_data = [results['BM_fit_data'][system] for system in systems]
+    fit_mask = np.array([item is not None for item in fit_data], dtype=bool)
+    fit_values = np.array([
+        [item[column] for column in FIT_COLUMNS] if item is not None else [np.nan] * len(FIT_COLUMNS)
+        for item in fit_data
+    ], dtype=float).reshape(len(systems), len(FIT_COLUMNS))
+    num_atoms = np.array([
+        results['num_atoms_in_sim_cell'].get(system) or 0 for system in systems], dtype=np.int64)
+    return systems, fit_values, fit_mask, num_atoms
+
+
+def get_file_parameters(path, expected_script_version=None):
+    """
+    Return the `PARAMETERS` of all the canonical systems for a results file: a float array `[NUM_SYSTEMS, 4]`,
+    NaN where the fit is missing.
+    """
+    indices, file_values = get_parameters_per_formula_unit(*_load_fit_arrays(path, expected_script_version))
+    values = np.full((NUM_SYSTEMS, len(PARAMETERS)), np.nan)
+    values[indices] = file_values
+    return values
+
+
+class ResultsCube:
+    """
+    Birch-Murnaghan parameters of several codes for all the canonical systems (see the module docstring).
+
+    :param code_labels: the labels of the codes, in the order of the first axis.
+    :param values: float array `[n_codes, NUM_SYSTEMS, 4]` with the `PARAMETERS`, NaN where the fit is missing.
+    :param mask: boolean array `[n_codes, NUM_SYSTEMS]` (default: where `values` are not NaN).
+    """
+
+    def __init__(self, code_labels, values, mask=None):
+        self.code_labels = list(code_labels)
+        self.values = np.asarray(values, dtype=float)
+        if self.values.shape != (len(self.code_labels), NUM_SYSTEMS, len(PARAMETERS)):
+            raise ValueError(f"Wrong shape {self.values.shape} of the values for {len(self.code_labels)} codes")
+        self.mask = ~np.isnan(self.values).any(axis=-1) if mask is None else np.asarray(mask, dtype=bool)
+        self._code_index = {code_label: idx for idx, code_label in enumerate(self.code_labels)}
+
+    @property
+    def systems(self):
+        """List of the system keys, in the order of the canonical index."""
+        return SYSTEMS
+
+    def get_code_index(self, code_label):
+        return self._code_index[code_label]
+
+    def get_parameter(self, parameter, code_label=None):
+        """
+        Return the values of a parameter (`V0`, `E0`, `B0` or `B1`) for all systems:
+        an array `[n_codes, NUM_SYSTEMS]`, or `[NUM_SYSTEMS]` for a single code.
+        """
+        values = self.values[..., PARAMETERS.index(parameter)]
+        return values if code_label is None else values[self.get_code_index(code_label)]
+
+    def get_code_mask(self, code_label):
+        """Return the boolean array `[NUM_SYSTEMS]`, True where the code has a fit."""
+        return self.mask[self.get_code_index(code_label)]
+
+    def get_common_mask(self, code_labels=None):
+        """Return the boolean array `[NUM_SYSTEMS]`, True where all the codes (default: all codes of the cube) have a fit."""
+        if code_labels is None:
+            return self.mask.all(axis=0)
+        return self.mask[[self.get_code_index(code_label) for code_label in code_labels]].all(axis=0)
+
+    @staticmethod
+    def get_system_mask(set_name=None, elements=None, configurations=None):
+        """
+        Return the boolean array `[NUM_SYSTEMS]` selecting the systems of a set (`unaries` or `oxides`),
+        of a list of elements (symbols) and of a list of configurations; None means no selection.
+        """
+        selected = np.ones(NUM_SYSTEMS, dtype=bool)
+        if set_name is not None:
+            selected &= np.isin(
+                SYSTEM_CONFIGURATION, [CONFIGURATION_INDEX[conf] for conf in SET_CONFIGURATIONS[set_name]])
+        if configurations is not None:
+            selected &= np.isin(SYSTEM_CONFIGURATION, [CONFIGURATION_INDEX[conf] for conf in configurations])
+        if elements is not None:
+            selected &= np.isin(SYSTEM_Z, [ase.data.atomic_numbers[element] for element in elements])
+        return selected
+
+    def get_parameters(self, code_label, system):
+        """Return the `EOSParameters` of a code for a system (e.g. `Ag-X/FCC`), or None if there is no fit."""
+        code_index = self.get_code_index(code_label)
+        element, _, configuration = system.partition('-')
+        system_index = get_system_index(element, configuration)
+        if not self.mask[code_index, system_index]:
+            return None
+        return EOSParameters(*self.values[code_index, system_index].tolist())
+
+    def compare(self, quantity_function, code_label, reference_label, prefactor=1., weight_b0=0., weight_b1=0.,
+                systems=None):
+        """
+        Compute a comparison quantity (one of the functions of `quantities_for_comparison`, e.g. `qc.epsilon`)
+        between the reference (passed as first set of parameters) and a code, for many systems at once.
+
+        :param systems: the systems to compare, as a boolean array `[NUM_SYSTEMS]` or an array of indices
+            (default: all those where both codes have a fit).
+        :return: a float array with one value per selected system (NaN where either fit is missing).
+        """
+        if systems is None:
+            systems = self.get_common_mask([code_label, reference_label])
+        ref_V0, _, ref_B0, ref_B1 = self.values[self.get_code_index(reference_label)][systems].T
+        V0, _, B0, B1 = self.values[self.get_code_index(code_label)][systems].T
+        return quantity_function(ref_V0, ref_B0, ref_B1, V0, B0, B1, prefactor, weight_b0, weight_b1)
+
+    def save(self, fname):
+        """Dump the cube to a (compressed) `.npz` file."""
+        np.savez_compressed(fname, values=self.values, mask=self.mask, code_labels=np.array(self.code_labels))
+
+    @classmethod
+    def load(cls, fname):
+        """Load a cube written by `save`."""
+        with np.load(fname) as data:
+            return cls(data['code_labels'].tolist(), data['values'], data['mask'])
+
+
+def build_results_cube(code_labels=None, set_names=SET_NAMES, labels_key='methods-main', include_reference=True,
+                       results_repository=None):
+    """
+    Build a `ResultsCube` from the results files.
+
+    :param code_labels: the codes to include (default: all those listed under `labels_key` in `labels.json`).
+    :param include_reference: add the all-electron average (with label `REFERENCE_LABEL`) as first code.
+    :param results_repository: the `ResultsRepository` to load the files from (default: one for `labels_key`).
+    """
+    if results_repository is None:
+        results_repository = ResultsRepository(labels_key=labels_key)
+    if code_labels is None:
+        code_labels = results_repository.get_method_labels(labels_key)
+    code_labels = list(code_labels)
+    if include_reference and REFERENCE_LABEL not in code_labels:
+        code_labels.insert(0, REFERENCE_LABEL)
+
+    values = np.full((len(code_labels), NUM_SYSTEMS, len(PARAMETERS)), np.nan)
+    mask = np.zeros((len(code_labels), NUM_SYSTEMS), dtype=bool)
+    for code_index, code_label in enumerate(code_labels):
+        for set_name in set_names:
+            if not results_repository.has_results(code_label, set_name, labels_key):
+                # Some methods only computed one of the sets
+                continue
+            indices, code_values = get_parameters_per_formula_unit(*_load_fit_arrays(
+                results_repository.get_path(code_label, set_name, labels_key),
+                results_repository.expected_script_version))
+            values[code_index, indices] = code_values
+            mask[code_index, indices] = True
+    return ResultsCube(code_labels, values, mask)
+
+
+if __name__ == "__main__":
+    LABELS_KEY = sys.argv[1] if len(sys.argv) > 1 else 'methods-main'
+    cube = build_results_cube(labels_key=LABELS_KEY)
+    for code_label in cube.code_labels:
+        counts = ', '.join(
+            f"{set_name}: {int((cube.get_code_mask(code_label) & cube.get_system_mask(set_name)).sum())}"
+            for set_name in SET_NAMES)
+        print(f"{code_label:50s} {counts}")
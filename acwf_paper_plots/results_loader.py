@@ -0,0 +1,94 @@
+"""
+Section-selective loader of the `results-*.json` files written by `get_results.py`.
+
+Most scripts only need a few small top-level sections of a results file (e.g. `BM_fit_data` and
+`num_atoms_in_sim_cell`), while most of the file is taken by `eos_data` and `stress_data`.
+`load_results_sections` only parses the requested sections: the top-level keys are located without
+parsing the values, and the other values are skipped without building any Python object for them.
+
+The files written by `get_results.py` (i.e. by `json.dump(..., indent=2)`) have each top-level key at the
+beginning of a line, indented by two spaces, so the keys are found with a single regular expression.
+Files with a different formatting are parsed in full (and the requested sections are then selected).
+The sections are parsed with `orjson`, if installed, and with `json` otherwise.
+"""
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Top-level key of a file written with `json.dump(..., indent=2)`: nested keys are indented by
+# at least 4 spaces, and strings cannot contain newlines
+_INDENTED_TOP_LEVEL_KEY = re.compile(rb'\n  "((?:[^"\\]|\\.)*)": ')
+
+DEFAULT_SECTIONS = ('script_version', 'BM_fit_data', 'num_atoms_in_sim_cell')
+
+
+def _loads(content):
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def find_top_level_values(content):
+    """
+    Return a dictionary top-level key -> (start, end) position of its value in `content` (the bytes of
+    a JSON object written with `indent=2`), without parsing the values; None if it has a different formatting.
+    """
+    if not content.startswith(b'{\n  "'):
+        return None
+    matches = list(_INDENTED_TOP_LEVEL_KEY.finditer(content))
+    end_of_object = content.rstrip().rfind(b'}')
+    spans = {}
+    for match, next_match in zip(matches, matches[1:] + [None]):
+        end = next_match.start() if next_match is not None else end_of_object
+        # Drop the comma separating the value from the next key
+        value_end = content.rfind(b',', match.end(), end) if next_match is not None else end
+        spans[json.loads(b'"' + match.group(1) + b'"')] = (match.end(), value_end)
+    return spans
+
+
+def check_script_version(script_version, expected_script_version, path):
+    """Raise a `ValueError` if `script_version` is not among the `expected_script_version` (a string or a list)."""
+    if isinstance(expected_script_version, str):
+        expected_script_version = [expected_script_version]
+    if script_version not in expected_script_version:
+        raise ValueError(
+            f"This script only works with data generated at version {expected_script_version} "
+            f"(found {script_version} in '{path}'). Please re-run ./get_results.py to update the data format!")
+
+
+def load_results_sections(path, sections=DEFAULT_SECTIONS, expected_script_version=None):
+    """
+    Load only some top-level sections of a results file.
+
+    :param sections: the top-level keys to load; sections that are not in the file are not returned
+        (e.g. the all-electron averages only have `script_version`, `BM_fit_data` and `num_atoms_in_sim_cell`).
+    :param expected_script_version: if given (a version string or a list of them), check in the same pass
+        that the `script_version` of the file is among them, and raise a `ValueError` otherwise.
+    :return: a dictionary section -> parsed value.
+    """
+    with open(path, 'rb') as fhandle:
+        content = fhandle.read()
+
+    sections = list(sections)
+    if expected_script_version is not None and 'script_version' not in sections:
+        sections.append('script_version')
+
+    spans = find_top_level_values(content)
+    if spans is None:
+        # Not written with `indent=2`: parse it in full
+        results = _loads(content)
+        data = {section: results[section] for section in sections if section in results}
+    else:
+        data = {}
+        for section in sections:
+            if section in spans:
+                start, end = spans[section]
+                data[section] = _loads(content[start:end])
+
+    if expected_script_version is not None:
+        check_script_version(data.get('script_version'), expected_script_version, path)
+    return data
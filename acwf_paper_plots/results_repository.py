@@ -0,0 +1,225 @@
+"""
+Shared access to the results files in `code-data`, for all figure scripts.
+
+`ResultsRepository` resolves the labels of `labels.json` (method labels, the all-electron average reference,
+the short labels of the all-electron codes) to results files, and returns their sections through typed accessors.
+
+Each file is loaded at most once per process: the sections that were parsed are kept in a process-wide cache,
+keyed by the real path of the file and invalidated when its modification time or size change. Only the requested
+sections are parsed (from the columnar companion of the file if there is an up-to-date one, see `results_columnar`,
+and otherwise with `results_loader.load_results_sections`), and the script version of a file is only checked once.
+
+The returned sections are shared by all callers, and must not be modified.
+"""
+import collections
+import hashlib
+import json
+import os
+
+import acwf_paper_plots.quantities_for_comparison as qc
+from acwf_paper_plots.results_columnar import open_companion
+from acwf_paper_plots.results_loader import DEFAULT_SECTIONS, check_script_version, load_results_sections
+
+DATA_FOLDER = os.path.join(os.path.dirname(os.path.realpath(__file__)), 'code-data')
+# Label of the all-electron average reference, that can be used as any other method label
+REFERENCE_LABEL = 'all-electron average'
+DEFAULT_LABELS_KEY = 'methods-main'
+
+# Birch-Murnaghan parameters of a system, with the extensive quantities (V0 and E0) per formula unit
+EOSParameters = collections.namedtuple('EOSParameters', ['V0', 'E0', 'B0', 'B1'])
+
+
+class _CachedFile:
+    """The content of a file loaded so far, valid as long as the file has the same `stat_key`."""
+
+    def __init__(self, stat_key):
+        self.stat_key = stat_key
+        self.sections = {}
+        # Sections that were requested but are not in the file
+        self.absent = set()
+        self.checked_versions = set()
+        self.content = None
+        self.content_hash = None
+
+
+# Real path -> `_CachedFile`
+_FILE_CACHE = {}
+
+
+def _get_cached_file(path):
+    """Return the cache entry of a file, replacing it if the file changed since it was cached."""
+    realpath = os.path.realpath(path)
+    stat = os.stat(realpath)
+    stat_key = (stat.st_mtime_ns, stat.st_size)
+    cached_file = _FILE_CACHE.get(realpath)
+    if cached_file is None or cached_file.stat_key != stat_key:
+        cached_file = _CachedFile(stat_key)
+        _FILE_CACHE[realpath] = cached_file
+    return cached_file
+
+
+def clear_cache():
+    """Forget all the files loaded so far."""
+    _FILE_CACHE.clear()
+
+
+def get_content_hash(path):
+    """Return the SHA-256 hash of the content of a file, computed at most once as long as the file does not change."""
+    cached_file = _get_cached_file(path)
+    if cached_file.content_hash is None:
+        digest = hashlib.sha256()
+        with open(path, 'rb') as fhandle:
+            for block in iter(lambda: fhandle.read(1 << 20), b''):
+                digest.update(block)
+        cached_file.content_hash = digest.hexdigest()
+    return cached_file.content_hash
+
+
+def load_json(path):
+    """Load a (generic) JSON file, e.g. `labels.json`, at most once as long as it does not change."""
+    cached_file = _get_cached_file(path)
+    if cached_file.content is None:
+        with open(path) as fhandle:
+            cached_file.content = json.load(fhandle)
+    return cached_file.content
+
+
+def load_results(path, sections=DEFAULT_SECTIONS, expected_script_version=None, use_columnar=True):
+    """
+    Load some sections of a results file, parsing only those that were not loaded yet by this process.
+
+    :param sections: the top-level keys to return; sections that are not in the file are not returned.
+    :param expected_script_version: if given (a version string or a list of them), raise a `ValueError` if the
+        `script_version` of the file is not among them (checked only once per file and expected versions).
+    :param use_columnar: load the sections from the columnar companion of the file, if it is up to date.
+    :return: a dictionary section -> value.
+    """
+    cached_file = _get_cached_file(path)
+    sections = list(sections)
+    if expected_script_version is not None and 'script_version' not in sections:
+        sections.append('script_version')
+
+    missing = [
+        section for section in sections
+        if section not in cached_file.sections and section not in cached_file.absent
+    ]
+    if missing:
+        companion = open_companion(path) if use_columnar else None
+        if companion is not None:
+            available = companion.sections
+            loaded = {section: companion.get_section(section) for section in missing if section in available}
+        else:
+            loaded = load_results_sections(path, missing)
+        cached_file.sections.update(loaded)
+        cached_file.absent.update(section for section in missing if section not in loaded)
+
+    if expected_script_version is not None:
+        versions_key = (expected_script_version,) if isinstance(expected_script_version, str) else tuple(
+            expected_script_version)
+        if versions_key not in cached_file.checked_versions:
+            check_script_version(cached_file.sections.get('script_version'), expected_script_version, path)
+            cached_file.checked_versions.add(versions_key)
+
+    return {section: cached_file.sections[section] for section in sections if section in cached_file.sections}
+
+
+class ResultsRepository:
+    """
+    Resolve the labels of `labels.json` to results files, and load them through the process-wide cache.
+
+    :param data_folder: the folder with `labels.json` and the results files.
+    :param expected_script_version: if given, the script version of each file is checked the first time it is loaded.
+    :param labels_key: the key of `labels.json` with the methods (e.g. `methods-main` or `methods-supplementary`),
+        used when no `labels_key` is passed to the methods below.
+    """
+
+    def __init__(self, data_folder=DATA_FOLDER, expected_script_version=None, labels_key=DEFAULT_LABELS_KEY):
+        self.data_folder = data_folder
+        self.expected_script_version = expected_script_version
+        self.labels_key = labels_key
+
+    @property
+    def labels(self):
+        """The content of `labels.json`."""
+        return load_json(os.path.join(self.data_folder, 'labels.json'))
+
+    def get_method_labels(self, labels_key=None):
+        """Return the list of method labels (e.g. `FLEUR@LAPW+LO`), in the order of `labels.json`."""
+        return list(self.labels[labels_key or self.labels_key])
+
+    def get_short_label(self, code_label, labels_key=None):
+        """Return the short label of a method (e.g. `FLEUR`); `ae` for the all-electron average reference."""
+        if code_label == REFERENCE_LABEL:
+            return 'ae'
+        return self.labels[labels_key or self.labels_key][code_label]['short_label']
+
+    def get_all_electron_label(self, short_label):
+        """Return the method label of an all-electron code from its short label (`FLEUR` or `WIEN2k`)."""
+        return self.labels['all-electron-keys'][short_label]
+
+    def get_path(self, code_label, set_name, labels_key=None):
+        """
+        Return the path of the results file of a method for a set (`unaries` or `oxides`).
+
+        :param code_label: a method label, or `REFERENCE_LABEL` for the all-electron average reference.
+        :raise KeyError: if there are no results of the method for the set.
+        """
+        if code_label == REFERENCE_LABEL:
+            files = self.labels['references'][REFERENCE_LABEL]
+        else:
+            files = self.labels[labels_key or self.labels_key][code_label]
+        return os.path.join(self.data_folder, files[set_name])
+
+    def has_results(self, code_label, set_name, labels_key=None):
+        """Whether there is a results file of a method for a set."""
+        try:
+            return os.path.exists(self.get_path(code_label, set_name, labels_key))
+        except KeyError:
+            return False
+
+    def get_results(self, code_label, set_name, sections=DEFAULT_SECTIONS, labels_key=None):
+        """Return a dictionary with the requested sections of the results of a method for a set."""
+        return load_results(
+            self.get_path(code_label, set_name, labels_key), sections,
+            expected_script_version=self.expected_script_version)
+
+    def get_reference(self, set_name, sections=DEFAULT_SECTIONS):
+        """Return a dictionary with the requested sections of the all-electron average reference for a set."""
+        return self.get_results(REFERENCE_LABEL, set_name, sections)
+
+    def get_script_version(self, code_label, set_name, labels_key=None):
+        """Return the version of `get_results.py` that wrote the results of a method for a set."""
+        return self.get_results(code_label, set_name, ['script_version'], labels_key)['script_version']
+
+    def get_fit_data(self, code_label, set_name, labels_key=None, section='BM_fit_data'):
+        """Return the dictionary system -> fit parameters (None if the fit failed) of a method for a set."""
+        return self.get_results(code_label, set_name, [section], labels_key)[section]
+
+    def get_num_atoms(self, code_label, set_name, labels_key=None):
+        """Return the dictionary system -> number of atoms in the simulation cell of a method for a set."""
+        return self.get_results(code_label, set_name, ['num_atoms_in_sim_cell'], labels_key)['num_atoms_in_sim_cell']
+
+    def get_valid_systems(self, code_label, set_name, labels_key=None):
+        """Return the set of systems (e.g. `Ag-X/FCC`) with a Birch-Murnaghan fit, for a method and a set."""
+        return set(
+            system for system, fit_data in self.get_fit_data(code_label, set_name, labels_key).items()
+            if fit_data is not None
+        )
+
+    def get_parameters(self, code_label, set_name, system, labels_key=None):
+        """
+        Return the `EOSParameters` of a system (e.g. `Ag-X/FCC`), with V0 and E0 per formula unit,
+        or None if there is no Birch-Murnaghan fit for it.
+        """
+        fit_data = self.get_fit_data(code_label, set_name, labels_key).get(system)
+        if fit_data is None:
+            return None
+        element, configuration = system.split('-')
+        scaling_factor = qc.get_volume_scaling_to_formula_unit(
+            self.get_num_atoms(code_label, set_name, labels_key)[system], element, configuration)
+        return EOSParameters(
+            V0=fit_data['min_volume'] / scaling_factor,
+            E0=fit_data['E0'] / scaling_factor,
+            B0=fit_data['bulk_modulus_ev_ang3'],
+            B1=fit_data['bulk_deriv'],
+        )
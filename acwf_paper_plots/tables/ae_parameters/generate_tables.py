@@ -1,12 +1,11 @@
 #!/usr/bin/env python
 from pymatgen.core.periodic_table import Element
-import json
 import acwf_paper_plots.quantities_for_comparison as qc 
+from acwf_paper_plots.results_repository import ResultsRepository
 """
 This script creates a table with the V0, B0, B1 results for WIEN2K, FLEUR and their average
 for every cystal structure (the 4 unaries and the 6 oxides)
 """
-import os
 
 def beautify(set_name):
     if set_name.startswith('X/'):
@@ -21,12 +20,9 @@ def loop_over_configurations():
     Main function that reads the data and, for each set, calls the function that creates 
     the table.
     """
-    DATA_FOLDER = "../../code-data"
-    with open(os.path.join(DATA_FOLDER, "labels.json")) as fhandle:
-        labels_data = json.load(fhandle)
-    reference_data_files = labels_data['references']['all-electron average']
-    FLEUR_LABEL = labels_data['all-electron-keys']["FLEUR"]
-    WIEN2k_LABEL = labels_data['all-electron-keys']["WIEN2k"]
+    results_repository = ResultsRepository()
+    FLEUR_LABEL = results_repository.get_all_electron_label("FLEUR")
+    WIEN2k_LABEL = results_repository.get_all_electron_label("WIEN2k")
     
 
     l=[0,0,0]
@@ -35,12 +31,9 @@ def loop_over_configurations():
             ['unaries', ['X/FCC', 'X/BCC', 'X/SC', 'X/Diamond']],
             ['oxides', ["X2O", "XO", "X2O3", "XO2", "X2O5", "XO3"]],
         ]:
-            with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][FLEUR_LABEL][set_name])) as fhandle:
-                    fleur = json.load(fhandle)
-            with open(os.path.join(DATA_FOLDER, labels_data['methods-main'][WIEN2k_LABEL][set_name])) as fhandle:
-                    wien2k = json.load(fhandle)
-            with open(os.path.join(DATA_FOLDER, reference_data_files[set_name])) as fhandle:
-                av = json.load(fhandle)
+            fleur = results_repository.get_results(FLEUR_LABEL, set_name)
+            wien2k = results_repository.get_results(WIEN2k_LABEL, set_name)
+            av = results_repository.get_reference(set_name)
             for configuration in configurations:
                 sett = beautify(configuration)
                 create_table(w, sett, configuration, fleur, wien2k, av, l)